@@ -0,0 +1,256 @@
+"""
+插件热点路径基准测试
+不需要AstrBot运行时，使用替身Context生成合成数据，结果以JSON输出，便于跨版本比较
+
+用法：
+    python benchmarks/run_benchmarks.py --output bench.json
+    python benchmarks/run_benchmarks.py --users 1000 10000 --images 50 200 --repeat 3
+"""
+import os
+import io
+import sys
+import json
+import time
+import random
+import asyncio
+import argparse
+import platform
+import tempfile
+import statistics
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stubs  # noqa: E402
+
+WEEKDAYS = ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]
+PERIODS = ["1-2", "3-4", "5-6", "7-8", "9-10"]
+CLOCK_TIMES = ["08:00-09:40", "10:00-11:40", "14:00-15:40", "16:00-17:40", "19:00-20:40"]
+COURSE_NAMES = ["高等数学", "大学英语", "线性代数", "大学物理", "程序设计", "数据结构", "思想政治", "体育"]
+TEACHERS = ["张老师", "李老师", "王老师", "赵老师", "刘老师"]
+
+
+def default_config() -> Dict:
+    """从配置文件结构中读取默认配置"""
+    with open(os.path.join(stubs.PLUGIN_DIR, "_conf_schema.json"), "r", encoding="utf-8") as f:
+        schema = json.load(f)
+    config = {}
+    for key, item in schema.items():
+        if item.get("type") == "object" and "items" in item:
+            config[key] = {k: v.get("default") for k, v in item["items"].items()}
+        else:
+            config[key] = item.get("default")
+    # 基准测试不需要后台收集
+    config["auto_collect_config"]["enable_collect"] = False
+    return config
+
+
+def plugin_version() -> str:
+    with open(os.path.join(stubs.PLUGIN_DIR, "metadata.yaml"), "r", encoding="utf-8") as f:
+        for line in f:
+            if line.startswith("version:"):
+                return line.split(":", 1)[1].strip()
+    return "unknown"
+
+
+def make_course(rng: random.Random) -> Dict:
+    start = rng.randint(1, 8)
+    return {
+        "day": rng.choice(WEEKDAYS[:5]),
+        "time": f"第{rng.choice(PERIODS)}节",
+        "name": rng.choice(COURSE_NAMES),
+        "teacher": rng.choice(TEACHERS),
+        "location": f"{rng.choice('ABCD')}{rng.randint(100, 599)}",
+        "weeks": f"{start}-{start + rng.randint(7, 10)}周"
+    }
+
+
+def make_schedules(users: int, courses_per_user: int, class_size: int = 1, seed: int = 0) -> Dict[str, Dict]:
+    """生成合成课程表（旧存储格式），每class_size个用户属于同一班级、课程表相同"""
+    rng = random.Random(seed)
+    classes = [[make_course(rng) for _ in range(courses_per_user)]
+               for _ in range(max(1, users // max(1, class_size)))]
+    schedules = {}
+    for i in range(users):
+        schedules[str(100000 + i)] = {
+            "courses": [dict(c) for c in classes[i % len(classes)]],
+            "settings": {"enable_reminder": True, "reminder_time": 10, "enable_daily_reminder": True},
+            "basic_info": {"学校": "示例大学", "班级": f"{i % 300}班"}
+        }
+    return schedules
+
+
+def make_image(rng: random.Random, size: int = 32) -> bytes:
+    from PIL import Image
+    img = Image.frombytes("RGB", (size, size), bytes(rng.getrandbits(8) for _ in range(size * size * 3)))
+    output = io.BytesIO()
+    img.save(output, format="PNG")
+    return output.getvalue()
+
+
+def measure(func: Callable[[], object], repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+async def measure_async(func, repeat: int) -> List[float]:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        await func()
+        times.append(time.perf_counter() - start)
+    return times
+
+
+def result(name: str, params: Dict, times: List[float], ops: int = 1) -> Dict:
+    best = min(times)
+    return {
+        "name": name,
+        "params": params,
+        "repeat": len(times),
+        "min_seconds": best,
+        "median_seconds": statistics.median(times),
+        "ops": ops,
+        "ops_per_second": ops / best if best > 0 else None
+    }
+
+
+async def create_plugin(main, config: Dict):
+    """创建插件实例并取消其后台任务"""
+    existing = asyncio.all_tasks()
+    plugin = main.CourseReminderPlugin(stubs.Context(), config)
+    for task in asyncio.all_tasks() - existing:
+        task.cancel()
+    await asyncio.sleep(0)
+    return plugin
+
+
+async def bench_schedules(main, args, results: List[Dict]):
+    config = default_config()
+    # 周一07:50，第1-2节课前10分钟
+    tick_time = datetime(2025, 3, 3, 7, 50)
+    for users in args.users:
+        plugin = await create_plugin(main, config)
+        plugin._restore_schedules(make_schedules(users, args.courses_per_user, args.class_size))
+        params = {"users": users, "courses_per_user": args.courses_per_user, "class_size": args.class_size}
+        results.append(result("scheduler_load", params,
+                              measure(lambda: plugin.scheduler.load(plugin.schedules), args.repeat), users))
+
+        async def tick():
+            await plugin.reminder_tick(tick_time)
+        results.append(result("check_reminders_tick", params, await measure_async(tick, args.repeat), users))
+
+        sample = random.Random(1).sample(list(plugin.schedules), min(200, users))
+
+        async def render():
+            for user_id in sample:
+                async for _ in plugin.show_schedule(stubs.AstrMessageEvent(user_id, "/课程表")):
+                    pass
+        results.append(result("show_schedule", params, await measure_async(render, args.repeat), len(sample)))
+
+        results.append(result("save_schedules", params, measure(plugin.save_schedules, args.repeat), users))
+        results.append(result("load_schedules", params, measure(plugin.load_schedules, args.repeat), users))
+        plugin.schedules = {}
+
+
+def bench_parser(args, results: List[Dict]):
+    import pandas as pd
+    from teheikcb.parser import ScheduleParser
+
+    rng = random.Random(2)
+    parser = ScheduleParser()
+    lines = [
+        f"{rng.choice(COURSE_NAMES)} {rng.choice(WEEKDAYS)} {rng.choice(CLOCK_TIMES)} "
+        f"{rng.choice('ABCD')}{rng.randint(100, 599)} {rng.choice(TEACHERS)}"
+        for _ in range(args.parse_lines)
+    ]
+    text = "\n".join(lines)
+    results.append(result("parse_text_schedule", {"lines": len(lines)},
+                          measure(lambda: parser.parse_text_schedule(text), args.repeat), len(lines)))
+
+    rows = [{
+        "课程名称": rng.choice(COURSE_NAMES),
+        "星期": rng.choice(WEEKDAYS),
+        "节次": f"第{rng.choice(PERIODS)}节",
+        "教室": f"{rng.choice('ABCD')}{rng.randint(100, 599)}",
+        "教师": rng.choice(TEACHERS)
+    } for _ in range(args.xlsx_rows)]
+    xlsx_path = os.path.join(os.getcwd(), "bench.xlsx")
+    pd.DataFrame(rows).to_excel(xlsx_path, index=False)
+    results.append(result("parse_xlsx", {"rows": len(rows)},
+                          measure(lambda: parser.parse_xlsx(xlsx_path), args.repeat), len(rows)))
+
+
+def bench_gallery(args, results: List[Dict]):
+    from teheikcb.gallery import GalleryManager
+
+    rng = random.Random(3)
+    for count in args.images:
+        base = tempfile.mkdtemp(dir=os.getcwd())
+        gm = GalleryManager(os.path.join(base, "galleries"), os.path.join(base, "info.json"),
+                            {"capacity": count + 1, "compress": False, "duplicate": True, "fuzzy": False})
+        gallery = gm.create_gallery(f"bench{count}", "1", "bench")
+        images = [make_image(rng) for _ in range(count)]
+        for image in images:
+            gallery.add_image(image)
+        params = {"images": count}
+
+        # 重复图片：需要与整个图库比较后拒绝
+        duplicate = images[-1]
+        results.append(result("gallery_add_duplicate", params,
+                              measure(lambda: gallery.add_image(duplicate), args.repeat)))
+
+        # 新图片：图库已满前的最后一张，每次添加后删除
+        fresh = [make_image(rng) for _ in range(args.repeat)]
+
+        def add_fresh():
+            gallery.add_image(fresh.pop())
+            gallery.delete_image(len(gallery.images))
+        results.append(result("gallery_add_new_at_capacity", params, measure(add_fresh, args.repeat)))
+
+
+async def run(args) -> Dict:
+    main = stubs.install()
+    results: List[Dict] = []
+    await bench_schedules(main, args, results)
+    bench_parser(args, results)
+    bench_gallery(args, results)
+    return {
+        "plugin_version": plugin_version(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "timestamp": datetime.now().isoformat(timespec="seconds"),
+        "results": results
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="插件热点路径基准测试")
+    parser.add_argument("--users", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--courses-per-user", type=int, default=12)
+    parser.add_argument("--class-size", type=int, default=1, help="同一班级共用课程表的人数，1表示每人不同")
+    parser.add_argument("--images", type=int, nargs="+", default=[50, 200, 1000])
+    parser.add_argument("--parse-lines", type=int, default=10000)
+    parser.add_argument("--xlsx-rows", type=int, default=2000)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--output", help="结果JSON文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    workdir = tempfile.mkdtemp(prefix="teheikcb-bench-")
+    os.chdir(workdir)
+    report = asyncio.run(run(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,230 @@
+"""
+学期模拟
+用虚拟时钟驱动插件的提醒循环，几秒到几分钟内跑完整个学期，记录每次触发的时间，
+并统计吞吐和每分钟检查的耗时；--verify 会按课程表和校历逐天推算应触发的提醒并与实际触发对比
+
+用法：
+    python benchmarks/simulate.py --users 1000 --weeks 20
+    python benchmarks/simulate.py --users 100000 --class-size 50 --fires-out fires.jsonl --output report.json
+    python benchmarks/simulate.py --users 500 --holiday 2025-04-04:2025-04-06 --makeup 2025-04-27:星期五 --verify
+"""
+import os
+import sys
+import json
+import time
+import asyncio
+import argparse
+import tempfile
+import statistics
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Set, Tuple
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stubs  # noqa: E402
+from run_benchmarks import default_config, make_schedules, plugin_version  # noqa: E402
+
+
+class RecordingSender:
+    """代替发送队列，记录每条消息的触发时间并立即视为送达"""
+
+    def __init__(self, clock, ledger):
+        self.clock = clock
+        self.ledger = ledger
+        self.fires: List[Tuple[datetime, str, int, Tuple[str, ...]]] = []
+
+    def enqueue(self, target: str, text: str, priority: int = 0, keys=(), mentions=(), expires_at: float = 0.0) -> bool:
+        self.fires.append((self.clock.now(), target, priority, tuple(keys)))
+        self.ledger.mark(keys)
+        return True
+
+    def is_pending(self, key: str) -> bool:
+        return False
+
+    def stats(self) -> Dict[str, int]:
+        return {"pending": 0, "targets": 0}
+
+    async def stop(self, drain_timeout: float = 0):
+        pass
+
+
+def expected_fires(main, plugin, start: datetime, end: datetime) -> Set[Tuple[str, str]]:
+    """按课程表和校历逐天推算应触发的提醒，返回(触发时间, 发送记录标识)"""
+    reminder = sys.modules[f"{stubs.PLUGIN_PACKAGE}.reminder"]
+    school_calendar = sys.modules[f"{stubs.PLUGIN_PACKAGE}.school_calendar"]
+    config = plugin.config
+    periods = plugin.periods
+    daily_hour, daily_minute = map(int, config.get("daily_reminder_time", "23:00").split(":"))
+    expected = set()
+    days = (end.date() - start.date()).days + 2
+    for user_id, data in plugin.schedules.items():
+        settings = data.get("settings", {})
+        offset = settings.get("reminder_time", config.get("reminder_time", 30)) \
+            if settings.get("enable_reminder", True) else None
+        daily = settings.get("enable_daily_reminder", True)
+        for i in range(-1, days):
+            day = start.date() + timedelta(days=i)
+            info = plugin.calendar.lookup(day)
+            if info.no_class:
+                continue
+            courses = [c for c in data.get("courses", [])
+                       if c.get("day") == reminder.WEEKDAYS[info.weekday]
+                       and school_calendar.in_week(school_calendar.parse_weeks(c.get("weeks", "")), info.week)]
+            if not courses:
+                continue
+            if config.get("enable_daily_reminder", True) and daily:
+                fire = datetime.combine(day - timedelta(days=1), datetime.min.time()).replace(
+                    hour=daily_hour, minute=daily_minute)
+                if start <= fire < end:
+                    expected.add((fire.isoformat(), f"{user_id}|d{day:%Y%m%d}"))
+            if config.get("enable_auto_reminder", True) and offset is not None:
+                for course in courses:
+                    minute = periods.start_minute(course.get("time", ""))
+                    if minute is None:
+                        continue
+                    class_time = datetime.combine(day, datetime.min.time()) + timedelta(minutes=minute)
+                    fire = class_time - timedelta(minutes=offset)
+                    if start <= fire < end:
+                        expected.add((fire.isoformat(), f"{user_id}|r{class_time:%Y%m%d%H%M}|{course.get('name', '')}"))
+    return expected
+
+
+def write_calendar(path: str, holidays: List[str], makeup_days: List[str]):
+    """把命令行给出的假期和调休写成校历文件，走插件正常的加载流程"""
+    data = {"holidays": [], "makeup_days": []}
+    for item in holidays:
+        begin, _, end = item.partition(":")
+        data["holidays"].append({"start": begin, "end": end or begin, "name": "假期"})
+    for item in makeup_days:
+        day, _, weekday = item.partition(":")
+        data["makeup_days"].append({"date": day, "weekday": weekday, "name": "调休"})
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(data, f, ensure_ascii=False)
+
+
+async def simulate(args) -> Dict:
+    main = stubs.install()
+    clock_module = sys.modules[f"{stubs.PLUGIN_PACKAGE}.clock"]
+    start = datetime.combine(date.fromisoformat(args.start), datetime.min.time())
+    start -= timedelta(days=start.weekday())
+    end = start + timedelta(weeks=args.weeks)
+
+    config = default_config()
+    config["calendar_config"].update(semester_start=start.date().isoformat(), weeks=args.weeks)
+    config["snapshot_config"]["enable"] = False
+    config["reminder_time"] = args.reminder_time
+    data_dir = os.path.join("data", "teheikcb")
+    os.makedirs(data_dir, exist_ok=True)
+    write_calendar(os.path.join(data_dir, "calendar.json"), args.holiday, args.makeup)
+
+    clock = clock_module.VirtualClock(start, end)
+    existing = asyncio.all_tasks()
+    plugin = main.CourseReminderPlugin(stubs.Context(), config, clock=clock)
+    loop_task = None
+    for task in asyncio.all_tasks() - existing:
+        # 只保留提醒循环，由它推动虚拟时间
+        if task.get_coro().__name__ == "check_reminders":
+            loop_task = task
+        else:
+            task.cancel()
+
+    load_start = time.perf_counter()
+    plugin._restore_schedules(make_schedules(args.users, args.courses_per_user, args.class_size, args.seed))
+    for user_id, data in plugin.schedules.items():
+        data["settings"]["reminder_time"] = args.reminder_time
+    plugin.scheduler.load(plugin.schedules)
+    load_seconds = time.perf_counter() - load_start
+    sender = plugin.sender = RecordingSender(clock, plugin.ledger)
+
+    tick_times: List[float] = []
+    reminder_tick = plugin.reminder_tick
+
+    async def timed_tick(now):
+        tick_start = time.perf_counter()
+        try:
+            return await reminder_tick(now)
+        finally:
+            tick_times.append(time.perf_counter() - tick_start)
+    plugin.reminder_tick = timed_tick
+
+    run_start = time.perf_counter()
+    try:
+        await loop_task
+    except clock_module.SimulationEnd:
+        pass
+    elapsed = time.perf_counter() - run_start
+
+    fires = sender.fires
+    if args.fires_out:
+        with open(args.fires_out, "w", encoding="utf-8") as f:
+            for fired_at, target, priority, keys in fires:
+                f.write(json.dumps({"time": fired_at.isoformat(), "target": target,
+                                    "kind": "digest" if priority else "reminder", "keys": list(keys)},
+                                   ensure_ascii=False) + "\n")
+
+    delivered = [key for _, _, _, keys in fires for key in keys]
+    tick_times.sort()
+    report = {
+        "plugin_version": plugin_version(),
+        "params": {"users": args.users, "courses_per_user": args.courses_per_user, "class_size": args.class_size,
+                   "weeks": args.weeks, "start": start.date().isoformat(), "reminder_time": args.reminder_time},
+        "load_seconds": load_seconds,
+        "elapsed_seconds": elapsed,
+        "ticks": len(tick_times),
+        "ticks_per_second": len(tick_times) / elapsed if elapsed > 0 else None,
+        "fires": len(delivered),
+        "reminders": sum(len(keys) for _, _, priority, keys in fires if not priority),
+        "digests": sum(len(keys) for _, _, priority, keys in fires if priority),
+        "duplicates": len(delivered) - len(set(delivered)),
+        "fires_per_second": len(delivered) / elapsed if elapsed > 0 else None,
+        "tick_seconds": {
+            "mean": statistics.fmean(tick_times) if tick_times else 0,
+            "p50": tick_times[len(tick_times) // 2] if tick_times else 0,
+            "p99": tick_times[int(len(tick_times) * 0.99)] if tick_times else 0,
+            "max": tick_times[-1] if tick_times else 0
+        }
+    }
+
+    if args.verify:
+        expected = expected_fires(main, plugin, start, end)
+        actual = {(fired_at.isoformat(), key) for fired_at, _, _, keys in fires for key in keys}
+        missing = sorted(expected - actual)
+        unexpected = sorted(actual - expected)
+        report["verify"] = {"expected": len(expected), "missing": len(missing), "unexpected": len(unexpected),
+                            "missing_sample": missing[:10], "unexpected_sample": unexpected[:10]}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="用虚拟时钟模拟整个学期的课程提醒")
+    parser.add_argument("--users", type=int, default=1000)
+    parser.add_argument("--courses-per-user", type=int, default=12)
+    parser.add_argument("--class-size", type=int, default=1, help="同一班级共用课程表的人数，1表示每人不同")
+    parser.add_argument("--weeks", type=int, default=20)
+    parser.add_argument("--start", default="2025-02-24", help="开学日期，从该周周一开始模拟")
+    parser.add_argument("--reminder-time", type=int, default=10, help="提前提醒分钟数")
+    parser.add_argument("--holiday", action="append", default=[], help="放假区间 开始[:结束]，可重复")
+    parser.add_argument("--makeup", action="append", default=[], help="调休上课 日期:星期X，可重复")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--verify", action="store_true", help="与按天推算的应触发提醒对比")
+    parser.add_argument("--fires-out", help="逐条触发记录（JSON Lines）")
+    parser.add_argument("--output", help="报告JSON文件，默认输出到标准输出")
+    args = parser.parse_args()
+
+    output = os.path.abspath(args.output) if args.output else None
+    if args.fires_out:
+        args.fires_out = os.path.abspath(args.fires_out)
+    workdir = tempfile.mkdtemp(prefix="teheikcb-sim-")
+    os.chdir(workdir)
+    report = asyncio.run(simulate(args))
+    text = json.dumps(report, ensure_ascii=False, indent=2)
+    if output:
+        with open(output, "w", encoding="utf-8") as f:
+            f.write(text)
+    else:
+        print(text)
+    if report.get("verify") and (report["verify"]["missing"] or report["verify"]["unexpected"]):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
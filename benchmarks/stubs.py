@@ -0,0 +1,142 @@
+"""
+AstrBot运行时替身
+只提供插件导入和基准测试需要的最小接口，不依赖AstrBot
+"""
+import os
+import sys
+import types
+import logging
+from enum import Enum
+
+PLUGIN_PACKAGE = "teheikcb"
+PLUGIN_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _decorator_factory(*args, **kwargs):
+    def decorator(func):
+        return func
+    return decorator
+
+
+class EventMessageType(Enum):
+    ALL = "all"
+    GROUP_MESSAGE = "group"
+    PRIVATE_MESSAGE = "private"
+
+
+class PermissionType(Enum):
+    ADMIN = "admin"
+    MEMBER = "member"
+
+
+class Plain:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class At:
+    def __init__(self, qq: str = "", name: str = ""):
+        self.qq = qq
+        self.name = name
+
+
+class Image:
+    def __init__(self, file: str = "", url: str = ""):
+        self.file = file
+        self.url = url
+
+
+class Star:
+    def __init__(self, context):
+        self.context = context
+
+
+class Context:
+    """记录发送的消息，不真正发送"""
+
+    def __init__(self):
+        self.sent = 0
+
+    async def send_message(self, target, chain):
+        self.sent += 1
+        return True
+
+
+class AstrMessageEvent:
+    """最小化的消息事件"""
+
+    def __init__(self, sender_id: str = "10000", text: str = "", group_id: str = "", messages=None):
+        self.sender_id = sender_id
+        self.message_str = text
+        self.group_id = group_id
+        self.messages = messages or []
+        self.unified_msg_origin = f"stub:{'GroupMessage' if group_id else 'FriendMessage'}:{group_id or sender_id}"
+        self.message_obj = types.SimpleNamespace(type="text")
+
+    def get_sender_id(self):
+        return self.sender_id
+
+    def get_sender_name(self):
+        return f"user{self.sender_id}"
+
+    def get_group_id(self):
+        return self.group_id
+
+    def get_messages(self):
+        return self.messages
+
+    def get_plain_text(self):
+        return self.message_str
+
+    def plain_result(self, text):
+        return ("plain", text)
+
+    def image_result(self, path):
+        return ("image", path)
+
+
+class Pipeline:
+    async def llm_request(self, prompt):
+        return None
+
+
+def install():
+    """注册astrbot替身模块并以包的形式导入插件，返回插件的main模块"""
+    filter_module = types.ModuleType("astrbot.api.event.filter")
+    filter_module.command = _decorator_factory
+    filter_module.event_message_type = _decorator_factory
+    filter_module.permission_type = _decorator_factory
+    filter_module.EventMessageType = EventMessageType
+    filter_module.PermissionType = PermissionType
+
+    modules = {
+        "astrbot": types.ModuleType("astrbot"),
+        "astrbot.api": types.ModuleType("astrbot.api"),
+        "astrbot.api.event": types.ModuleType("astrbot.api.event"),
+        "astrbot.api.event.filter": filter_module,
+        "astrbot.api.star": types.ModuleType("astrbot.api.star"),
+        "astrbot.api.message_components": types.ModuleType("astrbot.api.message_components"),
+        "astrbot.core": types.ModuleType("astrbot.core"),
+        "astrbot.core.pipeline": types.ModuleType("astrbot.core.pipeline"),
+    }
+    modules["astrbot.api"].logger = logging.getLogger("astrbot")
+    modules["astrbot.api"].message_components = modules["astrbot.api.message_components"]
+    modules["astrbot.api.event"].filter = filter_module
+    modules["astrbot.api.event"].AstrMessageEvent = AstrMessageEvent
+    modules["astrbot.api.star"].Context = Context
+    modules["astrbot.api.star"].Star = Star
+    modules["astrbot.api.star"].register = _decorator_factory
+    modules["astrbot.api.message_components"].Plain = Plain
+    modules["astrbot.api.message_components"].Image = Image
+    modules["astrbot.api.message_components"].At = At
+    modules["astrbot.core.pipeline"].Pipeline = Pipeline
+    for name, module in modules.items():
+        sys.modules.setdefault(name, module)
+
+    if PLUGIN_PACKAGE not in sys.modules:
+        package = types.ModuleType(PLUGIN_PACKAGE)
+        package.__path__ = [PLUGIN_DIR]
+        sys.modules[PLUGIN_PACKAGE] = package
+
+    import importlib
+    return importlib.import_module(f"{PLUGIN_PACKAGE}.main")
@@ -0,0 +1,201 @@
+"""
+图片存储模块
+所有图库共用一个按内容哈希寻址的存储，同一张图片只保存一份，按引用计数回收；
+引用计数先在内存中修改，由flush定期和关闭时写回，启动时再按图库清单核对，中途退出也不会算错
+"""
+import os
+import json
+import hashlib
+import tempfile
+import threading
+from typing import Dict, Optional, Tuple
+
+
+class BlobStore:
+    def __init__(self, root: str):
+        """
+        初始化图片存储
+
+        Args:
+            root: 存储目录，图片保存为 root/<哈希前两位>/<哈希><扩展名>
+        """
+        self.root = root
+        self.refs_file = os.path.join(root, "refs.json")
+        self.refs: Dict[str, Dict] = {}  # 哈希 -> {"count": 引用数, "size": 字节数, "ext": 扩展名}
+        self.total_bytes = 0  # 仍被引用的图片大小，待删除的不计入
+        self.pending = set()  # 引用已归零、等待后台删除文件的哈希
+        self._dirty = False  # 引用计数有未写回的修改
+        self._lock = threading.RLock()
+        os.makedirs(root, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """加载引用计数"""
+        if os.path.exists(self.refs_file):
+            try:
+                with open(self.refs_file, "r", encoding="utf-8") as f:
+                    self.refs = json.load(f)
+            except Exception:
+                self.refs = {}
+        self.total_bytes = sum(ref["size"] for ref in self.refs.values() if ref["count"] > 0)
+        self.pending = {digest for digest, ref in self.refs.items() if ref["count"] <= 0}
+
+    def _save(self):
+        """保存引用计数"""
+        tmp_file = self.refs_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.refs, f)
+        os.replace(tmp_file, self.refs_file)
+        self._dirty = False
+
+    def flush(self):
+        """把修改过的引用计数写回文件"""
+        with self._lock:
+            if self._dirty:
+                self._save()
+
+    def path(self, digest: str) -> str:
+        """获取图片文件路径"""
+        ext = self.refs.get(digest, {}).get("ext", ".png")
+        return os.path.join(self.root, digest[:2], digest + ext)
+
+    def digest_of(self, path: str) -> Optional[str]:
+        """存储中图片文件的哈希，不是存储中的文件时返回None"""
+        digest = os.path.basename(path).split(".", 1)[0]
+        if digest in self.refs and os.path.normpath(path) == os.path.normpath(self.path(digest)):
+            return digest
+        return None
+
+    def put_bytes(self, data: bytes, ext: str = ".png") -> Tuple[str, int]:
+        """保存图片数据并增加一次引用，返回哈希和大小"""
+        digest = hashlib.sha256(data).hexdigest()
+        with self._lock:
+            if digest in self.refs:
+                self._revive(digest)
+            else:
+                target = os.path.join(self.root, digest[:2], digest + ext)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(target))
+                with os.fdopen(fd, "wb") as f:
+                    f.write(data)
+                os.replace(tmp_path, target)
+                self.refs[digest] = {"count": 0, "size": len(data), "ext": ext}
+                self.total_bytes += len(data)
+            self.refs[digest]["count"] += 1
+            self._dirty = True
+            return digest, self.refs[digest]["size"]
+
+    def put_file(self, file_path: str, ext: str = ".png") -> Tuple[str, int]:
+        """把文件移入存储并增加一次引用，已存在相同内容时删除该文件"""
+        h = hashlib.sha256()
+        with open(file_path, "rb") as f:
+            for chunk in iter(lambda: f.read(1024 * 1024), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            if digest in self.refs:
+                os.remove(file_path)
+                self._revive(digest)
+            else:
+                target = os.path.join(self.root, digest[:2], digest + ext)
+                os.makedirs(os.path.dirname(target), exist_ok=True)
+                os.replace(file_path, target)
+                self.refs[digest] = {"count": 0, "size": os.path.getsize(target), "ext": ext}
+                self.total_bytes += self.refs[digest]["size"]
+            self.refs[digest]["count"] += 1
+            self._dirty = True
+            return digest, self.refs[digest]["size"]
+
+    def _revive(self, digest: str):
+        """待删除的图片又被存入时取消删除，直接复用原文件"""
+        if self.refs[digest]["count"] <= 0:
+            self.pending.discard(digest)
+            self.refs[digest]["count"] = 0
+            self.total_bytes += self.refs[digest]["size"]
+
+    def _remove(self, digest: str):
+        """删除文件和引用记录"""
+        try:
+            os.remove(self.path(digest))
+        except FileNotFoundError:
+            pass
+        del self.refs[digest]
+
+    def release(self, digest: str, defer: bool = False) -> bool:
+        """
+        减少一次引用，引用为零时删除文件，返回引用是否已归零
+
+        Args:
+            digest: 图片哈希
+            defer: 引用归零时暂不删除文件，留给purge在后台删除
+        """
+        with self._lock:
+            ref = self.refs.get(digest)
+            if ref is None or ref["count"] <= 0:
+                return False
+            ref["count"] -= 1
+            freed = ref["count"] <= 0
+            if freed:
+                self.total_bytes -= ref["size"]
+                if defer:
+                    self.pending.add(digest)
+                else:
+                    self._remove(digest)
+            self._dirty = True
+            return freed
+
+    def release_many(self, digests, defer: bool = False) -> int:
+        """批量减少引用，返回引用归零的图片数"""
+        with self._lock:
+            return sum(1 for digest in digests if self.release(digest, defer=defer))
+
+    def purge(self, digests) -> int:
+        """删除一批待删除的文件，期间又被存入的图片保留，返回删除数量"""
+        removed = 0
+        for digest in digests:
+            with self._lock:
+                if digest not in self.pending:
+                    continue
+                self.pending.discard(digest)
+                self._remove(digest)
+                self._dirty = True
+                removed += 1
+        return removed
+
+    def _recover(self, digest: str):
+        """清单引用了但引用记录里没有的图片（上次退出前未写回），按存储中的文件补上记录"""
+        folder = os.path.join(self.root, digest[:2])
+        try:
+            names = os.listdir(folder)
+        except FileNotFoundError:
+            return
+        for name in names:
+            if name.startswith(digest):
+                path = os.path.join(folder, name)
+                self.refs[digest] = {"count": 0, "size": os.path.getsize(path), "ext": name[len(digest):]}
+                return
+
+    def reconcile(self, counts: Dict[str, int]):
+        """按图库清单重新核对引用计数，没有引用的文件（包括上次未删完的）交给purge删除"""
+        with self._lock:
+            for digest in counts:
+                if digest not in self.refs:
+                    self._recover(digest)
+            self.pending.clear()
+            self.total_bytes = 0
+            for digest, ref in self.refs.items():
+                ref["count"] = counts.get(digest, 0)
+                if ref["count"] <= 0:
+                    self.pending.add(digest)
+                else:
+                    self.total_bytes += ref["size"]
+            self._save()
+
+    def snapshot(self) -> Dict[str, Tuple[int, int]]:
+        """所有图片的(引用数, 大小)"""
+        with self._lock:
+            return {digest: (ref["count"], ref["size"]) for digest, ref in self.refs.items()}
+
+    def physical_bytes(self) -> int:
+        """仍被引用的图片实际占用的字节数"""
+        return self.total_bytes
@@ -0,0 +1,98 @@
+"""
+班级课程表模块
+同班同学上传的课程表内容相同，按内容哈希合并为共享的班级课程表，用户只保存引用和个人改动
+"""
+import json
+import hashlib
+from typing import Dict, List, Tuple
+from .reminder import WEEKDAYS
+
+
+def normalize_courses(courses: List[Dict]) -> List[Dict]:
+    """去掉首尾空白并按星期、时间、课程名排序，使顺序或空格不同的课程表得到相同的内容"""
+    normalized = [
+        {k: v.strip() if isinstance(v, str) else v for k, v in course.items()}
+        for course in courses
+    ]
+    normalized.sort(key=lambda c: (
+        WEEKDAYS.index(c.get("day")) if c.get("day") in WEEKDAYS else len(WEEKDAYS),
+        str(c.get("time", "")),
+        str(c.get("name", ""))
+    ))
+    return normalized
+
+
+def schedule_key(courses: List[Dict]) -> str:
+    """计算课程表的内容哈希"""
+    data = json.dumps(courses, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(data.encode("utf-8")).hexdigest()[:16]
+
+
+def apply_overrides(base: List[Dict], overrides: List[Dict]) -> List[Dict]:
+    """
+    在班级课程表上依次应用个人改动
+
+    改动格式：
+        {"op": "add", "course": {...}}
+        {"op": "update", "index": 下标, "fields": {...}}
+        {"op": "remove", "index": 下标}
+    下标指应用到该条改动时的课程列表位置
+    """
+    if not overrides:
+        return base
+    courses = list(base)
+    for override in overrides:
+        op = override.get("op")
+        index = override.get("index", -1)
+        if op == "add":
+            courses.append(override["course"])
+        elif op == "update" and 0 <= index < len(courses):
+            courses[index] = {**courses[index], **override.get("fields", {})}
+        elif op == "remove" and 0 <= index < len(courses):
+            del courses[index]
+    return courses
+
+
+class ClassRegistry:
+    def __init__(self):
+        """初始化班级课程表登记"""
+        self.classes: Dict[str, List[Dict]] = {}  # 内容哈希 -> 课程列表
+        self.members: Dict[str, int] = {}  # 内容哈希 -> 引用人数
+
+    def intern(self, courses: List[Dict], normalize: bool = True) -> Tuple[str, List[Dict]]:
+        """登记课程表，内容相同时返回已有的共享列表"""
+        if normalize:
+            courses = normalize_courses(courses)
+        key = schedule_key(courses)
+        if key not in self.classes:
+            self.classes[key] = courses
+        self.members[key] = self.members.get(key, 0) + 1
+        return key, self.classes[key]
+
+    def restore(self, key: str, courses: List[Dict]) -> List[Dict]:
+        """从存储中恢复班级课程表（不增加引用）"""
+        return self.classes.setdefault(key, courses)
+
+    def acquire(self, key: str) -> List[Dict]:
+        """增加已登记课程表的引用"""
+        self.members[key] = self.members.get(key, 0) + 1
+        return self.classes[key]
+
+    def release(self, key: str):
+        """减少引用，没有人使用时删除"""
+        count = self.members.get(key, 0) - 1
+        if count > 0:
+            self.members[key] = count
+        else:
+            self.members.pop(key, None)
+            self.classes.pop(key, None)
+
+    def prune(self):
+        """删除没有引用的班级课程表"""
+        for key in [key for key in self.classes if key not in self.members]:
+            del self.classes[key]
+
+    def stats(self) -> Dict[str, int]:
+        """班级课程表数量和引用总数"""
+        return {"classes": len(self.classes), "members": sum(self.members.values())}
+
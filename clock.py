@@ -0,0 +1,48 @@
+"""
+时钟模块
+提醒逻辑通过时钟获取当前时间和等待，模拟时换成虚拟时钟，几秒内跑完整个学期
+"""
+import asyncio
+from datetime import datetime, timedelta
+from typing import Optional
+
+
+class SimulationEnd(Exception):
+    """虚拟时钟到达结束时间"""
+
+
+class SystemClock:
+    """真实时间"""
+
+    def now(self) -> datetime:
+        return datetime.now()
+
+    async def sleep(self, seconds: float):
+        await asyncio.sleep(seconds)
+
+
+class VirtualClock:
+    def __init__(self, start: datetime, end: Optional[datetime] = None):
+        """
+        虚拟时钟，sleep立即返回并把时间向前推进
+
+        Args:
+            start: 起始时间
+            end: 结束时间，推进到该时间后sleep抛出SimulationEnd
+        """
+        self.current = start
+        self.end = end
+
+    def now(self) -> datetime:
+        return self.current
+
+    def advance(self, seconds: float):
+        """推进时间"""
+        self.current += timedelta(seconds=seconds)
+
+    async def sleep(self, seconds: float):
+        self.advance(seconds)
+        if self.end is not None and self.current >= self.end:
+            raise SimulationEnd()
+        # 让出事件循环，其他任务按虚拟时间继续运行
+        await asyncio.sleep(0)
@@ -0,0 +1,181 @@
+"""
+自动收集模块
+把白名单群聊中的图片放入有界队列，由后台任务批量下载、去重、压缩后存入发送者的图库
+"""
+import os
+import re
+import asyncio
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+from PIL import Image
+from .downloader import Downloader
+from .gallery import Gallery, GalleryManager
+
+
+@dataclass
+class CollectItem:
+    group_id: str
+    sender_id: str
+    sender_name: str
+    url: str
+
+
+class AutoCollector:
+    def __init__(self, gm: GalleryManager, downloader: Downloader, white_list: Optional[List[str]] = None,
+                 collect_compressed: bool = False, compress_size: int = 512,
+                 max_queue: int = 256, batch_size: int = 16, workers: int = 2):
+        """
+        初始化自动收集器
+
+        Args:
+            gm: 图库管理器
+            downloader: 下载器
+            white_list: 群聊白名单，为空表示所有群聊
+            collect_compressed: 图片达到压缩阈值时是否仍然收集
+            compress_size: 压缩阈值（像素）
+            max_queue: 队列长度上限，队列满时直接丢弃新图片
+            batch_size: 每批最多处理的图片数
+            workers: 后台任务数
+        """
+        self.gm = gm
+        self.downloader = downloader
+        self.white_list = set(str(g) for g in (white_list or []))
+        self.collect_compressed = collect_compressed
+        self.compress_size = compress_size
+        self.batch_size = batch_size
+        self.worker_count = workers
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        self.logger = logging.getLogger("AutoCollector")
+        self._tasks: List[asyncio.Task] = []
+
+        # 统计
+        self.enqueued = 0
+        self.dropped = 0
+        self.collected = 0
+        self.skipped = 0
+        self.failed = 0
+
+    def start(self):
+        """启动后台任务"""
+        if self._tasks:
+            return
+        for _ in range(self.worker_count):
+            self._tasks.append(asyncio.create_task(self._worker()))
+
+    async def stop(self):
+        """停止后台任务"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    def accepts_group(self, group_id: str) -> bool:
+        """群聊是否启用自动收集"""
+        return bool(group_id) and (not self.white_list or str(group_id) in self.white_list)
+
+    def offer(self, item: CollectItem) -> bool:
+        """放入队列，不等待；队列已满时丢弃"""
+        try:
+            self.queue.put_nowait(item)
+        except asyncio.QueueFull:
+            self.dropped += 1
+            return False
+        self.enqueued += 1
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        """获取统计信息"""
+        return {
+            "queue_depth": self.queue.qsize(),
+            "queue_size": self.queue.maxsize,
+            "enqueued": self.enqueued,
+            "dropped": self.dropped,
+            "collected": self.collected,
+            "skipped": self.skipped,
+            "failed": self.failed
+        }
+
+    async def _worker(self):
+        """取出一批图片，按发送者分组处理"""
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.batch_size:
+                try:
+                    batch.append(self.queue.get_nowait())
+                except asyncio.QueueEmpty:
+                    break
+            try:
+                by_sender: Dict[str, List[CollectItem]] = defaultdict(list)
+                for item in batch:
+                    by_sender[item.sender_id].append(item)
+                for items in by_sender.values():
+                    await self._collect(items)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                self.logger.error(f"自动收集失败: {str(e)}")
+            finally:
+                for _ in batch:
+                    self.queue.task_done()
+
+    async def _collect(self, items: List[CollectItem]):
+        """下载同一发送者的图片并存入其图库"""
+        gallery = await self._get_gallery(items[0])
+        if gallery is None:
+            self.failed += len(items)
+            return
+        results = await asyncio.gather(*(self.downloader.fetch(item.url) for item in items),
+                                       return_exceptions=True)
+        paths = []
+        for result in results:
+            if isinstance(result, BaseException):
+                self.failed += 1
+            else:
+                paths.append(result)
+        if paths:
+            await self.gm.run(self._store, gallery, paths)
+
+    @staticmethod
+    def gallery_name(sender_id: str) -> str:
+        """自动收集图库按发送者ID命名，昵称可重复也可随意修改，不能用作图库名"""
+        return "收集-" + re.sub(r"[^0-9A-Za-z_-]", "_", str(sender_id))
+
+    async def _get_gallery(self, item: CollectItem) -> Optional[Gallery]:
+        """获取发送者的图库，不存在时创建；同名图库属于别人时返回None"""
+        name = self.gallery_name(item.sender_id)
+        gallery = self.gm.get_gallery(name)
+        if gallery is None:
+            gallery = await self.gm.create_gallery_async(name, item.sender_id, item.sender_name)
+        if gallery.creator_id != item.sender_id:
+            self.logger.warning(f"图库【{name}】不属于{item.sender_id}，跳过自动收集")
+            return None
+        return gallery
+
+    def _store(self, gallery: Gallery, paths: List[str]):
+        """在线程中完成去重、压缩和入库"""
+        for path in paths:
+            try:
+                if gallery.duplicate and not self.collect_compressed and self._exceeds_threshold(path):
+                    self.skipped += 1
+                    continue
+                result = gallery.add_image_file(path, label="collect")
+                if "已存在" in result:
+                    self.skipped += 1
+                else:
+                    self.collected += 1
+            except Exception as e:
+                self.failed += 1
+                self.logger.debug(f"收集图片失败: {str(e)}")
+            finally:
+                if os.path.exists(path):
+                    os.remove(path)
+
+    def _exceeds_threshold(self, path: str) -> bool:
+        """图片尺寸是否达到压缩阈值"""
+        try:
+            with Image.open(path) as img:
+                return max(img.size) > self.compress_size
+        except Exception:
+            return True
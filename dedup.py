@@ -0,0 +1,110 @@
+"""
+图库去重模块
+在子进程中并行计算每张图片的像素哈希和感知哈希，按哈希分组后保留每组最早的图片
+"""
+import asyncio
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from PIL import Image
+
+
+def dhash(img: Image.Image, size: int = 8) -> int:
+    """计算64位差值哈希"""
+    gray = img.convert("L").resize((size + 1, size), Image.Resampling.LANCZOS)
+    pixels = list(gray.getdata())
+    value = 0
+    for row in range(size):
+        offset = row * (size + 1)
+        for col in range(size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value
+
+
+def pixel_hash(source) -> Optional[str]:
+    """计算解码后像素的哈希，图片内容相同即相同，与文件编码无关"""
+    try:
+        with Image.open(source) as img:
+            img = img.convert("RGBA")
+            return hashlib.sha1(f"{img.size}".encode() + img.tobytes()).hexdigest()
+    except Exception:
+        return None
+
+
+def hash_image(key: str, path: str) -> Tuple[str, Optional[str], Optional[int]]:
+    """计算图片的像素哈希和感知哈希，在子进程中执行"""
+    try:
+        with Image.open(path) as img:
+            img = img.convert("RGBA")
+            exact = hashlib.sha1(f"{img.size}".encode() + img.tobytes()).hexdigest()
+            return key, exact, dhash(img)
+    except Exception:
+        return key, None, None
+
+
+# 纯色或渐变图片的差值哈希没有区分度，不参与感知哈希分组
+_FLAT_DHASHES = {0, (1 << 64) - 1}
+
+
+def group_duplicates(hashes: List[Tuple[str, Optional[str], Optional[int]]],
+                     added: Dict[str, float]) -> List[str]:
+    """按像素哈希和感知哈希合并分组，返回每组中除最早一张外的图片"""
+    parent = {key: key for key, _, _ in hashes}
+
+    def find(x: str) -> str:
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    first_by_key: Dict[Tuple[str, object], str] = {}
+    for key, exact, perceptual in hashes:
+        for bucket in (("exact", exact), ("dhash", perceptual)):
+            if bucket[1] is None or bucket[1] in _FLAT_DHASHES:
+                continue
+            other = first_by_key.setdefault(bucket, key)
+            if other != key:
+                parent[find(key)] = find(other)
+
+    groups: Dict[str, List[str]] = {}
+    for key, exact, _ in hashes:
+        if exact is not None:
+            groups.setdefault(find(key), []).append(key)
+
+    duplicates = []
+    for members in groups.values():
+        members.sort(key=lambda k: (added.get(k, 0), k))
+        duplicates.extend(members[1:])
+    return duplicates
+
+
+async def find_duplicates(images: List[Dict], workers: Optional[int] = None,
+                          progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                          progress_step: int = 100) -> List[str]:
+    """
+    并行计算哈希并找出重复图片
+
+    Args:
+        images: 图库清单条目，需包含id、path和added
+        workers: 子进程数，默认为CPU核数
+        progress: 进度回调，参数为已完成数和总数
+        progress_step: 每完成多少张回调一次
+
+    Returns:
+        应删除的图片id
+    """
+    loop = asyncio.get_running_loop()
+    added = {image["id"]: image.get("added", 0) for image in images}
+
+    hashes = []
+    pool = ProcessPoolExecutor(max_workers=workers)
+    try:
+        futures = [loop.run_in_executor(pool, hash_image, image["id"], image["path"]) for image in images]
+        for done, future in enumerate(asyncio.as_completed(futures), 1):
+            hashes.append(await future)
+            if progress and done % progress_step == 0 and done < len(images):
+                await progress(done, len(images))
+    finally:
+        # 关闭进程池要等子进程退出，放到线程中，不阻塞事件循环
+        await asyncio.to_thread(pool.shutdown, True, cancel_futures=True)
+    return group_duplicates(hashes, added)
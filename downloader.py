@@ -0,0 +1,102 @@
+"""
+下载模块
+复用连接池流式下载到临时文件，限制大小、类型、超时和并发数
+"""
+import os
+import shutil
+import asyncio
+import tempfile
+from typing import Optional, Tuple
+import aiohttp
+
+
+class DownloadError(Exception):
+    pass
+
+
+class Downloader:
+    def __init__(self, tmp_dir: str, max_bytes: int = 20 * 1024 * 1024, max_concurrency: int = 4,
+                 timeout: int = 30, allowed_types: Tuple[str, ...] = ("image/",), chunk_size: int = 64 * 1024):
+        """
+        初始化下载器
+
+        Args:
+            tmp_dir: 临时文件目录，应与图库在同一文件系统，方便直接重命名入库
+            max_bytes: 单个文件大小上限
+            max_concurrency: 同时进行的下载数
+            timeout: 单次下载的总超时（秒）
+            allowed_types: 允许的Content-Type前缀，为空表示不限制
+            chunk_size: 每次读取的块大小
+        """
+        self.tmp_dir = tmp_dir
+        self.max_bytes = max_bytes
+        self.timeout = aiohttp.ClientTimeout(total=timeout)
+        self.allowed_types = allowed_types
+        self.chunk_size = chunk_size
+        self._limit = max_concurrency
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._session: Optional[aiohttp.ClientSession] = None
+        os.makedirs(tmp_dir, exist_ok=True)
+
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """获取共享的HTTP会话"""
+        if self._session is None or self._session.closed:
+            connector = aiohttp.TCPConnector(limit=self._limit * 2, ttl_dns_cache=300)
+            self._session = aiohttp.ClientSession(connector=connector, timeout=self.timeout)
+        return self._session
+
+    async def fetch(self, url: str) -> str:
+        """下载到临时文件并返回路径，调用方负责移走或删除该文件"""
+        if not url.startswith(("http://", "https://")):
+            raise DownloadError(f"不支持的地址: {url}")
+        async with self._semaphore:
+            session = await self._get_session()
+            async with session.get(url) as resp:
+                if resp.status != 200:
+                    raise DownloadError(f"下载失败，状态码 {resp.status}")
+                content_type = resp.headers.get("Content-Type", "")
+                if self.allowed_types and not content_type.startswith(self.allowed_types):
+                    raise DownloadError(f"不支持的文件类型: {content_type or '未知'}")
+                if resp.content_length is not None and resp.content_length > self.max_bytes:
+                    raise DownloadError("文件过大")
+
+                fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+                size = 0
+                try:
+                    with os.fdopen(fd, "wb") as f:
+                        async for chunk in resp.content.iter_chunked(self.chunk_size):
+                            size += len(chunk)
+                            if size > self.max_bytes:
+                                raise DownloadError("文件过大")
+                            f.write(chunk)
+                except BaseException:
+                    os.remove(tmp_path)
+                    raise
+                return tmp_path
+
+    @staticmethod
+    def local_path(url: str) -> Optional[str]:
+        """平台已保存到本地的图片（file://地址或文件路径），不是本地文件时返回None"""
+        if url.startswith(("http://", "https://")):
+            return None
+        path = url[len("file://"):] if url.startswith("file://") else url
+        return path if os.path.isfile(path) else None
+
+    def copy_local(self, path: str) -> str:
+        """把本地图片复制到临时文件并返回路径，同样限制大小，原文件保留；应在线程中调用"""
+        if os.path.getsize(path) > self.max_bytes:
+            raise DownloadError("文件过大")
+        fd, tmp_path = tempfile.mkstemp(dir=self.tmp_dir, suffix=".part")
+        try:
+            with os.fdopen(fd, "wb") as dst, open(path, "rb") as src:
+                shutil.copyfileobj(src, dst, self.chunk_size)
+        except BaseException:
+            os.remove(tmp_path)
+            raise
+        return tmp_path
+
+    async def close(self):
+        """关闭HTTP会话"""
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+        self._session = None
@@ -1,13 +1,51 @@
 import os
 import json
+import time
 import random
-from typing import Optional, List, Dict
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from functools import partial
+from typing import Optional, List, Dict, Callable, Awaitable
+import heapq
+import bisect
 from PIL import Image
 import io
+import shutil
+from .thumbnail import DerivativeCache
+from .matcher import KeywordMatcher
+from .blobstore import BlobStore
+from .dedup import pixel_hash
+from .metrics import metrics
+
+MANIFEST_FILE = "manifest.json"
+
+
+def last_used(entry: Dict) -> float:
+    """图片最近一次被查看的时间，没有查看过时取入库时间"""
+    return entry.get("viewed") or entry["added"]
+
+
+def valid_name(name: str) -> bool:
+    """图库名会用作目录名，不能跳出图库目录，也不能与.blobs等内部目录冲突"""
+    return bool(name) and not name.startswith(".") and not any(c in name for c in "/\\\0")
+
+
+def move_to_trash(path: str, trash_dir: Optional[str]):
+    """把目录改名移入回收站，由后台任务慢慢删除；没有回收站时直接删除"""
+    if not os.path.exists(path):
+        return
+    if trash_dir is None:
+        shutil.rmtree(path, ignore_errors=True)
+        return
+    os.makedirs(trash_dir, exist_ok=True)
+    os.replace(path, os.path.join(trash_dir, f"{time.time_ns()}-{os.path.basename(path)}"))
+
 
 class Gallery:
     def __init__(self, name: str, path: str, creator_id: str, creator_name: str, 
-                 capacity: int = 200, compress: bool = True, duplicate: bool = True, fuzzy: bool = False):
+                 capacity: int = 200, compress: bool = True, duplicate: bool = True, fuzzy: bool = False,
+                 max_bytes: int = 0, store: Optional[BlobStore] = None):
         self.name = name
         self.path = path
         self.creator_id = creator_id
@@ -16,59 +54,282 @@ class Gallery:
         self.compress = compress
         self.duplicate = duplicate
         self.fuzzy = fuzzy
+        self.max_bytes = max_bytes  # 空间上限（字节），0表示不限制
+        self.global_max_bytes = 0  # 由GalleryManager设置，所有图库的总空间上限
         self.keywords = []
+        self.derivatives: Optional[DerivativeCache] = None  # 由GalleryManager设置
+        self.send_size = 0  # 发送图片的最大边长，0表示发送原图
+        self.trash_dir: Optional[str] = None  # 由GalleryManager设置，清空和删除时文件先移入回收站
         os.makedirs(path, exist_ok=True)
+        # 图片保存在共享存储中，图库只记录引用清单
+        self.store = store or BlobStore(os.path.join(path, ".blobs"))
+        self.images: List[Dict] = []  # [{"id", "blob", "size", "added", "pixels", "viewed"}]
+        self._lock = threading.RLock()
+        self._views_dirty = False
+        self.on_added: Optional[Callable[["Gallery", Dict], None]] = None  # 由GalleryManager设置，用于全局空间限制
+        self.on_changed: Optional[Callable[[int, int], None]] = None  # 由GalleryManager设置，参数为图片数和字节数的变化
+        self.modified = 0.0  # 最近一次增删图片的时间，保存在清单中
+        self._load_manifest()
+        self.used_bytes = sum(entry["size"] for entry in self.images)
+
+    def _load_manifest(self):
+        """加载图片清单，并把旧版直接存放在目录中的图片迁移到共享存储"""
+        manifest_file = os.path.join(self.path, MANIFEST_FILE)
+        exists = os.path.exists(manifest_file)
+        if exists:
+            with open(manifest_file, "r", encoding="utf-8") as f:
+                manifest = json.load(f)
+            if isinstance(manifest, list):
+                # 旧版清单只有图片列表，取最后入库的时间
+                self.images = manifest
+                self.modified = max((entry["added"] for entry in self.images), default=0.0)
+            else:
+                self.images = manifest["images"]
+                self.modified = manifest.get("modified", 0.0)
+
+        legacy = sorted(f for f in os.listdir(self.path)
+                        if f != MANIFEST_FILE and not f.startswith(".")
+                        and os.path.isfile(os.path.join(self.path, f)))
+        for filename in legacy:
+            filepath = os.path.join(self.path, filename)
+            added = os.path.getmtime(filepath)
+            digest, size = self.store.put_file(filepath)
+            self.images.append(self._new_entry(os.path.splitext(filename)[0], digest, size, added=added))
+            self.modified = max(self.modified, added)
+        if not exists and not legacy:
+            # 新建的图库，记下创建时间
+            self.modified = time.time()
+        if legacy or not exists:
+            self._save_manifest()
+
+    def _save_manifest(self):
+        """保存图片清单和图库的更新时间"""
+        manifest_file = os.path.join(self.path, MANIFEST_FILE)
+        tmp_file = manifest_file + ".tmp"
+        with metrics.timer("gallery_manifest_save_seconds"):
+            with open(tmp_file, "w", encoding="utf-8") as f:
+                json.dump({"modified": self.modified, "images": self.images}, f, ensure_ascii=False)
+            os.replace(tmp_file, manifest_file)
+        self._views_dirty = False
+
+    def flush_views(self):
+        """把查看记录写回清单"""
+        with self._lock:
+            if self._views_dirty:
+                self._save_manifest()
+
+    def _new_entry(self, label: str, digest: str, size: int, pixels: Optional[str] = None,
+                   added: Optional[float] = None) -> Dict:
+        """生成清单条目，编号由内容哈希决定，删除图片后不会重名"""
+        image_id = f"{label}_{digest[:12]}"
+        ids = {entry["id"] for entry in self.images}
+        n = 1
+        while image_id in ids:
+            n += 1
+            image_id = f"{label}_{digest[:12]}_{n}"
+        return {"id": image_id, "blob": digest, "size": size,
+                "added": added if added is not None else time.time(), "pixels": pixels}
+
+    def _find_same(self, pixels: Optional[str]) -> bool:
+        """检查图库中是否已有相同图片"""
+        if pixels is None:
+            return False
+        for entry in self.images:
+            if entry.get("pixels") is None:
+                # 旧图片首次比较时补算像素哈希
+                entry["pixels"] = pixel_hash(self.store.path(entry["blob"]))
+            if entry["pixels"] == pixels:
+                return True
+        return False
 
     def add_image(self, image: bytes, label: str = "") -> str:
         """添加图片到图库"""
-        if len(os.listdir(self.path)) >= self.capacity:
-            raise Exception(f"图库【{self.name}】已达到容量上限")
-        
-        # 检查重复
-        if self.duplicate:
-            for filename in os.listdir(self.path):
-                if self._is_same_image(image, os.path.join(self.path, filename)):
+        with metrics.timer("gallery_add_seconds"), self._lock:
+            if len(self.images) >= self.capacity:
+                raise Exception(f"图库【{self.name}】已达到容量上限")
+
+            # 检查重复
+            pixels = pixel_hash(io.BytesIO(image))
+            if self.duplicate and self._find_same(pixels):
+                return f"图片已存在于图库【{self.name}】中"
+
+            # 压缩图片
+            if self.compress:
+                image = self._compress_image(image)
+            self._check_size(len(image))
+
+            # 保存图片
+            digest, size = self.store.put_bytes(image)
+            entry = self._new_entry(label, digest, size, pixels)
+            evicted = self._append(entry)
+        return self._added_message(entry, evicted)
+
+    def add_image_file(self, file_path: str, label: str = "") -> str:
+        """把下载好的临时文件加入图库，无需压缩时直接移入存储，不再复制"""
+        try:
+            if self.compress:
+                with open(file_path, "rb") as f:
+                    return self.add_image(f.read(), label)
+
+            with metrics.timer("gallery_add_seconds"), self._lock:
+                if len(self.images) >= self.capacity:
+                    raise Exception(f"图库【{self.name}】已达到容量上限")
+                self._check_size(os.path.getsize(file_path))
+                pixels = pixel_hash(file_path)
+                if self.duplicate and self._find_same(pixels):
                     return f"图片已存在于图库【{self.name}】中"
+                digest, size = self.store.put_file(file_path)
+                entry = self._new_entry(label, digest, size, pixels)
+                evicted = self._append(entry)
+            return self._added_message(entry, evicted)
+        finally:
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def _changed(self, images: int, size: int):
+        """增删图片后更新修改时间，并通知GalleryManager更新汇总"""
+        self.modified = time.time()
+        if self.on_changed:
+            self.on_changed(images, size)
+
+    def _check_size(self, size: int):
+        """单张图片超过空间上限时拒绝入库，否则会先淘汰掉其他所有图片"""
+        for limit, scope in ((self.max_bytes, f"图库【{self.name}】"), (self.global_max_bytes, "所有图库")):
+            if 0 < limit < size:
+                raise Exception(f"图片大小超过{scope}的空间上限")
 
-        # 压缩图片
-        if self.compress:
-            image = self._compress_image(image)
+    def _append(self, entry: Dict) -> int:
+        """加入清单，超出空间上限时淘汰最久未查看的图片，返回淘汰数量"""
+        self.images.append(entry)
+        self.used_bytes += entry["size"]
+        self._changed(1, entry["size"])
+        evicted = self._evict(entry)
+        self._save_manifest()
+        return evicted
 
-        # 保存图片
-        filename = f"{label}_{len(os.listdir(self.path)) + 1}.png"
-        filepath = os.path.join(self.path, filename)
-        with open(filepath, "wb") as f:
-            f.write(image)
+    def _evict(self, protected: Optional[Dict] = None) -> int:
+        """淘汰最久未查看的图片直到不超出空间上限，不写清单，返回淘汰数量"""
+        excess = self.used_bytes - self.max_bytes
+        if self.max_bytes <= 0 or excess <= 0:
+            return 0
+        evicted = []
+        for old in sorted(self.images, key=last_used):
+            if excess <= 0:
+                break
+            if old is not protected:
+                evicted.append(old)
+                excess -= old["size"]
+        if evicted:
+            self._release(evicted)
+        return len(evicted)
+
+    def set_max_bytes(self, max_bytes: int) -> int:
+        """设置空间上限，立即淘汰超出的图片，返回淘汰数量"""
+        with self._lock:
+            self.max_bytes = max_bytes
+            evicted = self._evict()
+            if evicted:
+                self._save_manifest()
+            return evicted
+
+    def _added_message(self, entry: Dict, evicted: int) -> str:
+        """入库后的提示，并检查全局空间限制（不持有图库锁，避免与其他图库互相等待）"""
+        if self.on_added:
+            self.on_added(self, entry)
+        if evicted:
+            return f"图片已添加到图库【{self.name}】中，已淘汰{evicted}张最久未查看的图片"
         return f"图片已添加到图库【{self.name}】中"
 
     def delete_image(self, index: Optional[int] = None) -> str:
         """删除图库中的图片"""
-        if index is None:
-            # 删除整个图库
-            for filename in os.listdir(self.path):
-                os.remove(os.path.join(self.path, filename))
-            return f"图库【{self.name}】已清空"
-        
-        # 删除指定图片
-        files = sorted(os.listdir(self.path))
-        if 1 <= index <= len(files):
-            os.remove(os.path.join(self.path, files[index - 1]))
-            return f"已删除图库【{self.name}】中的第{index}张图片"
-        return f"图库【{self.name}】中没有第{index}张图片"
+        with self._lock:
+            if index is None:
+                # 清空图库，只改引用计数和清单，文件留给后台删除
+                self.store.release_many([entry["blob"] for entry in self.images], defer=True)
+                self._changed(-len(self.images), -self.used_bytes)
+                self.images = []
+                self.used_bytes = 0
+                self._save_manifest()
+                if self.derivatives:
+                    move_to_trash(self.derivatives.cache_dir, self.trash_dir)
+                    self.derivatives.clear()
+                return f"图库【{self.name}】已清空"
+
+            # 删除指定图片
+            if 1 <= index <= len(self.images):
+                self._release([self.images[index - 1]])
+                self._save_manifest()
+                return f"已删除图库【{self.name}】中的第{index}张图片"
+            return f"图库【{self.name}】中没有第{index}张图片"
+
+    def _release(self, entries: List[Dict]):
+        """从清单中移除图片并释放引用"""
+        ids = {entry["id"] for entry in entries}
+        self.images = [entry for entry in self.images if entry["id"] not in ids]
+        size = sum(entry["size"] for entry in entries)
+        self.used_bytes -= size
+        self._changed(-len(entries), -size)
+        if self.derivatives:
+            # 同一图库中可能多次引用同一份数据，仍被引用时保留缩放图
+            remaining = {entry["blob"] for entry in self.images}
+            for entry in entries:
+                if entry["blob"] not in remaining:
+                    self.derivatives.invalidate(self.store.path(entry["blob"]), entry["blob"])
+        self.store.release_many([entry["blob"] for entry in entries])
+
+    def list_images(self) -> List[Dict]:
+        """获取图库中所有图片的清单条目（附带文件路径）"""
+        with self._lock:
+            return [dict(entry, path=self.store.path(entry["blob"])) for entry in self.images]
+
+    def remove_images(self, image_ids: List[str]) -> int:
+        """批量删除图片并一次性写回清单，返回删除数量"""
+        with self._lock:
+            ids = set(image_ids)
+            entries = [entry for entry in self.images if entry["id"] in ids]
+            if entries:
+                self._release(entries)
+                self._save_manifest()
+            return len(entries)
 
     def get_image(self, index: Optional[int] = None) -> Optional[str]:
         """获取图库中的图片"""
-        files = sorted(os.listdir(self.path))
-        if not files:
+        images = self.images
+        if not images:
             return None
         
         if index is None:
             # 随机返回一张图片
-            return os.path.join(self.path, random.choice(files))
-        
-        if 1 <= index <= len(files):
-            return os.path.join(self.path, files[index - 1])
-        return None
+            entry = random.choice(images)
+        elif 1 <= index <= len(images):
+            entry = images[index - 1]
+        else:
+            return None
+
+        # 记录查看时间，供空间淘汰使用，清单在下次写入或定期刷新时落盘
+        entry["viewed"] = time.time()
+        self._views_dirty = True
+        return self.store.path(entry["blob"])
+
+    def destroy(self):
+        """释放所有引用并把图库目录移入回收站"""
+        with self._lock:
+            self.store.release_many([entry["blob"] for entry in self.images], defer=True)
+            self._changed(-len(self.images), -self.used_bytes)
+            self.images = []
+            self.used_bytes = 0
+            move_to_trash(self.path, self.trash_dir)
+            if self.derivatives:
+                move_to_trash(self.derivatives.cache_dir, self.trash_dir)
+
+    def get_send_path(self, image_path: str) -> str:
+        """获取发送用的图片路径，优先使用缓存的缩放图"""
+        if not self.derivatives or self.send_size <= 0:
+            return image_path
+        try:
+            return self.derivatives.get(image_path, self.send_size, self.store.digest_of(image_path))
+        except Exception:
+            return image_path
 
     def get_info(self) -> Dict:
         """获取图库信息"""
@@ -80,8 +341,18 @@ class Gallery:
             "compress": self.compress,
             "duplicate": self.duplicate,
             "fuzzy": self.fuzzy,
+            "max_bytes": self.max_bytes,
             "keywords": self.keywords,
-            "image_count": len(os.listdir(self.path))
+            "image_count": len(self.images)
+        }
+
+    def stats(self) -> Dict:
+        """图库的汇总信息，随增删图片实时更新，不读取磁盘"""
+        return {
+            "image_count": len(self.images),
+            "used_bytes": self.used_bytes,
+            "modified": self.modified,
+            "keyword_count": len(self.keywords)
         }
 
     def _compress_image(self, image_data: bytes) -> bytes:
@@ -105,15 +376,36 @@ class Gallery:
             return False
 
 class GalleryManager:
-    def __init__(self, base_dir: str, info_file: str, default_gallery_info: Dict):
+    def __init__(self, base_dir: str, info_file: str, default_gallery_info: Dict,
+                 send_size: int = 0, cache_bytes: int = 256 * 1024 * 1024, global_max_bytes: int = 0,
+                 io_workers: int = 4):
         self.base_dir = base_dir
         self.info_file = info_file
         self.default_gallery_info = default_gallery_info
+        self.send_size = send_size
+        self.cache_bytes = cache_bytes
+        self.global_max_bytes = global_max_bytes  # 所有图库实际占用的上限，0表示不限制
+        self._budget_lock = threading.Lock()
+        self.cache_dir = os.path.join(base_dir, ".derivatives")
+        self.trash_dir = os.path.join(base_dir, ".trash")
+        # 图库的文件读写都放到这个线程池里，不阻塞事件循环
+        self.executor = ThreadPoolExecutor(max_workers=max(1, io_workers), thread_name_prefix="gallery-io")
+        self.store = BlobStore(os.path.join(base_dir, ".blobs"))
         self.galleries: Dict[str, Gallery] = {}
+        self.names: List[str] = []  # 按名称排序的图库名，列表分页用
+        self.total_images = 0  # 所有图库的图片数和引用总大小，随增删图片更新
+        self.total_bytes = 0
+        self._stats_lock = threading.Lock()
         self.exact_keywords: List[str] = []
         self.fuzzy_keywords: List[str] = []
+        self.matcher = KeywordMatcher()
         os.makedirs(base_dir, exist_ok=True)
         self._load_info()
+        self.names = sorted(self.galleries)
+        self.total_images = sum(len(gallery.images) for gallery in self.galleries.values())
+        self.total_bytes = sum(gallery.used_bytes for gallery in self.galleries.values())
+        self._rebuild_matcher()
+        self._reconcile_store()
 
     def _load_info(self):
         """加载图库信息"""
@@ -123,17 +415,227 @@ class GalleryManager:
                 self.exact_keywords = info.get("exact_keywords", [])
                 self.fuzzy_keywords = info.get("fuzzy_keywords", [])
                 for gallery_info in info.get("galleries", []):
-                    self.galleries[gallery_info["name"]] = Gallery(**gallery_info)
+                    gallery_info.pop("image_count", None)
+                    keywords = gallery_info.pop("keywords", [])
+                    gallery_info.setdefault("path", os.path.join(self.base_dir, gallery_info["name"]))
+                    gallery = Gallery(**gallery_info, store=self.store)
+                    gallery.keywords = keywords
+                    self._attach_cache(gallery)
+                    self.galleries[gallery_info["name"]] = gallery
+
+    def _attach_cache(self, gallery: Gallery):
+        """为图库挂载衍生图缓存和全局空间检查"""
+        gallery.on_added = self._enforce_global_budget
+        gallery.on_changed = self._count
+        gallery.send_size = self.send_size
+        gallery.global_max_bytes = self.global_max_bytes
+        gallery.trash_dir = self.trash_dir
+        if self.send_size > 0:
+            gallery.derivatives = DerivativeCache(os.path.join(self.cache_dir, gallery.name), self.cache_bytes)
+
+    def _count(self, images: int, size: int):
+        """累加图片数和引用大小的变化"""
+        with self._stats_lock:
+            self.total_images += images
+            self.total_bytes += size
+
+    def _register(self, gallery: Gallery):
+        """加入图库列表"""
+        self.galleries[gallery.name] = gallery
+        bisect.insort(self.names, gallery.name)
+        self._count(len(gallery.images), gallery.used_bytes)
+
+    def page(self, page: int, size: int) -> List[Gallery]:
+        """按名称排序的第page页图库（从1开始）"""
+        start = (page - 1) * size
+        return [self.galleries[name] for name in self.names[start:start + size]]
+
+    def _rebuild_matcher(self):
+        """根据所有图库的匹配词重建匹配器"""
+        self.matcher = KeywordMatcher()
+        for gallery in self.galleries.values():
+            for keyword in gallery.keywords:
+                self.matcher.add(keyword, gallery.name, gallery.fuzzy)
+        self._sync_keyword_lists()
+
+    def _sync_keyword_lists(self):
+        """同步精准/模糊匹配词列表"""
+        self.exact_keywords = sorted(self.matcher.exact)
+        self.fuzzy_keywords = sorted(self.matcher.fuzzy)
+
+    def _reconcile_store(self):
+        """按所有图库的清单核对存储的引用计数"""
+        counts: Dict[str, int] = {}
+        for gallery in self.galleries.values():
+            for entry in gallery.images:
+                counts[entry["blob"]] = counts.get(entry["blob"], 0) + 1
+        self.store.reconcile(counts)
+
+    def _enforce_global_budget(self, gallery: Gallery, protected: Dict):
+        """
+        超出全局空间上限时，在所有图库中淘汰最久未查看的图片；
+        多处引用的图片删掉一处也不能腾出空间，不参与淘汰，每个图库的清单只写一次
+        """
+        if self.global_max_bytes <= 0 or self.store.physical_bytes() <= self.global_max_bytes:
+            return
+        with self._budget_lock:
+            excess = self.store.physical_bytes() - self.global_max_bytes
+            if excess <= 0:
+                return
+            refs = self.store.snapshot()
+            heap = [(last_used(entry), name, entry["id"], entry["blob"])
+                    for name, g in list(self.galleries.items())
+                    for entry in list(g.images)
+                    if entry is not protected and refs.get(entry["blob"], (0, 0))[0] == 1]
+            heapq.heapify(heap)
+            victims: Dict[str, List[str]] = {}
+            while heap and excess > 0:
+                _, name, image_id, digest = heapq.heappop(heap)
+                victims.setdefault(name, []).append(image_id)
+                excess -= refs[digest][1]
+            for name, image_ids in victims.items():
+                target = self.galleries.get(name)
+                if target:
+                    target.remove_images(image_ids)
+
+    def set_max_bytes(self, gallery: Gallery, max_bytes: int) -> int:
+        """设置图库空间上限并保存，返回立即淘汰的图片数；应在线程池中调用"""
+        evicted = gallery.set_max_bytes(max_bytes)
+        self._save_info()
+        return evicted
+
+    def flush(self):
+        """把所有图库的查看记录写回清单，并写回存储的引用计数"""
+        for gallery in list(self.galleries.values()):
+            gallery.flush_views()
+        self.store.flush()
+
+    def close(self):
+        """关闭文件读写线程池，写回线程池中最后的改动"""
+        self.executor.shutdown(wait=True)
+        self.store.flush()
+
+    async def run(self, func: Callable, *args):
+        """在图库线程池中执行"""
+        return await asyncio.get_running_loop().run_in_executor(self.executor, partial(func, *args))
+
+    async def add_image_async(self, gallery: Gallery, file_path: str) -> str:
+        """把下载好的图片加入图库"""
+        return await self.run(gallery.add_image_file, file_path)
+
+    async def delete_image_async(self, gallery: Gallery, index: Optional[int] = None) -> str:
+        """删除图库中的一张图片，不指定序号时清空图库（文件由purge删除）"""
+        return await self.run(gallery.delete_image, index)
+
+    async def create_gallery_async(self, name: str, creator_id: str, creator_name: str) -> Gallery:
+        """创建图库，目录在线程池中建立，图库列表只在事件循环中修改"""
+        gallery = await self.run(self._new_gallery, name, creator_id, creator_name)
+        if name in self.galleries:
+            # 等待期间已被同名请求创建
+            return self.galleries[name]
+        self._register(gallery)
+        await self.run(self._save_info)
+        return gallery
+
+    async def delete_gallery_async(self, name: str) -> str:
+        """删除图库，目录先移入回收站，文件由purge删除"""
+        gallery = self._detach(name)
+        if gallery is None:
+            return f"图库【{name}】不存在"
+        await self.run(self._destroy, gallery)
+        return f"图库【{name}】已删除"
+
+    def has_garbage(self) -> bool:
+        """是否有等待后台删除的文件"""
+        return bool(self.store.pending) or (os.path.isdir(self.trash_dir) and bool(os.listdir(self.trash_dir)))
+
+    def _trash_files(self) -> List[str]:
+        """回收站中的全部文件"""
+        files = []
+        for root, _, names in os.walk(self.trash_dir):
+            files.extend(os.path.join(root, name) for name in names)
+        return files
+
+    @staticmethod
+    def _remove_files(paths: List[str]) -> int:
+        removed = 0
+        for path in paths:
+            try:
+                os.remove(path)
+                removed += 1
+            except FileNotFoundError:
+                pass
+        return removed
+
+    def _remove_empty_dirs(self):
+        """删除回收站中已清空的目录，删除期间新移入的目录不是空的，会被保留"""
+        for root, _, _ in os.walk(self.trash_dir, topdown=False):
+            if root != self.trash_dir:
+                try:
+                    os.rmdir(root)
+                except OSError:
+                    pass
+
+    async def purge(self, progress: Optional[Callable[[int, int], Awaitable[None]]] = None,
+                    batch: int = 200, progress_step: int = 1000) -> int:
+        """
+        后台删除回收站中的目录和存储中引用已归零的图片，每批在线程池中执行，直到没有待删除的文件
+
+        Args:
+            progress: 进度回调，参数为已删除数和总数
+            batch: 每批删除的文件数
+            progress_step: 每删除多少个文件回调一次
+
+        Returns:
+            删除的文件数
+        """
+        done = 0
+        reported = 0
+        while True:
+            files = await self.run(self._trash_files)
+            digests = list(self.store.pending)
+            if not files and not digests:
+                break
+            total = done + len(files) + len(digests)
+            jobs = [(self._remove_files, files[i:i + batch]) for i in range(0, len(files), batch)]
+            jobs += [(self.store.purge, digests[i:i + batch]) for i in range(0, len(digests), batch)]
+            for func, chunk in jobs:
+                removed = await self.run(func, chunk)
+                done += removed
+                metrics.inc("gallery_purged_files_total", removed)
+                if progress and done - reported >= progress_step and done < total:
+                    reported = done
+                    await progress(done, total)
+            await self.run(self._remove_empty_dirs)
+        return done
+
+    def storage_report(self) -> Dict:
+        """统计去重存储节省的空间"""
+        logical = self.total_bytes
+        physical = self.store.physical_bytes()
+        return {
+            "galleries": len(self.galleries),
+            "images": self.total_images,
+            "blobs": len(self.store.refs),
+            "logical_bytes": logical,
+            "physical_bytes": physical,
+            "saved_bytes": logical - physical
+        }
 
     def _save_info(self):
         """保存图库信息"""
         info = {
             "exact_keywords": self.exact_keywords,
             "fuzzy_keywords": self.fuzzy_keywords,
-            "galleries": [gallery.get_info() for gallery in self.galleries.values()]
+            "galleries": [gallery.get_info() for gallery in list(self.galleries.values())]
         }
-        with open(self.info_file, "w", encoding="utf-8") as f:
-            json.dump(info, f, ensure_ascii=False, indent=2)
+        with metrics.timer("gallery_info_save_seconds"):
+            with open(self.info_file, "w", encoding="utf-8") as f:
+                json.dump(info, f, ensure_ascii=False, indent=2)
+
+    def save_info(self):
+        """在图库外修改了图库设置或图片后保存图库信息，应通过run在线程池中调用"""
+        self._save_info()
 
     def get_gallery(self, name: str) -> Optional[Gallery]:
         """获取图库"""
@@ -141,9 +643,18 @@ class GalleryManager:
 
     def create_gallery(self, name: str, creator_id: str, creator_name: str) -> Gallery:
         """创建图库"""
+        gallery = self._new_gallery(name, creator_id, creator_name)
+        self._register(gallery)
+        self._save_info()
+        return gallery
+
+    def _new_gallery(self, name: str, creator_id: str, creator_name: str) -> Gallery:
+        """生成图库对象并建好目录，尚未加入图库列表"""
         if name in self.galleries:
             raise Exception(f"图库【{name}】已存在")
-        
+        if not valid_name(name):
+            raise Exception(f"图库名【{name}】不能包含路径分隔符，也不能以.开头")
+
         gallery_info = self.default_gallery_info.copy()
         gallery_info.update({
             "name": name,
@@ -152,27 +663,86 @@ class GalleryManager:
             "creator_name": creator_name
         })
         
-        gallery = Gallery(**gallery_info)
-        self.galleries[name] = gallery
-        self._save_info()
+        gallery = Gallery(**gallery_info, store=self.store)
+        self._attach_cache(gallery)
         return gallery
 
     def delete_gallery(self, name: str) -> str:
         """删除图库"""
-        if name not in self.galleries:
+        gallery = self._detach(name)
+        if gallery is None:
             return f"图库【{name}】不存在"
-        
-        gallery = self.galleries[name]
-        for filename in os.listdir(gallery.path):
-            os.remove(os.path.join(gallery.path, filename))
-        os.rmdir(gallery.path)
-        del self.galleries[name]
-        self._save_info()
+        self._destroy(gallery)
         return f"图库【{name}】已删除"
 
+    def _detach(self, name: str) -> Optional[Gallery]:
+        """把图库从列表和匹配器中移除"""
+        gallery = self.galleries.pop(name, None)
+        if gallery is None:
+            return None
+        del self.names[bisect.bisect_left(self.names, name)]
+        # 图片稍后在线程池中释放，先从汇总中扣除，不再接收通知
+        gallery.on_changed = None
+        self._count(-len(gallery.images), -gallery.used_bytes)
+        for keyword in gallery.keywords:
+            self.matcher.remove(keyword, name, gallery.fuzzy)
+        self._sync_keyword_lists()
+        return gallery
+
+    def _destroy(self, gallery: Gallery):
+        """释放已移除图库的引用，目录移入回收站"""
+        gallery.destroy()
+        self._save_info()
+
+    def add_keyword(self, name: str, keyword: str) -> str:
+        """为图库添加匹配词"""
+        gallery = self.galleries.get(name)
+        if not gallery:
+            return f"图库【{name}】不存在"
+        if keyword in gallery.keywords:
+            return f"图库【{name}】已有匹配词【{keyword}】"
+        gallery.keywords.append(keyword)
+        self.matcher.add(keyword, name, gallery.fuzzy)
+        self._sync_keyword_lists()
+        self._save_info()
+        return f"已为图库【{name}】添加匹配词【{keyword}】"
+
+    def remove_keyword(self, name: str, keyword: str) -> str:
+        """删除图库的匹配词"""
+        gallery = self.galleries.get(name)
+        if not gallery:
+            return f"图库【{name}】不存在"
+        if keyword not in gallery.keywords:
+            return f"图库【{name}】没有匹配词【{keyword}】"
+        gallery.keywords.remove(keyword)
+        self.matcher.remove(keyword, name, gallery.fuzzy)
+        self._sync_keyword_lists()
+        self._save_info()
+        return f"已删除图库【{name}】的匹配词【{keyword}】"
+
+    def set_fuzzy(self, name: str, fuzzy: bool) -> str:
+        """切换图库的匹配模式"""
+        gallery = self.galleries.get(name)
+        if not gallery:
+            return f"图库【{name}】不存在"
+        mode = "模糊匹配" if fuzzy else "精准匹配"
+        if gallery.fuzzy != fuzzy:
+            for keyword in gallery.keywords:
+                self.matcher.remove(keyword, name, gallery.fuzzy)
+                self.matcher.add(keyword, name, fuzzy)
+            gallery.fuzzy = fuzzy
+            self._sync_keyword_lists()
+            self._save_info()
+        return f"图库【{name}】已切换为{mode}"
+
+    def match(self, text: str) -> List[Gallery]:
+        """获取消息触发的图库"""
+        return [self.galleries[name] for name in self.matcher.match(text) if name in self.galleries]
+
     def get_gallery_by_keyword(self, keyword: str) -> List[Gallery]:
         """通过关键词获取图库"""
-        return [g for g in self.galleries.values() if keyword in g.keywords]
+        names = self.matcher.exact.get(keyword, set()) | self.matcher.fuzzy.get(keyword, set())
+        return [self.galleries[name] for name in names if name in self.galleries]
 
     def get_gallery_by_attribute(self, **kwargs) -> List[Gallery]:
         """通过属性获取图库"""
@@ -0,0 +1,53 @@
+"""
+课程表改动日志
+单门课程的增删改和停课、调教室以追加方式写入日志，不重写整个课程表文件，
+日志条数超过阈值时由插件保存完整课程表后清空
+"""
+import os
+import json
+import logging
+from typing import Dict, List
+
+
+class ScheduleJournal:
+    def __init__(self, path: str, compact_after: int = 1000):
+        """
+        初始化改动日志
+
+        Args:
+            path: 日志文件路径
+            compact_after: 累计多少条改动后需要保存完整课程表
+        """
+        self.path = path
+        self.compact_after = compact_after
+        self.logger = logging.getLogger("ScheduleJournal")
+        self.size = 0
+
+    def append(self, record: Dict) -> bool:
+        """追加一条改动，返回是否需要保存完整课程表"""
+        with open(self.path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(record, ensure_ascii=False, separators=(",", ":")) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.size += 1
+        return self.size >= self.compact_after
+
+    def replay(self) -> List[Dict]:
+        """读取全部改动，跳过写入中断的行"""
+        records = []
+        if not os.path.exists(self.path):
+            return records
+        with open(self.path, "r", encoding="utf-8") as f:
+            for line in f:
+                try:
+                    records.append(json.loads(line))
+                except json.JSONDecodeError:
+                    self.logger.warning("跳过损坏的课程表改动记录")
+        self.size = len(records)
+        return records
+
+    def truncate(self):
+        """保存完整课程表后清空日志"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.size = 0
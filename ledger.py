@@ -0,0 +1,126 @@
+"""
+提醒发送记录模块
+按天记录已送达的提醒（用户、课程、哪一次上课），每条记录是8字节哈希，追加写入当天的文件，
+重启后读回，避免重复发送
+"""
+import os
+import struct
+import hashlib
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, Iterable, Optional, Set
+from .clock import SystemClock
+
+RECORD = struct.Struct("<Q")
+
+
+class SentLedger:
+    def __init__(self, ledger_dir: str, keep_days: int = 2, clock=None):
+        """
+        初始化发送记录
+
+        Args:
+            ledger_dir: 记录文件目录
+            keep_days: 保留最近几天的记录（跨零点的提醒需要查前一天）
+            clock: 时钟，决定记录写入哪一天，默认使用系统时间
+        """
+        self.ledger_dir = ledger_dir
+        self.keep_days = keep_days
+        self.clock = clock or SystemClock()
+        self.logger = logging.getLogger("SentLedger")
+        self.days: Dict[date, Set[int]] = {}  # 日期 -> 已发送记录的哈希
+        os.makedirs(ledger_dir, exist_ok=True)
+        self._load(self.clock.now().date())
+        self._last_tick = self._read_last_tick()
+        self._tick_fd: Optional[int] = None
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "little")
+
+    def _path(self, day: date) -> str:
+        return os.path.join(self.ledger_dir, f"sent-{day:%Y%m%d}.bin")
+
+    def _load(self, today: date):
+        """读取保留期内的记录，删除过期文件"""
+        keep = {today - timedelta(days=i) for i in range(self.keep_days)}
+        for name in os.listdir(self.ledger_dir):
+            if not (name.startswith("sent-") and name.endswith(".bin")):
+                continue
+            try:
+                day = datetime.strptime(name[5:13], "%Y%m%d").date()
+            except ValueError:
+                continue
+            path = os.path.join(self.ledger_dir, name)
+            if day not in keep:
+                os.remove(path)
+                continue
+            with open(path, "rb") as f:
+                data = f.read()
+            # 忽略写入中断的半条记录
+            data = data[:len(data) - len(data) % RECORD.size]
+            self.days[day] = {value for (value,) in RECORD.iter_unpack(data)}
+
+    def _rotate(self, today: date):
+        """跨天时丢弃过期记录"""
+        oldest = today - timedelta(days=self.keep_days - 1)
+        for day in [day for day in self.days if day < oldest]:
+            del self.days[day]
+            try:
+                os.remove(self._path(day))
+            except FileNotFoundError:
+                pass
+
+    def seen(self, key: str) -> bool:
+        """是否已经发送过"""
+        value = self._hash(key)
+        return any(value in sent for sent in self.days.values())
+
+    def mark(self, keys: Iterable[str]):
+        """记录已送达的提醒，一批记录只写一次文件"""
+        values = [self._hash(key) for key in keys]
+        if not values:
+            return
+        today = self.clock.now().date()
+        if today not in self.days:
+            self._rotate(today)
+        sent = self.days.setdefault(today, set())
+        values = [value for value in values if value not in sent]
+        if not values:
+            return
+        sent.update(values)
+        try:
+            with open(self._path(today), "ab") as f:
+                f.write(b"".join(RECORD.pack(value) for value in values))
+        except OSError as e:
+            self.logger.error(f"写入发送记录失败: {e}")
+
+    def _read_last_tick(self) -> Optional[datetime]:
+        try:
+            with open(os.path.join(self.ledger_dir, "last_tick"), "r", encoding="utf-8") as f:
+                return datetime.fromisoformat(f.read().strip())
+        except (OSError, ValueError):
+            return None
+
+    @property
+    def last_tick(self) -> Optional[datetime]:
+        """上次完成提醒检查的分钟"""
+        return self._last_tick
+
+    @last_tick.setter
+    def last_tick(self, minute: datetime):
+        # 每分钟都会写，固定长度原地覆盖，不重新创建文件
+        self._last_tick = minute
+        if self._tick_fd is None:
+            self._tick_fd = os.open(os.path.join(self.ledger_dir, "last_tick"), os.O_RDWR | os.O_CREAT, 0o644)
+        os.pwrite(self._tick_fd, minute.replace(microsecond=0).isoformat().encode("ascii"), 0)
+
+    def close(self):
+        """关闭上次检查时间文件"""
+        if self._tick_fd is not None:
+            os.close(self._tick_fd)
+            self._tick_fd = None
+
+    def stats(self) -> Dict[str, int]:
+        """各天的记录数"""
+        return {f"{day:%Y-%m-%d}": len(sent) for day, sent in sorted(self.days.items())}
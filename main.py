@@ -10,10 +10,30 @@ from astrbot.api.event.filter import EventMessageType
 from astrbot.api.star import Context, Star, register
 import asyncio
 import os
+import re
+import time
 import json
 import datetime
 from .parser import parse_word, parse_image, parse_xlsx, parse_text_schedule
 from .gallery import Gallery, GalleryManager
+from .downloader import Downloader, DownloadError
+from .collector import AutoCollector, CollectItem
+from .dedup import find_duplicates
+from .prefilter import ScheduleClassifier
+from .metrics import metrics
+from .profiler import Profiler
+from .sender import OutboundQueue, MentionBatcher, PRIORITY_REMINDER
+from .reminder import ReminderScheduler, WEEKDAYS, render_reminder, course_signature, apply_exception, class_start
+from .timetable import PeriodTable
+from .school_calendar import SchoolCalendar, parse_weeks, in_week
+from .shard import ShardPool
+from .classes import ClassRegistry, apply_overrides, schedule_key
+from .journal import ScheduleJournal
+from .ledger import SentLedger
+from .snapshot import SchedulerSnapshot
+from .occupancy import OccupancyIndex
+from .render import TimetableRenderer
+from .clock import SystemClock
 import shutil
 import traceback
 import random
@@ -21,7 +41,7 @@ from PIL import Image
 import io
 from datetime import datetime, timedelta
 import locale
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 from astrbot.api import logger
 import astrbot.api.message_components as Comp
 from astrbot.core.pipeline import Pipeline
@@ -83,23 +103,165 @@ COURSE_TEMPLATE = """【姓名同学学年学期课程安排】
 
 请留意课程周次及教室安排，合理规划学习时间！"""
 
-# 课程提醒模板
-REMINDER_TEMPLATE = """同学你好，待会有课哦
-上课时间（节次和时间）：
-课程名称
-教师：老师姓名
-上课地点：教室/场地"""
-
 @register("teheikcb", "teheiw192", "课程提醒插件", "1.0.0", "https://github.com/teheiw192/teheikcb")
 class CourseReminderPlugin(Star):
-    def __init__(self, context: Context, config: Dict):
+    def __init__(self, context: Context, config: Dict, clock=None):
         super().__init__(context)
         self.config = config
+        self.clock = clock or SystemClock()  # 模拟时传入虚拟时钟
         self.data_dir = os.path.join("data", "teheikcb")
         os.makedirs(self.data_dir, exist_ok=True)
-        self.schedules: Dict[str, Dict] = {}  # 用户ID -> {courses: List[Dict], settings: Dict}
+        self.schedules: Dict[str, Dict] = {}  # 用户ID -> {class_id, overrides, courses, settings, basic_info}
+        self.classes = ClassRegistry()  # 按内容共享的班级课程表
+        self.journal = ScheduleJournal(os.path.join(self.data_dir, "schedules.journal"))
+        self.journal_seq = 0  # 最后一条已应用的改动序号
+        self.replayed: List[Tuple[int, str]] = []  # 启动时重放的改动（序号，用户）
+        self.occupancy = OccupancyIndex()  # 教室、教师占用索引，首次查询时建立
         self.reminder_tasks: Dict[str, asyncio.Task] = {}
+        self.dedup_tasks: Dict[str, asyncio.Task] = {}
+        self.purge_task: Optional[asyncio.Task] = None  # 后台删除图库文件
+        self.purge_origins: List[str] = []  # 等待删除完成通知的会话
         self.load_schedules()
+
+        # 性能指标
+        metrics_config = self.config.get("metrics_config", {})
+        metrics.enabled = metrics_config.get("enable", True)
+        self.metrics_file = metrics_config.get("prometheus_file", "")
+        self.profiler = Profiler(os.path.join(self.data_dir, "profiles"))
+
+        # 已送达提醒记录，重启后不重复发送
+        ledger_config = self.config.get("ledger_config", {})
+        self.ledger = SentLedger(os.path.join(self.data_dir, "ledger"), keep_days=ledger_config.get("keep_days", 2),
+                                 clock=self.clock)
+        self.catchup_minutes = ledger_config.get("catchup_minutes", 10)
+
+        # 提醒消息发送队列
+        sender_config = self.config.get("sender_config", {})
+        self.sender = OutboundQueue(
+            self._send_text,
+            platform_rate=sender_config.get("platform_rate", 20),
+            target_rate=sender_config.get("target_rate", 1),
+            max_merge=sender_config.get("max_merge", 5),
+            max_pending=sender_config.get("max_pending", 200000),
+            max_retries=sender_config.get("max_retries", 3),
+            max_inflight=sender_config.get("max_inflight", 64),
+            on_sent=self.ledger.mark
+        )
+        self.sender.start()
+
+        # 群提醒汇总：同一群同一次课的提醒合并为一条@成员的消息
+        group_config = self.config.get("group_reminder_config", {})
+        self.batcher: Optional[MentionBatcher] = None
+        if group_config.get("enable", False):
+            self.batcher = MentionBatcher(
+                self.sender,
+                window=group_config.get("window_seconds", 2),
+                max_mentions=group_config.get("max_mentions", 30)
+            )
+
+        # 作息时间表，配置变化时在提醒循环中重新编译
+        self.periods = PeriodTable(self.config.get("time_slots"))
+        self._time_slots = dict(self.periods.source)
+
+        # 校历：节假日、调休和教学周
+        self.calendar = self._load_calendar()
+
+        # 提醒调度，开启分片时由多个工作进程分担，主进程的调度器保持为空
+        self.scheduler = ReminderScheduler(self.config)
+        self.scheduler.set_calendar(self.calendar)
+        self.shards: Optional[ShardPool] = None
+        shard_config = self.config.get("shard_config", {})
+        if shard_config.get("enable", False):
+            try:
+                self.shards = ShardPool(
+                    self._scheduler_config(),
+                    os.path.join(self.data_dir, "shards"),
+                    workers=shard_config.get("workers", 4)
+                )
+                self.shards.load(self.schedules)
+                self.shards.calendar = self.calendar
+                self.shards.start()
+            except Exception as e:
+                logger.error(f"启动提醒分片失败，改为单进程提醒: {e}")
+                self.shards = None
+        snapshot_config = self.config.get("snapshot_config", {})
+        self.snapshot: Optional[SchedulerSnapshot] = None
+        self.snapshot_interval = snapshot_config.get("interval_minutes", 10) * 60
+        self._snapshot_meta_saved: Optional[Dict] = None  # 最近一次保存的快照版本
+        if self.shards:
+            pass  # 快照只保存主进程的调度器，分片时不需要
+        elif snapshot_config.get("enable", True):
+            self.snapshot = SchedulerSnapshot(os.path.join(self.data_dir, "scheduler.snapshot"))
+            self._warm_start()
+            asyncio.create_task(self.save_snapshots())
+        else:
+            self.scheduler.load(self.schedules)
+
+        # 课程表图片，按内容哈希缓存
+        render_config = self.config.get("render_config", {})
+        self.renderer: Optional[TimetableRenderer] = None
+        self._renders: Dict[str, asyncio.Future] = {}
+        if render_config.get("enable", False):
+            self.renderer = TimetableRenderer(
+                os.path.join(self.data_dir, "timetables"),
+                font_path=render_config.get("font_path", ""),
+                max_files=render_config.get("max_cache_files", 2000)
+            )
+
+        # 课程表预筛，只把像课程表的消息交给AI解析
+        prefilter_config = self.config.get("prefilter_config", {})
+        self.classifier = ScheduleClassifier(
+            enable=prefilter_config.get("enable", True),
+            min_length=prefilter_config.get("min_length", 40),
+            min_lines=prefilter_config.get("min_lines", 3),
+            threshold=prefilter_config.get("threshold", 4)
+        )
+
+        # 图库
+        gallery_config = self.config.get("gallery_config", {})
+        self.gm = GalleryManager(
+            os.path.join(self.data_dir, "galleries"),
+            os.path.join(self.data_dir, "gallery_info.json"),
+            {
+                "capacity": gallery_config.get("default_capacity", 200),
+                "compress": gallery_config.get("default_compress", True),
+                "duplicate": gallery_config.get("default_duplicate", True),
+                "fuzzy": gallery_config.get("default_fuzzy", False),
+                "max_bytes": gallery_config.get("default_max_mb", 0) * 1024 * 1024
+            },
+            send_size=gallery_config.get("send_size", 1280),
+            cache_bytes=gallery_config.get("derivative_cache_mb", 256) * 1024 * 1024,
+            global_max_bytes=gallery_config.get("global_max_mb", 0) * 1024 * 1024,
+            io_workers=gallery_config.get("io_workers", 4)
+        )
+        self.gallery_page_size = max(1, gallery_config.get("list_page_size", 20))
+        asyncio.create_task(self.flush_galleries())
+        if self.gm.has_garbage():
+            # 上次清空或删除图库后没删完的文件
+            self._start_purge()
+
+        # 下载
+        download_config = self.config.get("download_config", {})
+        self.downloader = Downloader(
+            os.path.join(self.data_dir, "tmp"),
+            max_bytes=download_config.get("max_size_mb", 20) * 1024 * 1024,
+            max_concurrency=download_config.get("max_concurrency", 4),
+            timeout=download_config.get("timeout", 30)
+        )
+
+        # 自动收集
+        collect_config = self.config.get("auto_collect_config", {})
+        self.collector: Optional[AutoCollector] = None
+        if collect_config.get("enable_collect", True):
+            self.collector = AutoCollector(
+                self.gm,
+                self.downloader,
+                white_list=collect_config.get("white_list", []),
+                collect_compressed=collect_config.get("collect_compressed_img", False),
+                compress_size=gallery_config.get("compress_size", 512),
+                max_queue=collect_config.get("max_queue", 256)
+            )
+            self.collector.start()
         asyncio.create_task(self.check_reminders())
 
     async def parse_course_with_ai(self, text: str) -> Tuple[List[Dict], Dict]:
@@ -119,12 +281,15 @@ class CourseReminderPlugin(Star):
 
         try:
             # 使用AstrBot的AI模型
-            pipeline = Pipeline()
-            response = await pipeline.llm_request(prompt)
+            with metrics.timer("llm_parse_seconds"):
+                pipeline = Pipeline()
+                response = await pipeline.llm_request(prompt)
+            metrics.inc("llm_requests_total")
             if response and response.content:
                 result = json.loads(response.content)
                 return result.get("courses", []), result.get("basic_info", {})
         except Exception as e:
+            metrics.inc("llm_failures_total")
             logger.error(f"AI解析课程表失败: {e}")
         
         return [], {}
@@ -135,25 +300,80 @@ class CourseReminderPlugin(Star):
         if os.path.exists(schedule_file):
             try:
                 with open(schedule_file, "r", encoding="utf-8") as f:
-                    self.schedules = json.load(f)
+                    self._restore_schedules(json.load(f))
             except Exception as e:
                 logger.error(f"加载课程表失败: {e}")
                 self.schedules = {}
 
+        # 重放上次保存后的单门课程改动
+        self.replayed = []
+        for record in self.journal.replay():
+            if record.get("seq", 0) <= self.journal_seq:
+                continue
+            try:
+                self._apply_delta(record)
+            except Exception as e:
+                logger.error(f"重放课程表改动失败: {e}")
+            self.journal_seq = record["seq"]
+            self.replayed.append((record["seq"], record.get("user")))
+
+    def _restore_schedules(self, data: Dict):
+        """从存储格式恢复课程表，旧格式（用户ID -> 完整课程表）按内容合并为班级课程表"""
+        self.classes = ClassRegistry()
+        self.schedules = {}
+        self.occupancy = OccupancyIndex()
+        self.journal_seq = data.pop("journal_seq", 0)
+        if "classes" in data and "users" in data:
+            for key, courses in data["classes"].items():
+                self.classes.restore(key, courses)
+            users = data["users"]
+        else:
+            users = {}
+            for user_id, user in data.items():
+                key, _ = self.classes.intern(user.pop("courses", []))
+                users[user_id] = {**user, "class_id": key, "overrides": []}
+            self.classes.members.clear()
+
+        for user_id, user in users.items():
+            key = user.get("class_id")
+            if key not in self.classes.classes:
+                key = user["class_id"] = schedule_key([])
+                self.classes.restore(key, [])
+            user.setdefault("overrides", [])
+            user["courses"] = apply_overrides(self.classes.acquire(key), user["overrides"])
+            self.schedules[user_id] = user
+        self.classes.prune()
+
     def save_schedules(self):
-        """保存所有用户的课程表"""
+        """保存所有用户的课程表，班级课程表只保存一份"""
         schedule_file = os.path.join(self.data_dir, "schedules.json")
         try:
-            with open(schedule_file, "w", encoding="utf-8") as f:
-                json.dump(self.schedules, f, ensure_ascii=False, indent=2)
+            with metrics.timer("schedules_save_seconds"):
+                data = {
+                    "journal_seq": self.journal_seq,
+                    "classes": self.classes.classes,
+                    "users": {
+                        user_id: {k: v for k, v in user.items() if k != "courses"}
+                        for user_id, user in self.schedules.items()
+                    }
+                }
+                tmp_file = schedule_file + ".tmp"
+                with open(tmp_file, "w", encoding="utf-8") as f:
+                    json.dump(data, f, ensure_ascii=False, indent=2)
+                os.replace(tmp_file, schedule_file)
+            # 完整课程表已包含所有改动
+            self.journal.truncate()
         except Exception as e:
             logger.error(f"保存课程表失败: {e}")
 
-    def get_user_settings(self, user_id: str) -> Dict:
-        """获取用户设置"""
+    def _ensure_user(self, user_id: str) -> Dict:
+        """获取用户数据，不存在时使用空课程表和默认设置创建"""
         if user_id not in self.schedules:
+            key, courses = self.classes.intern([])
             self.schedules[user_id] = {
-                "courses": [],
+                "class_id": key,
+                "overrides": [],
+                "courses": courses,
                 "settings": {
                     "enable_reminder": True,
                     "reminder_time": self.config.get("reminder_time", 30),
@@ -161,26 +381,168 @@ class CourseReminderPlugin(Star):
                 },
                 "basic_info": {}
             }
-        return self.schedules[user_id]["settings"]
+        return self.schedules[user_id]
+
+    def _set_courses(self, user_id: str, courses: List[Dict]):
+        """替换用户的整张课程表，内容与已有班级课程表相同时共用"""
+        user = self._ensure_user(user_id)
+        self.classes.release(user["class_id"])
+        user["class_id"], user["courses"] = self.classes.intern(courses)
+        user["overrides"] = []
+
+    def _apply_delta(self, record: Dict):
+        """在内存中应用一条单门课程改动"""
+        user = self._ensure_user(record["user"])
+        op = record["op"]
+        if op in ("add", "update", "remove"):
+            override = {k: v for k, v in record.items() if k not in ("user", "seq")}
+            user["overrides"].append(override)
+            user["courses"] = apply_overrides(self.classes.classes[user["class_id"]], user["overrides"])
+        elif op == "origin":
+            if record.get("origin"):
+                user["origin"] = record["origin"]
+            else:
+                user.pop("origin", None)
+        elif op == "exception":
+            exceptions = user.setdefault("exceptions", {})
+            exceptions.setdefault(record["date"], {})[record["course"]] = record["change"]
+            # 清理已过去的日期
+            today = self.clock.now().date().isoformat()
+            for date in [date for date in exceptions if date < today]:
+                del exceptions[date]
+
+    def _record_delta(self, record: Dict):
+        """应用并记录一条单门课程改动，只追加日志并更新该用户的提醒"""
+        self.journal_seq += 1
+        record["seq"] = self.journal_seq
+        self._apply_delta(record)
+        if self.journal.append(record):
+            self.save_schedules()
+        self._schedule_changed(record["user"])
+
+    def get_user_settings(self, user_id: str) -> Dict:
+        """获取用户设置"""
+        return self._ensure_user(user_id)["settings"]
 
     def format_course_time(self, time_str: str) -> str:
         """格式化课程时间"""
-        if "第" in time_str and "节" in time_str:
-            period = time_str.split("第")[1].split("节")[0]
-            time_slots = self.config.get("time_slots", {})
-            if period in time_slots:
-                return f"{time_str}（{time_slots[period]}）"
-        return time_str
+        return self.periods.format(time_str)
 
     def parse_time_slot(self, time_str: str) -> Optional[Tuple[str, str]]:
         """解析课程时间段，返回开始时间和结束时间"""
-        if "第" in time_str and "节" in time_str:
-            period = time_str.split("第")[1].split("节")[0]
-            time_slots = self.config.get("time_slots", {})
-            if period in time_slots:
-                start_time, end_time = time_slots[period].split("-")
-                return start_time, end_time
-        return None
+        return self.periods.clock_range(time_str)
+
+    def _reload_time_slots(self):
+        """time_slots配置变化后重新编译作息表，只重建受影响的提醒"""
+        time_slots = self.config.get("time_slots")
+        if time_slots is None or dict(time_slots) == self._time_slots:
+            return
+        self._time_slots = dict(time_slots)
+        self.periods = PeriodTable(self._time_slots)
+        if self.shards:
+            self.shards.set_time_slots(self._time_slots)
+            logger.info("作息时间已更新，已通知各提醒分片重建")
+            return
+        rebuilt = self.scheduler.set_time_slots(self._time_slots)
+        logger.info(f"作息时间已更新，重建了{rebuilt}个课程表分组的提醒")
+
+    def _load_calendar(self) -> SchoolCalendar:
+        """加载校历文件，相对路径基于插件数据目录"""
+        calendar_config = self.config.get("calendar_config", {})
+        path = calendar_config.get("file", "calendar.json")
+        if path and not os.path.isabs(path):
+            path = os.path.join(self.data_dir, path)
+        try:
+            return SchoolCalendar.load(path, calendar_config.get("semester_start", ""),
+                                       calendar_config.get("weeks", 20))
+        except Exception as e:
+            logger.error(f"加载校历失败: {e}")
+            return SchoolCalendar()
+
+    def _scheduler_config(self) -> Dict:
+        """提醒调度需要的配置，传给工作进程"""
+        keys = ("time_slots", "reminder_time", "enable_auto_reminder", "enable_daily_reminder", "daily_reminder_time")
+        return {key: self.config[key] for key in keys if key in self.config}
+
+    def _schedules_stamp(self) -> Optional[List[int]]:
+        """课程表文件的修改时间和大小，用于判断快照之后是否保存过课程表"""
+        try:
+            stat = os.stat(os.path.join(self.data_dir, "schedules.json"))
+        except OSError:
+            return None
+        return [stat.st_mtime_ns, stat.st_size]
+
+    def _snapshot_meta(self) -> Dict:
+        return {
+            "config": self.scheduler.config_hash(),
+            "schedules": self._schedules_stamp(),
+            "journal_seq": self.journal_seq
+        }
+
+    def _warm_start(self):
+        """从快照恢复提醒调度，之后只有日志里的改动需要重新计算；配置或课程表文件变化时全部重建"""
+        snapshot = self.snapshot.load()
+        if snapshot is not None:
+            meta, state = snapshot
+            current = self._snapshot_meta()
+            if (meta.get("config") == current["config"] and meta.get("schedules") == current["schedules"]
+                    and meta.get("journal_seq", -1) <= self.journal_seq):
+                with metrics.timer("scheduler_warm_start_seconds"):
+                    self.scheduler.import_state(state, self.schedules)
+                    changed = {user_id for seq, user_id in self.replayed if seq > meta["journal_seq"]}
+                    for user_id in changed:
+                        if user_id in self.schedules:
+                            self.scheduler.set_user(user_id, self.schedules[user_id])
+                        else:
+                            self.scheduler.remove_user(user_id)
+                self._snapshot_meta_saved = current if not changed else None
+                logger.info(f"已从快照恢复提醒调度，重新计算了{len(changed)}个用户")
+                return
+            logger.info("提醒调度快照已过期，重新计算全部提醒")
+        self.scheduler.load(self.schedules)
+
+    def save_snapshot(self):
+        """保存提醒调度快照，配置、课程表和日志都没有变化时跳过"""
+        if not self.snapshot:
+            return
+        meta = self._snapshot_meta()
+        if meta == self._snapshot_meta_saved:
+            return
+        self.snapshot.write(self.snapshot.encode(meta, self.scheduler.export_state()))
+        self._snapshot_meta_saved = meta
+
+    async def save_snapshots(self):
+        """定期保存提醒调度快照，序列化在事件循环中完成，写文件放到线程里"""
+        while True:
+            await asyncio.sleep(self.snapshot_interval)
+            try:
+                meta = self._snapshot_meta()
+                if meta == self._snapshot_meta_saved:
+                    continue
+                with metrics.timer("scheduler_snapshot_seconds"):
+                    data = self.snapshot.encode(meta, self.scheduler.export_state())
+                await asyncio.to_thread(self.snapshot.write, data)
+                self._snapshot_meta_saved = meta
+            except Exception as e:
+                logger.error(f"保存提醒调度快照失败: {e}")
+
+    def _schedule_changed(self, user_id: str):
+        """用户课程表或设置变化后更新提醒调度和占用索引"""
+        data = self.schedules.get(user_id)
+        if data is None:
+            if self.occupancy.loaded:
+                self.occupancy.remove_user(user_id)
+            if self.shards:
+                self.shards.remove_user(user_id)
+            else:
+                self.scheduler.remove_user(user_id)
+            return
+        if self.occupancy.loaded:
+            self.occupancy.set_user(user_id, data)
+        if self.shards:
+            self.shards.set_user(user_id, data)
+        else:
+            self.scheduler.set_user(user_id, data)
 
     @filter.command("课程表")
     async def show_schedule(self, event: AstrMessageEvent):
@@ -196,13 +558,24 @@ class CourseReminderPlugin(Star):
             yield event.plain_result("你的课程表是空的！")
             return
 
+        # 默认发送表格图片，"/课程表 文字"查看带序号的文字版
+        args = event.get_plain_text().split()
+        if self.renderer and self.renderer.available and "文字" not in args[1:]:
+            try:
+                image_path = await self._render_timetable(courses)
+                yield event.image_result(image_path)
+                yield event.plain_result("发送 /课程表 文字 查看带序号的文字版")
+                return
+            except Exception as e:
+                logger.error(f"生成课程表图片失败: {e}")
+
         # 按星期分组
         days = {}
-        for course in courses:
+        for index, course in enumerate(courses, 1):
             day = course.get("day", "未知")
             if day not in days:
                 days[day] = []
-            days[day].append(course)
+            days[day].append((index, course))
 
         # 构建消息
         message = "📚 你的课程表：\n\n"
@@ -218,7 +591,8 @@ class CourseReminderPlugin(Star):
         for day in ["星期一", "星期二", "星期三", "星期四", "星期五", "星期六", "星期日"]:
             if day in days:
                 message += f"【{day}】\n"
-                for course in days[day]:
+                for index, course in days[day]:
+                    message += f"序号：{index}\n"
                     message += f"时间：{self.format_course_time(course['time'])}\n"
                     message += f"课程：{course['name']}\n"
                     message += f"教师：{course['teacher']}\n"
@@ -227,6 +601,22 @@ class CourseReminderPlugin(Star):
 
         yield event.plain_result(message)
 
+    async def _render_timetable(self, courses: List[Dict]) -> str:
+        """获取课程表图片，未缓存时在线程中生成；同一课程表同时只生成一次"""
+        key = self.renderer.cache_key(courses, self.periods)
+        path = self.renderer.cached(key)
+        if path is not None:
+            metrics.inc("timetable_render_hits_total")
+            return path
+        future = self._renders.get(key)
+        if future is None:
+            metrics.inc("timetable_render_misses_total")
+            future = asyncio.ensure_future(asyncio.to_thread(self.renderer.render, key, courses, self.periods))
+            self._renders[key] = future
+            future.add_done_callback(lambda _: self._renders.pop(key, None))
+        with metrics.timer("timetable_render_wait_seconds"):
+            return await asyncio.shield(future)
+
     @filter.command("今日课程")
     async def show_today_courses(self, event: AstrMessageEvent):
         """显示今日课程"""
@@ -235,23 +625,29 @@ class CourseReminderPlugin(Star):
             yield event.plain_result("你还没有设置课程表哦！")
             return
 
-        today = datetime.now().strftime("%A")
-        today_cn = {
-            "Monday": "星期一",
-            "Tuesday": "星期二",
-            "Wednesday": "星期三",
-            "Thursday": "星期四",
-            "Friday": "星期五",
-            "Saturday": "星期六",
-            "Sunday": "星期日"
-        }[today]
-
-        courses = [c for c in self.schedules[user_id].get("courses", []) if c.get("day") == today_cn]
+        today = self.clock.now().date()
+        info = self.calendar.lookup(today)
+        if info.no_class:
+            yield event.plain_result(f"今天是{info.name}，放假没有课！")
+            return
+        today_cn = WEEKDAYS[info.weekday]
+
+        # 只保留本教学周的课程，并应用今天的停课、调教室
+        changes = self.schedules[user_id].get("exceptions", {}).get(today.isoformat(), {})
+        courses = [apply_exception(c, changes.get(course_signature(c)))
+                   for c in self.schedules[user_id].get("courses", [])
+                   if c.get("day") == today_cn and in_week(parse_weeks(c.get("weeks", "")), info.week)]
+        courses = [c for c in courses if c is not None]
         if not courses:
             yield event.plain_result(f"今天（{today_cn}）没有课程安排！")
             return
 
-        message = f"📚 今日（{today_cn}）课程：\n\n"
+        message = f"📚 今日（{today_cn}）课程：\n"
+        if info.name:
+            message += f"（{info.name}，按{today_cn}上课）\n"
+        if info.week is not None and 1 <= info.week <= self.calendar.weeks:
+            message += f"第{info.week}教学周\n"
+        message += "\n"
         for course in courses:
             message += f"时间：{self.format_course_time(course['time'])}\n"
             message += f"课程：{course['name']}\n"
@@ -261,6 +657,24 @@ class CourseReminderPlugin(Star):
 
         yield event.plain_result(message)
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("重载校历")
+    async def reload_calendar(self, event: AstrMessageEvent):
+        """重新加载校历文件（管理员）"""
+        self.calendar = await asyncio.to_thread(self._load_calendar)
+        if self.shards:
+            self.shards.set_calendar(self.calendar)
+        else:
+            self.scheduler.set_calendar(self.calendar)
+        holidays = sum(1 for info in self.calendar.days.values() if info.no_class)
+        makeup = len(self.calendar.makeup_days)
+        info = self.calendar.lookup(self.clock.now().date())
+        msg = f"校历已重新加载：放假{holidays}天，调休上课{makeup}天\n"
+        msg += f"今天按{WEEKDAYS[info.weekday]}{'放假' if info.no_class else '上课'}"
+        if info.week is not None and 1 <= info.week <= self.calendar.weeks:
+            msg += f"，第{info.week}教学周"
+        yield event.plain_result(msg)
+
     @filter.command("测试提醒")
     async def test_reminder(self, event: AstrMessageEvent):
         """测试课程提醒"""
@@ -276,13 +690,242 @@ class CourseReminderPlugin(Star):
 
         # 发送测试提醒
         course = courses[0]  # 使用第一个课程作为测试
-        message = REMINDER_TEMPLATE.replace("上课时间（节次和时间）：", f"上课时间：{self.format_course_time(course['time'])}")
-        message = message.replace("课程名称", course['name'])
-        message = message.replace("老师姓名", course['teacher'])
-        message = message.replace("教室/场地", course['location'])
+        message = render_reminder(course, self.periods)
 
         yield event.plain_result(message)
 
+    def _course_at(self, user_id: str, number: str) -> Optional[int]:
+        """把用户输入的序号（从1开始）转换为课程下标"""
+        if user_id not in self.schedules or not number.isdigit():
+            return None
+        index = int(number) - 1
+        if 0 <= index < len(self.schedules[user_id]["courses"]):
+            return index
+        return None
+
+    def _parse_date(self, text: str) -> Optional[str]:
+        """解析日期（今天、明天、2025-03-03、3-3、3月3日），返回ISO格式"""
+        today = self.clock.now().date()
+        if text in ("今天", "明天", "后天"):
+            return (today + timedelta(days=("今天", "明天", "后天").index(text))).isoformat()
+        text = text.replace("月", "-").replace("日", "").replace("/", "-")
+        for fmt in ("%Y-%m-%d", "%m-%d"):
+            try:
+                parsed = datetime.strptime(text, fmt).date()
+            except ValueError:
+                continue
+            if fmt == "%m-%d":
+                parsed = parsed.replace(year=today.year)
+                if parsed < today:
+                    parsed = parsed.replace(year=today.year + 1)
+            return parsed.isoformat()
+        return None
+
+    def _query_day(self, text: str) -> Optional[Tuple[int, Optional[int], str, Optional[str]]]:
+        """解析查询的星期或日期，返回(星期, 教学周, 说明, 日期)；按星期查询时不限教学周，也不应用某天的临时变动"""
+        if text.startswith("周"):
+            text = "星期" + text[1:].replace("天", "日")
+        if text in WEEKDAYS:
+            return WEEKDAYS.index(text), None, text, None
+        date = self._parse_date(text)
+        if date is None:
+            return None
+        info = self.calendar.lookup(datetime.fromisoformat(date).date())
+        if info.no_class:
+            return None
+        label = f"{date}（{WEEKDAYS[info.weekday]}"
+        if info.week is not None and 1 <= info.week <= self.calendar.weeks:
+            label += f"，第{info.week}教学周"
+        return info.weekday, info.week, label + "）", date
+
+    def _query_minute(self, text: str) -> Optional[int]:
+        """解析查询的时刻（08:30）或节次（第3-4节），返回一天内的分钟"""
+        match = re.match(r"^(\d{1,2})[:：](\d{2})$", text)
+        if match:
+            return int(match.group(1)) * 60 + int(match.group(2))
+        return self.periods.start_minute(text)
+
+    def _query_occupancy(self, field: str, value: str, weekday: Optional[int] = None,
+                         week: Optional[int] = None, minute: Optional[int] = None, date: Optional[str] = None):
+        """查询占用索引，索引还未建立时先从全部课程表建立"""
+        if not self.occupancy.loaded:
+            with metrics.timer("occupancy_load_seconds"):
+                self.occupancy.load(self.schedules)
+        with metrics.timer("occupancy_query_seconds"):
+            return self.occupancy.query(field, value, self.periods, weekday, week, minute, date)
+
+    def _format_slots(self, title: str, results, limit: int = 30) -> str:
+        """格式化占用查询结果"""
+        if not results:
+            return f"{title}：没有找到课程"
+        lines = [f"{title}：共{len(results)}门课"]
+        for slot, count in results[:limit]:
+            line = f"{WEEKDAYS[slot.weekday]} {self.format_course_time(slot.time)} {slot.name}"
+            details = " ".join(v for v in (slot.teacher, slot.location, slot.weeks) if v)
+            lines.append(f"{line} {details} · {count}人")
+        if len(results) > limit:
+            lines.append(f"……另有{len(results) - limit}门未显示")
+        return "\n".join(lines)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("教室占用")
+    async def room_occupancy(self, event: AstrMessageEvent):
+        """查询教室某天或某个时刻有哪些课（管理员）"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("用法：/教室占用 <地点> [日期或星期] [时刻或节次]\n例如：/教室占用 A101 今天 10:30 或 /教室占用 A101 星期一 第3-4节")
+            return
+        day = self._query_day(args[2] if len(args) > 2 else "今天")
+        minute = self._query_minute(args[3]) if len(args) > 3 else None
+        if day is None or (len(args) > 3 and minute is None):
+            yield event.plain_result("无法识别日期或时刻，或当天放假")
+            return
+        weekday, week, label, date = day
+        results = self._query_occupancy("location", args[1], weekday, week, minute, date)
+        title = f"🏫 {args[1]} {label}" + (f" {args[3]}" if minute is not None else "")
+        yield event.plain_result(self._format_slots(title, results))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("教师课程")
+    async def teacher_courses(self, event: AstrMessageEvent):
+        """查询教师某天的课程（管理员）"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("用法：/教师课程 <教师> [日期或星期]\n例如：/教师课程 张老师 明天")
+            return
+        day = self._query_day(args[2] if len(args) > 2 else "今天")
+        if day is None:
+            yield event.plain_result("无法识别日期，或当天放假")
+            return
+        weekday, week, label, date = day
+        results = self._query_occupancy("teacher", args[1], weekday, week, date=date)
+        yield event.plain_result(self._format_slots(f"👩‍🏫 {args[1]} {label}", results))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("课程查询")
+    async def course_lookup(self, event: AstrMessageEvent):
+        """查询某门课程每周的上课时间和地点（管理员）"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("用法：/课程查询 <课程名>")
+            return
+        name = " ".join(args[1:])
+        results = self._query_occupancy("name", name)
+        yield event.plain_result(self._format_slots(f"📖 {name}", results))
+
+    @filter.command("添加课程")
+    async def add_course(self, event: AstrMessageEvent):
+        """添加一门课程"""
+        args = event.get_plain_text().split()
+        if len(args) > 1 and args[1].startswith("周"):
+            args[1] = "星期" + args[1][1:].replace("天", "日")
+        if len(args) < 4 or args[1] not in WEEKDAYS:
+            yield event.plain_result("用法：/添加课程 <星期> <节次> <课程名> [教师] [地点] [周次]\n例如：/添加课程 星期一 第1-2节 高等数学 张老师 A101 1-16周")
+            return
+
+        user_id = event.get_sender_id()
+        fields = args[4:] + [""] * 3
+        course = {
+            "day": args[1],
+            "time": args[2],
+            "name": args[3],
+            "teacher": fields[0],
+            "location": fields[1],
+            "weeks": fields[2]
+        }
+        self._record_delta({"user": user_id, "op": "add", "course": course})
+        yield event.plain_result(f"已添加课程：{args[1]} {self.format_course_time(args[2])} {args[3]}")
+
+    @filter.command("修改课程")
+    async def update_course(self, event: AstrMessageEvent):
+        """修改一门课程"""
+        args = event.get_plain_text().split()
+        field_map = {"星期": "day", "时间": "time", "课程": "name", "教师": "teacher", "地点": "location", "周次": "weeks"}
+        user_id = event.get_sender_id()
+        index = self._course_at(user_id, args[1]) if len(args) > 1 else None
+        fields = {}
+        for arg in args[2:]:
+            key, _, value = arg.partition("=")
+            if key in field_map and value:
+                fields[field_map[key]] = value
+        if index is None or not fields or ("day" in fields and fields["day"] not in WEEKDAYS):
+            yield event.plain_result("用法：/修改课程 <序号> <字段>=<值> ...\n字段：星期、时间、课程、教师、地点、周次\n例如：/修改课程 3 地点=B202 教师=李老师\n序号见 /课程表")
+            return
+
+        self._record_delta({"user": user_id, "op": "update", "index": index, "fields": fields})
+        course = self.schedules[user_id]["courses"][index]
+        yield event.plain_result(f"已修改课程：{course['day']} {self.format_course_time(course['time'])} {course['name']}")
+
+    @filter.command("删除课程")
+    async def remove_course(self, event: AstrMessageEvent):
+        """删除一门课程"""
+        args = event.get_plain_text().split()
+        user_id = event.get_sender_id()
+        index = self._course_at(user_id, args[1]) if len(args) > 1 else None
+        if index is None:
+            yield event.plain_result("用法：/删除课程 <序号>，序号见 /课程表")
+            return
+
+        course = self.schedules[user_id]["courses"][index]
+        self._record_delta({"user": user_id, "op": "remove", "index": index})
+        yield event.plain_result(f"已删除课程：{course['day']} {self.format_course_time(course['time'])} {course['name']}")
+
+    @filter.command("停课")
+    async def cancel_course(self, event: AstrMessageEvent):
+        """标记某天的一门课程停课"""
+        args = event.get_plain_text().split()
+        user_id = event.get_sender_id()
+        date = self._parse_date(args[1]) if len(args) > 2 else None
+        index = self._course_at(user_id, args[2]) if len(args) > 2 else None
+        if date is None or index is None:
+            yield event.plain_result("用法：/停课 <日期> <序号>\n例如：/停课 明天 3 或 /停课 3月10日 3\n序号见 /课程表")
+            return
+
+        course = self.schedules[user_id]["courses"][index]
+        if course.get("day") != WEEKDAYS[datetime.fromisoformat(date).weekday()]:
+            yield event.plain_result(f"{date}是{WEEKDAYS[datetime.fromisoformat(date).weekday()]}，不是{course['name']}的上课日")
+            return
+        self._record_delta({"user": user_id, "op": "exception", "date": date,
+                            "course": course_signature(course), "change": {"cancel": True}})
+        yield event.plain_result(f"已标记{date}的{course['name']}停课，当天不再提醒")
+
+    @filter.command("调教室")
+    async def change_room(self, event: AstrMessageEvent):
+        """修改某天一门课程的上课地点"""
+        args = event.get_plain_text().split()
+        user_id = event.get_sender_id()
+        date = self._parse_date(args[1]) if len(args) > 3 else None
+        index = self._course_at(user_id, args[2]) if len(args) > 3 else None
+        if date is None or index is None:
+            yield event.plain_result("用法：/调教室 <日期> <序号> <新地点>\n例如：/调教室 明天 3 B202\n序号见 /课程表")
+            return
+
+        course = self.schedules[user_id]["courses"][index]
+        if course.get("day") != WEEKDAYS[datetime.fromisoformat(date).weekday()]:
+            yield event.plain_result(f"{date}是{WEEKDAYS[datetime.fromisoformat(date).weekday()]}，不是{course['name']}的上课日")
+            return
+        self._record_delta({"user": user_id, "op": "exception", "date": date,
+                            "course": course_signature(course), "change": {"location": args[3]}})
+        yield event.plain_result(f"已将{date}的{course['name']}调整到{args[3]}")
+
+    @filter.command("群提醒")
+    async def group_reminder(self, event: AstrMessageEvent):
+        """在当前群接收上课提醒，同一次课的同学合并为一条@消息"""
+        args = event.get_plain_text().split()
+        user_id = event.get_sender_id()
+        if not self.batcher:
+            yield event.plain_result("管理员未开启群提醒")
+            return
+        if len(args) > 1 and args[1] in ("关", "关闭"):
+            self._record_delta({"user": user_id, "op": "origin", "origin": None})
+            yield event.plain_result("已关闭群提醒，上课提醒将私聊发送")
+            return
+        if not event.get_group_id():
+            yield event.plain_result("请在需要接收提醒的群里发送 /群提醒，发送 /群提醒 关 可改回私聊提醒")
+            return
+        self._record_delta({"user": user_id, "op": "origin", "origin": event.unified_msg_origin})
+        yield event.plain_result("之后的上课提醒将在本群@你，同一节课的同学会合并为一条消息")
+
     @filter.command("提醒设置")
     async def reminder_settings(self, event: AstrMessageEvent):
         """设置提醒选项"""
@@ -300,6 +943,10 @@ class CourseReminderPlugin(Star):
     @filter.event_message_type(filter.EventMessageType.ALL)
     async def on_message(self, event: AstrMessageEvent):
         """处理所有消息"""
+        # 自动收集群聊图片，只入队不等待
+        if self.collector:
+            self._collect_images(event)
+
         # 检查是否是图片或文件
         if event.message_obj.type in ["image", "file"]:
             template = """抱歉，我暂时不支持识别图片和文件。
@@ -366,6 +1013,22 @@ class CourseReminderPlugin(Star):
         if not text:
             return
 
+        # 匹配词触发图库
+        galleries = self.gm.match(text)
+        if galleries:
+            for gallery in galleries:
+                image_path = gallery.get_image()
+                if image_path:
+                    image_path = await self.gm.run(gallery.get_send_path, image_path)
+                    yield event.image_result(image_path)
+                    return
+            return
+
+        # 不像课程表的消息直接忽略
+        passed, _ = self.classifier.classify(text)
+        if not passed:
+            return
+
         # 使用AI解析课程表
         try:
             courses, basic_info = await self.parse_course_with_ai(text)
@@ -375,20 +1038,10 @@ class CourseReminderPlugin(Star):
 
             # 保存课程表
             user_id = event.get_sender_id()
-            if user_id not in self.schedules:
-                self.schedules[user_id] = {
-                    "courses": [],
-                    "settings": {
-                        "enable_reminder": True,
-                        "reminder_time": self.config.get("reminder_time", 30),
-                        "enable_daily_reminder": self.config.get("enable_daily_reminder", True)
-                    },
-                    "basic_info": {}
-                }
-            
-            self.schedules[user_id]["courses"] = courses
+            self._set_courses(user_id, courses)
             self.schedules[user_id]["basic_info"] = basic_info
             self.save_schedules()
+            self._schedule_changed(user_id)
 
             # 发送确认消息
             yield event.plain_result("课程表已保存！\n\n请确认以下课程信息是否正确：")
@@ -399,82 +1052,194 @@ class CourseReminderPlugin(Star):
             logger.error(f"解析课程表失败: {e}")
             yield event.plain_result("抱歉，我无法识别这个课程表格式。请确保按照模板格式发送。")
 
+    def _collect_images(self, event: AstrMessageEvent):
+        """把白名单群聊中的图片放入收集队列"""
+        group_id = event.get_group_id()
+        if not self.collector.accepts_group(group_id):
+            return
+        for comp in event.get_messages():
+            if isinstance(comp, Comp.Image):
+                url = getattr(comp, "url", None) or comp.file
+                if url:
+                    self.collector.offer(CollectItem(
+                        str(group_id),
+                        str(event.get_sender_id()),
+                        event.get_sender_name(),
+                        url
+                    ))
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("性能")
+    async def show_metrics(self, event: AstrMessageEvent):
+        """查看插件性能指标（管理员）"""
+        if not metrics.enabled:
+            yield event.plain_result("性能指标未启用")
+            return
+        msg = "📈 性能指标：\n" + (metrics.render_text() or "暂无数据")
+        stats = self.classifier.stats()
+        msg += f"\n课程表预筛：放行{stats['passed']} 拦截{stats['rejected']}"
+        if self.collector:
+            stats = self.collector.stats()
+            msg += f"\n自动收集：队列{stats['queue_depth']}/{stats['queue_size']} 丢弃{stats['dropped']}"
+        stats = self.sender.stats()
+        msg += f"\n发送队列：待发{stats['pending']}条 接收者{stats['targets']}个"
+        stats = self.ledger.stats()
+        msg += "\n已送达记录：" + ("、".join(f"{day} {count}条" for day, count in stats.items()) or "无")
+        stats = self.classes.stats()
+        msg += f"\n班级课程表：{stats['classes']}份 用户{len(self.schedules)}人"
+        yield event.plain_result(msg)
+
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("性能分析")
+    async def start_profiling(self, event: AstrMessageEvent):
+        """开启一段时间的性能分析（管理员）"""
+        args = event.get_plain_text().split()
+        duration = int(args[1]) if len(args) > 1 and args[1].isdigit() else 60
+        duration = max(5, min(duration, 600))
+        if self.profiler.running:
+            yield event.plain_result("性能分析正在进行中")
+            return
+
+        asyncio.create_task(self._run_profiler(duration, event.unified_msg_origin))
+        yield event.plain_result(f"已开启性能分析，持续{duration}秒，结束后会通知你")
+
+    async def _run_profiler(self, duration: int, origin: str):
+        """后台执行性能分析并通知结果"""
+        try:
+            path = await self.profiler.run(duration)
+            message = f"性能分析完成，报告已保存到：{path}"
+        except Exception as e:
+            logger.error(f"性能分析失败: {e}")
+            message = f"性能分析失败: {str(e)}"
+        await self.context.send_message(origin, [Comp.Plain(message)])
+
+    @filter.command("预筛统计")
+    async def prefilter_stats(self, event: AstrMessageEvent):
+        """查看课程表预筛统计"""
+        stats = self.classifier.stats()
+        total = stats["passed"] + stats["rejected"]
+        msg = "课程表预筛统计：\n"
+        msg += f"放行：{stats['passed']}\n"
+        msg += f"拦截：{stats['rejected']}\n"
+        if total:
+            msg += f"放行率：{stats['passed'] / total:.1%}"
+        yield event.plain_result(msg)
+
     async def check_reminders(self):
         """检查并发送课程提醒"""
         while True:
+            now = self.clock.now()
+            # 提醒检查相对整分钟的延迟
+            metrics.observe("reminder_lag_seconds", now.second + now.microsecond / 1e6)
             try:
-                now = datetime.now()
-                
-                # 检查每日提醒
-                if self.config.get("enable_daily_reminder", True):
-                    daily_time = self.config.get("daily_reminder_time", "23:00")
-                    if now.strftime("%H:%M") == daily_time:
-                        for user_id, data in self.schedules.items():
-                            settings = data.get("settings", {})
-                            if not settings.get("enable_daily_reminder", True):
-                                continue
-                                
-                            tomorrow = (now + timedelta(days=1)).strftime("%A")
-                            tomorrow_cn = {
-                                "Monday": "星期一",
-                                "Tuesday": "星期二",
-                                "Wednesday": "星期三",
-                                "Thursday": "星期四",
-                                "Friday": "星期五",
-                                "Saturday": "星期六",
-                                "Sunday": "星期日"
-                            }[tomorrow]
-
-                            tomorrow_courses = [c for c in data.get("courses", []) if c.get("day") == tomorrow_cn]
-                            if tomorrow_courses:
-                                message = f"📚 明日（{tomorrow_cn}）课程安排：\n\n"
-                                for course in tomorrow_courses:
-                                    message += f"时间：{self.format_course_time(course['time'])}\n"
-                                    message += f"课程：{course['name']}\n"
-                                    message += f"教师：{course['teacher']}\n"
-                                    message += f"地点：{course['location']}\n"
-                                    message += f"周次：{course['weeks']}\n\n"
-                                message += "是否开启明日课程提醒？回复\"是\"开启提醒。"
-
-                                # 发送消息
-                                await self.context.send_message(user_id, [Comp.Plain(message)])
-
-                # 检查当前课程提醒
-                if self.config.get("enable_auto_reminder", True):
-                    for user_id, data in self.schedules.items():
-                        settings = data.get("settings", {})
-                        if not settings.get("enable_reminder", True):
-                            continue
-                            
-                        reminder_time = settings.get("reminder_time", self.config.get("reminder_time", 30))
-                        
-                        for course in data.get("courses", []):
-                            # 解析课程时间
-                            time_slot = self.parse_time_slot(course['time'])
-                            if time_slot:
-                                start_time, _ = time_slot
-                                # 检查是否需要提醒
-                                course_time = datetime.strptime(start_time, "%H:%M").time()
-                                reminder_time_obj = (datetime.combine(now.date(), course_time) - 
-                                                   timedelta(minutes=reminder_time)).time()
-                                
-                                if now.time() == reminder_time_obj:
-                                    message = REMINDER_TEMPLATE.replace("上课时间（节次和时间）：", f"上课时间：{self.format_course_time(course['time'])}")
-                                    message = message.replace("课程名称", course['name'])
-                                    message = message.replace("老师姓名", course['teacher'])
-                                    message = message.replace("教室/场地", course['location'])
-
-                                    # 发送提醒
-                                    await self.context.send_message(user_id, [Comp.Plain(message)])
-
+                self._reload_time_slots()
+                minute = now.replace(second=0, microsecond=0)
+                with metrics.timer("reminder_tick_seconds"):
+                    sent = 0
+                    for tick in self._missed_minutes(minute):
+                        sent += await self.reminder_tick(tick)
+                    sent += await self.reminder_tick(now)
+                self.ledger.last_tick = minute
+                metrics.inc("reminders_sent_total", sent)
+                metrics.set("reminders_last_tick", sent)
             except Exception as e:
+                metrics.inc("reminder_tick_errors_total")
                 logger.error(f"检查课程提醒失败: {e}")
 
-            await asyncio.sleep(60)  # 每分钟检查一次
+            if self.metrics_file and metrics.enabled:
+                try:
+                    metrics.dump(self.metrics_file)
+                except Exception as e:
+                    logger.error(f"写入性能指标失败: {e}")
+
+            # 每分钟检查一次，对齐到下一个整分钟
+            now = self.clock.now()
+            await self.clock.sleep(60 - now.second - now.microsecond / 1e6)
+
+    async def _send_text(self, target: str, text: str, mentions: Tuple[str, ...] = ()):
+        """发送队列使用的实际发送函数，群提醒在正文前@相关成员"""
+        if not mentions:
+            return await self.context.send_message(target, [Comp.Plain(text)])
+        chain = [Comp.At(qq=user_id) for user_id in mentions]
+        chain.append(Comp.Plain("\n" + text))
+        return await self.context.send_message(target, chain)
+
+    def _missed_minutes(self, minute: datetime) -> List[datetime]:
+        """重启或卡顿期间漏掉的分钟，最多补查catchup_minutes分钟"""
+        last = self.ledger.last_tick
+        if last is None or last >= minute:
+            return []
+        start = max(last + timedelta(minutes=1), minute - timedelta(minutes=self.catchup_minutes))
+        missed = []
+        while start < minute:
+            missed.append(start)
+            start += timedelta(minutes=1)
+        return missed
+
+    async def reminder_tick(self, now: datetime) -> int:
+        """执行一次提醒检查，已送达过的提醒不再发送，返回放入发送队列的消息数"""
+        if self.shards:
+            due = await self.shards.due(now)
+        else:
+            due = self.scheduler.due(now)
+        sent = 0
+        # 补查漏掉的分钟时now早于当前时间，剩余时间按当前时间计算
+        current = self.clock.now()
+        monotonic = time.monotonic()
+        for user_id, message, priority, occurrence in due:
+            key = f"{user_id}|{occurrence}"
+            if self.ledger.seen(key):
+                metrics.inc("reminders_deduplicated_total")
+                continue
+            # 排队到上课时还没发出的提醒就不再发送，已经上课的不再放入队列
+            start = class_start(occurrence)
+            expires_at = 0.0
+            if start:
+                remaining = (start - current).total_seconds()
+                if remaining <= 0:
+                    metrics.inc("reminders_expired_total")
+                    continue
+                expires_at = monotonic + remaining
+            origin = None
+            if self.batcher and priority == PRIORITY_REMINDER:
+                origin = self.schedules.get(user_id, {}).get("origin")
+            if origin:
+                # 在群里提醒的用户先汇总，同一次课合并为一条消息
+                if self.batcher.add(origin, user_id, message, priority, occurrence, key, expires_at):
+                    sent += 1
+            elif self.sender.enqueue(user_id, message, priority, (key,), expires_at=expires_at):
+                sent += 1
+        return sent
+
+    async def flush_galleries(self):
+        """定期把图片查看记录写回图库清单，并写回存储的引用计数"""
+        while True:
+            await asyncio.sleep(300)
+            try:
+                await self.gm.run(self.gm.flush)
+            except Exception as e:
+                logger.error(f"保存图库查看记录失败: {e}")
 
     async def terminate(self):
         """插件终止时保存数据"""
         self.save_schedules()
+        try:
+            self.save_snapshot()
+        except Exception as e:
+            logger.error(f"保存提醒调度快照失败: {e}")
+        if self.purge_task:
+            self.purge_task.cancel()
+        self.gm.flush()
+        self.gm.close()
+        if self.shards:
+            await self.shards.stop()
+        if self.batcher:
+            await self.batcher.stop()
+        await self.sender.stop()
+        self.ledger.close()
+        if self.collector:
+            await self.collector.stop()
+        await self.downloader.close()
 
     @filter.command("图库帮助")
     async def gallery_help(self, event: AstrMessageEvent):
@@ -483,8 +1248,9 @@ class CourseReminderPlugin(Star):
 /图库帮助 - 显示此帮助信息
 /存图 <图库名> [序号] - 保存图片到指定图库
 /删图 <图库名> [序号] - 删除图库中的图片
+/删除图库 <图库名> - 删除整个图库（管理员）
 /查看 <图库名> [序号] - 查看图库中的图片
-/图库列表 - 查看所有图库
+/图库列表 [页码] - 分页查看所有图库
 /图库详情 <图库名> - 查看图库详细信息
 /精准匹配词 - 查看精准匹配词
 /模糊匹配词 - 查看模糊匹配词
@@ -493,11 +1259,13 @@ class CourseReminderPlugin(Star):
 /添加匹配词 <图库名> <匹配词> - 为图库添加匹配词
 /删除匹配词 <图库名> <匹配词> - 删除图库的匹配词
 /设置容量 <图库名> <容量> - 设置图库容量
+/设置空间 <图库名> <MB> - 设置图库空间上限
 /开启压缩 <图库名> - 开启图库压缩
 /关闭压缩 <图库名> - 关闭图库压缩
 /开启去重 <图库名> - 开启图库去重
 /关闭去重 <图库名> - 关闭图库去重
-/去重 <图库名> - 去除图库中的重复图片"""
+/去重 <图库名> - 去除图库中的重复图片
+/存储报告 - 查看图库存储占用"""
         yield event.plain_result(help_text)
 
     @filter.command("存图")
@@ -512,7 +1280,7 @@ class CourseReminderPlugin(Star):
         gallery = self.gm.get_gallery(gallery_name)
         if not gallery:
             try:
-                gallery = self.gm.create_gallery(
+                gallery = await self.gm.create_gallery_async(
                     gallery_name,
                     event.get_sender_id(),
                     event.get_sender_name()
@@ -526,13 +1294,13 @@ class CourseReminderPlugin(Star):
             if hasattr(comp, "file"):
                 try:
                     # 下载图片
-                    image_data = await self._download_file(comp.file)
-                    if not image_data:
+                    tmp_path = await self._download_file(comp.file)
+                    if not tmp_path:
                         yield event.plain_result("图片下载失败")
                         return
 
                     # 添加图片到图库
-                    result = gallery.add_image(image_data)
+                    result = await self.gm.add_image_async(gallery, tmp_path)
                     yield event.plain_result(result)
                 except Exception as e:
                     yield event.plain_result(f"保存图片失败: {str(e)}")
@@ -556,14 +1324,66 @@ class CourseReminderPlugin(Star):
             if len(args) > 2:
                 # 删除指定图片
                 index = int(args[2])
-                result = gallery.delete_image(index)
+                result = await self.gm.delete_image_async(gallery, index)
             else:
-                # 清空图库
-                result = gallery.delete_image()
+                # 清空图库，文件在后台删除
+                result = await self.gm.delete_image_async(gallery)
+                self._start_purge(event.unified_msg_origin)
             yield event.plain_result(result)
         except Exception as e:
             yield event.plain_result(f"删除图片失败: {str(e)}")
 
+    @filter.permission_type(filter.PermissionType.ADMIN)
+    @filter.command("删除图库")
+    async def delete_gallery(self, event: AstrMessageEvent):
+        """删除整个图库"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("请指定图库名称")
+            return
+
+        gallery_name = args[1]
+        if not self.gm.get_gallery(gallery_name):
+            yield event.plain_result(f"图库【{gallery_name}】不存在")
+            return
+        if gallery_name in self.dedup_tasks:
+            yield event.plain_result(f"图库【{gallery_name}】正在去重中，请稍后再删除")
+            return
+
+        try:
+            result = await self.gm.delete_gallery_async(gallery_name)
+        except Exception as e:
+            yield event.plain_result(f"删除图库失败: {str(e)}")
+            return
+        self._start_purge(event.unified_msg_origin)
+        yield event.plain_result(result + "，文件正在后台删除")
+
+    def _start_purge(self, origin: Optional[str] = None):
+        """启动后台删除，已在删除时只登记通知的会话"""
+        if origin and origin not in self.purge_origins:
+            self.purge_origins.append(origin)
+        if self.purge_task is None or self.purge_task.done():
+            self.purge_task = asyncio.create_task(self._run_purge())
+
+    async def _run_purge(self):
+        """后台删除清空或删除图库留下的文件，删除较多时报告进度"""
+        async def notify(message: str):
+            for origin in list(self.purge_origins):
+                await self.context.send_message(origin, [Comp.Plain(message)])
+
+        async def report(done: int, total: int):
+            await notify(f"图库文件删除进度：{done}/{total}")
+
+        try:
+            removed = await self.gm.purge(progress=report)
+            message = f"图库文件已删除完毕，共{removed}个文件" if removed >= 1000 else None
+        except Exception as e:
+            logger.error(f"删除图库文件失败: {e}")
+            message = f"删除图库文件失败: {str(e)}"
+        if message:
+            await notify(message)
+        self.purge_origins.clear()
+
     @filter.command("查看")
     async def view_image(self, event: AstrMessageEvent):
         """查看图库中的图片"""
@@ -588,6 +1408,8 @@ class CourseReminderPlugin(Star):
                 image_path = gallery.get_image()
             
             if image_path:
+                # 发送缓存的缩放图，避免每次都上传原图
+                image_path = await self.gm.run(gallery.get_send_path, image_path)
                 yield event.image_result(image_path)
             else:
                 yield event.plain_result(f"图库【{gallery_name}】中没有图片")
@@ -596,16 +1418,25 @@ class CourseReminderPlugin(Star):
 
     @filter.command("图库列表")
     async def list_galleries(self, event: AstrMessageEvent):
-        """列出所有图库"""
-        galleries = self.gm.galleries
-        if not galleries:
+        """分页列出所有图库"""
+        total = len(self.gm.names)
+        if not total:
             yield event.plain_result("当前没有图库")
             return
 
-        msg = "图库列表：\n"
-        for name, gallery in galleries.items():
-            info = gallery.get_info()
-            msg += f"【{name}】- {info['image_count']}张图片\n"
+        args = event.get_plain_text().split()
+        pages = (total + self.gallery_page_size - 1) // self.gallery_page_size
+        page = int(args[1]) if len(args) > 1 and args[1].isdigit() else 1
+        page = min(max(page, 1), pages)
+
+        msg = f"图库列表（共{total}个，{self.gm.total_images}张图片，第{page}/{pages}页）：\n"
+        for gallery in self.gm.page(page, self.gallery_page_size):
+            stats = gallery.stats()
+            modified = datetime.fromtimestamp(stats["modified"]).strftime("%m-%d %H:%M")
+            msg += (f"【{gallery.name}】- {stats['image_count']}张图片，{stats['used_bytes'] / 1024 / 1024:.1f} MB，"
+                    f"{stats['keyword_count']}个匹配词，{modified}更新\n")
+        if page < pages:
+            msg += f"发送 /图库列表 {page + 1} 查看下一页"
         yield event.plain_result(msg)
 
     @filter.command("图库详情")
@@ -623,40 +1454,180 @@ class CourseReminderPlugin(Star):
             return
 
         info = gallery.get_info()
+        stats = gallery.stats()
         msg = f"图库【{gallery_name}】详情：\n"
         msg += f"创建者：{info['creator_name']}\n"
-        msg += f"图片数量：{info['image_count']}\n"
+        msg += f"图片数量：{stats['image_count']}\n"
         msg += f"容量上限：{info['capacity']}\n"
+        msg += f"占用空间：{stats['used_bytes'] / 1024 / 1024:.2f} MB"
+        if info['max_bytes']:
+            msg += f" / {info['max_bytes'] / 1024 / 1024:.0f} MB"
+        msg += "\n"
         msg += f"压缩：{'开启' if info['compress'] else '关闭'}\n"
         msg += f"去重：{'开启' if info['duplicate'] else '关闭'}\n"
         msg += f"模糊匹配：{'开启' if info['fuzzy'] else '关闭'}\n"
+        msg += f"最近更新：{datetime.fromtimestamp(stats['modified']).strftime('%Y-%m-%d %H:%M')}\n"
         if info['keywords']:
             msg += f"关键词：{', '.join(info['keywords'])}\n"
         yield event.plain_result(msg)
 
-    async def _download_file(self, url: str) -> bytes:
-        """下载文件"""
+    @filter.command("收集状态")
+    async def collect_status(self, event: AstrMessageEvent):
+        """查看自动收集状态"""
+        if not self.collector:
+            yield event.plain_result("自动收集未启用")
+            return
+        stats = self.collector.stats()
+        msg = "自动收集状态：\n"
+        msg += f"队列：{stats['queue_depth']}/{stats['queue_size']}\n"
+        msg += f"已入队：{stats['enqueued']}\n"
+        msg += f"已丢弃：{stats['dropped']}\n"
+        msg += f"已收集：{stats['collected']}\n"
+        msg += f"已跳过：{stats['skipped']}\n"
+        msg += f"失败：{stats['failed']}"
+        yield event.plain_result(msg)
+
+    @filter.command("设置空间")
+    async def set_gallery_budget(self, event: AstrMessageEvent):
+        """设置图库空间上限"""
+        args = event.get_plain_text().split()
+        if len(args) < 3 or not args[2].isdigit():
+            yield event.plain_result("用法：/设置空间 <图库名> <MB>，0表示不限制")
+            return
+
+        gallery_name = args[1]
+        gallery = self.gm.get_gallery(gallery_name)
+        if not gallery:
+            yield event.plain_result(f"图库【{gallery_name}】不存在")
+            return
+
+        evicted = await self.gm.run(self.gm.set_max_bytes, gallery, int(args[2]) * 1024 * 1024)
+        if gallery.max_bytes:
+            msg = f"图库【{gallery_name}】空间上限已设置为{args[2]} MB，超出时将淘汰最久未查看的图片"
+            if evicted:
+                msg += f"，已淘汰{evicted}张图片"
+            yield event.plain_result(msg)
+        else:
+            yield event.plain_result(f"图库【{gallery_name}】已取消空间上限")
+
+    @filter.command("存储报告")
+    async def storage_report(self, event: AstrMessageEvent):
+        """查看图库存储占用"""
+        report = self.gm.storage_report()
+        msg = "图库存储报告：\n"
+        msg += f"图库数：{report['galleries']}\n"
+        msg += f"图片引用数：{report['images']}\n"
+        msg += f"实际文件数：{report['blobs']}\n"
+        msg += f"引用总大小：{report['logical_bytes'] / 1024 / 1024:.2f} MB\n"
+        msg += f"实际占用：{report['physical_bytes'] / 1024 / 1024:.2f} MB\n"
+        msg += f"共享存储节省：{report['saved_bytes'] / 1024 / 1024:.2f} MB"
+        yield event.plain_result(msg)
+
+    @filter.command("去重")
+    async def dedup_gallery(self, event: AstrMessageEvent):
+        """去除图库中的重复图片"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("请指定图库名称")
+            return
+
+        gallery_name = args[1]
+        gallery = self.gm.get_gallery(gallery_name)
+        if not gallery:
+            yield event.plain_result(f"图库【{gallery_name}】不存在")
+            return
+        if gallery_name in self.dedup_tasks:
+            yield event.plain_result(f"图库【{gallery_name}】正在去重中")
+            return
+
+        self.dedup_tasks[gallery_name] = asyncio.create_task(
+            self._run_dedup(gallery, event.unified_msg_origin)
+        )
+        yield event.plain_result(f"开始对图库【{gallery_name}】去重，完成后会通知你")
+
+    async def _run_dedup(self, gallery: Gallery, origin: str):
+        """后台执行图库去重"""
+        async def report(done: int, total: int):
+            await self.context.send_message(origin, [Comp.Plain(f"图库【{gallery.name}】去重进度：{done}/{total}")])
+
         try:
-            async with self.context.http.get(url) as resp:
-                if resp.status == 200:
-                    return await resp.read()
-                return None
+            images = gallery.list_images()
+            duplicates = await find_duplicates(images, progress=report if len(images) >= 200 else None)
+            removed = await self.gm.run(gallery.remove_images, duplicates)
+            if removed:
+                await self.gm.run(self.gm.save_info)
+            message = f"图库【{gallery.name}】去重完成，共{len(images)}张，删除了{removed}张重复图片"
         except Exception as e:
-            logger.error(f"下载文件失败: {str(e)}")
-            return None
+            logger.error(f"图库去重失败: {e}")
+            message = f"图库【{gallery.name}】去重失败: {str(e)}"
+        finally:
+            self.dedup_tasks.pop(gallery.name, None)
+        await self.context.send_message(origin, [Comp.Plain(message)])
+
+    @filter.command("精准匹配词")
+    async def list_exact_keywords(self, event: AstrMessageEvent):
+        """查看精准匹配词"""
+        if not self.gm.exact_keywords:
+            yield event.plain_result("当前没有精准匹配词")
+            return
+        yield event.plain_result("精准匹配词：\n" + "、".join(self.gm.exact_keywords))
 
-def get_today_weekday():
-    """获取今天的星期"""
-    week_map = {
-        'Monday': '星期一',
-        'Tuesday': '星期二',
-        'Wednesday': '星期三',
-        'Thursday': '星期四',
-        'Friday': '星期五',
-        'Saturday': '星期六',
-        'Sunday': '星期日'
-    }
-    return week_map.get(datetime.datetime.now().strftime('%A'), '未知')
+    @filter.command("模糊匹配词")
+    async def list_fuzzy_keywords(self, event: AstrMessageEvent):
+        """查看模糊匹配词"""
+        if not self.gm.fuzzy_keywords:
+            yield event.plain_result("当前没有模糊匹配词")
+            return
+        yield event.plain_result("模糊匹配词：\n" + "、".join(self.gm.fuzzy_keywords))
+
+    @filter.command("模糊匹配")
+    async def set_fuzzy_match(self, event: AstrMessageEvent):
+        """将图库切换到模糊匹配模式"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("请指定图库名称")
+            return
+        yield event.plain_result(await self.gm.run(self.gm.set_fuzzy, args[1], True))
+
+    @filter.command("精准匹配")
+    async def set_exact_match(self, event: AstrMessageEvent):
+        """将图库切换到精准匹配模式"""
+        args = event.get_plain_text().split()
+        if len(args) < 2:
+            yield event.plain_result("请指定图库名称")
+            return
+        yield event.plain_result(await self.gm.run(self.gm.set_fuzzy, args[1], False))
+
+    @filter.command("添加匹配词")
+    async def add_keyword(self, event: AstrMessageEvent):
+        """为图库添加匹配词"""
+        args = event.get_plain_text().split()
+        if len(args) < 3:
+            yield event.plain_result("用法：/添加匹配词 <图库名> <匹配词>")
+            return
+        yield event.plain_result(await self.gm.run(self.gm.add_keyword, args[1], args[2]))
+
+    @filter.command("删除匹配词")
+    async def delete_keyword(self, event: AstrMessageEvent):
+        """删除图库的匹配词"""
+        args = event.get_plain_text().split()
+        if len(args) < 3:
+            yield event.plain_result("用法：/删除匹配词 <图库名> <匹配词>")
+            return
+        yield event.plain_result(await self.gm.run(self.gm.remove_keyword, args[1], args[2]))
+
+    async def _download_file(self, url: str) -> Optional[str]:
+        """下载文件到临时文件，返回临时文件路径；本地图片复制一份，入库时不会动到原文件"""
+        try:
+            local_path = self.downloader.local_path(url)
+            if local_path:
+                return await self.gm.run(self.downloader.copy_local, local_path)
+            return await self.downloader.fetch(url)
+        except DownloadError as e:
+            logger.warning(f"下载文件失败: {str(e)}")
+        except Exception as e:
+            logger.error(f"下载文件失败: {str(e)}")
+        return None
 
 def get_class_time_from_str(time_str: str) -> tuple:
     """从时间字符串解析上课时间"""
@@ -669,14 +1640,12 @@ def get_class_time_from_str(time_str: str) -> tuple:
         # 如果解析失败，返回默认时间
         return (8, 0)
 
-async def download_file(url: str, save_path: str):
+async def download_file(downloader: Downloader, url: str, save_path: str) -> bool:
     """下载文件到指定路径"""
     try:
-        async with self.context.http.get(url) as resp:
-            if resp.status == 200:
-                with open(save_path, 'wb') as f:
-                    f.write(await resp.read())
-                return True
+        tmp_path = await downloader.fetch(url)
+        os.replace(tmp_path, save_path)
+        return True
     except Exception as e:
         logger.error(f"下载文件失败: {str(e)}")
-    return False 
\ No newline at end of file
+    return False
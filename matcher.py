@@ -0,0 +1,120 @@
+"""
+关键词匹配模块
+精准匹配词使用哈希表，模糊匹配词使用Aho–Corasick自动机，每条消息的匹配代价只与消息长度有关
+"""
+from collections import deque
+from typing import Dict, List, Optional, Set
+
+
+class _Node:
+    __slots__ = ("children", "fail", "output", "keyword")
+
+    def __init__(self):
+        self.children: Dict[str, "_Node"] = {}
+        self.fail: Optional["_Node"] = None
+        self.output: Optional["_Node"] = None  # 沿失配链最近的一个词尾节点
+        self.keyword: Optional[str] = None  # 以此节点结尾的匹配词
+
+
+class KeywordMatcher:
+    def __init__(self):
+        self.exact: Dict[str, Set[str]] = {}  # 匹配词 -> 图库名
+        self.fuzzy: Dict[str, Set[str]] = {}  # 匹配词 -> 图库名
+        self._root = _Node()
+        self._dirty = False
+
+    def add(self, keyword: str, gallery_name: str, fuzzy: bool = False):
+        """添加匹配词"""
+        if not keyword:
+            return
+        table = self.fuzzy if fuzzy else self.exact
+        if keyword not in table:
+            table[keyword] = set()
+            if fuzzy:
+                self._insert(keyword)
+        table[keyword].add(gallery_name)
+
+    def remove(self, keyword: str, gallery_name: str, fuzzy: bool = False):
+        """删除匹配词"""
+        table = self.fuzzy if fuzzy else self.exact
+        names = table.get(keyword)
+        if names is None:
+            return
+        names.discard(gallery_name)
+        if not names:
+            del table[keyword]
+            if fuzzy:
+                self._delete(keyword)
+
+    def match(self, text: str) -> List[str]:
+        """返回消息命中的图库名，精准匹配优先"""
+        text = text.strip()
+        result: List[str] = []
+        seen: Set[str] = set()
+        for name in self.exact.get(text, ()):
+            seen.add(name)
+            result.append(name)
+        if not self.fuzzy:
+            return result
+        if self._dirty:
+            self._build()
+        node = self._root
+        for ch in text:
+            while node is not self._root and ch not in node.children:
+                node = node.fail
+            node = node.children.get(ch, self._root)
+            hit = node if node.keyword is not None else node.output
+            while hit is not None:
+                for name in self.fuzzy.get(hit.keyword, ()):
+                    if name not in seen:
+                        seen.add(name)
+                        result.append(name)
+                hit = hit.output
+        return result
+
+    def _insert(self, keyword: str):
+        """在字典树中插入匹配词，失配链延迟到下次匹配时重建"""
+        node = self._root
+        for ch in keyword:
+            node = node.children.setdefault(ch, _Node())
+        node.keyword = keyword
+        self._dirty = True
+
+    def _delete(self, keyword: str):
+        """从字典树中删除匹配词，并剪掉不再使用的分支"""
+        path = [self._root]
+        for ch in keyword:
+            node = path[-1].children.get(ch)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].keyword = None
+        for i in range(len(keyword), 0, -1):
+            node = path[i]
+            if node.keyword is not None or node.children:
+                break
+            del path[i - 1].children[keyword[i - 1]]
+        self._dirty = True
+
+    def _build(self):
+        """广度优先重建失配链和输出链"""
+        root = self._root
+        root.fail = root
+        root.output = None
+        queue = deque()
+        for child in root.children.values():
+            child.fail = root
+            child.output = None
+            queue.append(child)
+        while queue:
+            node = queue.popleft()
+            for ch, child in node.children.items():
+                fail = node.fail
+                while fail is not root and ch not in fail.children:
+                    fail = fail.fail
+                child.fail = fail.children.get(ch, root)
+                if child.fail is child:
+                    child.fail = root
+                child.output = child.fail if child.fail.keyword is not None else child.fail.output
+                queue.append(child)
+        self._dirty = False
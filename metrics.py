@@ -0,0 +1,144 @@
+"""
+性能指标模块
+为提醒循环、AI解析、图库读写等热点路径提供计数器和耗时直方图，关闭时几乎没有开销
+"""
+import os
+import time
+import bisect
+import threading
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List
+
+# 直方图分桶上界（秒）
+DEFAULT_BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+_NOOP = nullcontext()
+
+
+class Histogram:
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts: List[int] = [0] * (len(self.buckets) + 1)  # 最后一个桶为+Inf
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        """记录一次观测值"""
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        if value > self.max:
+            self.max = value
+
+    def quantile(self, q: float) -> float:
+        """按分桶估算分位数（返回所在桶的上界）"""
+        if not self.count:
+            return 0.0
+        target = q * self.count
+        seen = 0
+        for i, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return self.buckets[i] if i < len(self.buckets) else self.max
+        return self.max
+
+
+class Metrics:
+    def __init__(self, enabled: bool = True):
+        self.enabled = enabled
+        self.counters: Dict[str, float] = {}
+        self.gauges: Dict[str, float] = {}
+        self.histograms: Dict[str, Histogram] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, name: str, value: float = 1):
+        """增加计数"""
+        if not self.enabled:
+            return
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def set(self, name: str, value: float):
+        """设置当前值"""
+        if not self.enabled:
+            return
+        self.gauges[name] = value
+
+    def observe(self, name: str, seconds: float):
+        """记录一次耗时"""
+        if not self.enabled:
+            return
+        with self._lock:
+            histogram = self.histograms.get(name)
+            if histogram is None:
+                histogram = self.histograms[name] = Histogram()
+            histogram.observe(seconds)
+
+    def timer(self, name: str):
+        """计时上下文，关闭时返回空上下文"""
+        if not self.enabled:
+            return _NOOP
+        return self._timer(name)
+
+    @contextmanager
+    def _timer(self, name: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start)
+
+    def reset(self):
+        """清空所有指标"""
+        with self._lock:
+            self.counters.clear()
+            self.gauges.clear()
+            self.histograms.clear()
+
+    def render_text(self) -> str:
+        """生成便于在聊天中查看的文本"""
+        lines = []
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            avg = h.sum / h.count if h.count else 0
+            lines.append(f"{name}: {h.count}次 平均{avg * 1000:.1f}ms "
+                         f"p95≤{h.quantile(0.95) * 1000:.0f}ms 最大{h.max * 1000:.1f}ms")
+        for name in sorted(self.counters):
+            lines.append(f"{name}: {self.counters[name]:g}")
+        for name in sorted(self.gauges):
+            lines.append(f"{name}: {self.gauges[name]:g}")
+        return "\n".join(lines)
+
+    def render_prometheus(self, prefix: str = "teheikcb_") -> str:
+        """生成Prometheus文本格式"""
+        lines = []
+        for name in sorted(self.counters):
+            lines.append(f"# TYPE {prefix}{name} counter")
+            lines.append(f"{prefix}{name} {self.counters[name]:g}")
+        for name in sorted(self.gauges):
+            lines.append(f"# TYPE {prefix}{name} gauge")
+            lines.append(f"{prefix}{name} {self.gauges[name]:g}")
+        for name in sorted(self.histograms):
+            h = self.histograms[name]
+            lines.append(f"# TYPE {prefix}{name} histogram")
+            cumulative = 0
+            for bound, n in zip(h.buckets, h.counts):
+                cumulative += n
+                lines.append(f'{prefix}{name}_bucket{{le="{bound:g}"}} {cumulative}')
+            lines.append(f'{prefix}{name}_bucket{{le="+Inf"}} {h.count}')
+            lines.append(f"{prefix}{name}_sum {h.sum:.6f}")
+            lines.append(f"{prefix}{name}_count {h.count}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """写入Prometheus文本文件（供node_exporter的textfile收集器读取）"""
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_file = path + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            f.write(self.render_prometheus())
+        os.replace(tmp_file, path)
+
+
+# 插件内共用的指标实例
+metrics = Metrics()
@@ -0,0 +1,160 @@
+"""
+教室和教师占用索引
+按地点、教师和课程名建立倒排索引，指向含有该课程的课程表分组（同班共用一份），
+查询时再按星期、节次和周次过滤并汇总上课用户，按日期查询时再应用当天的停课和调教室；
+课程表变化时只更新该用户，供管理员跨用户查询
+"""
+from typing import Dict, List, NamedTuple, Optional, Set, Tuple
+from .reminder import WEEKDAYS, group_key, course_signature
+from .timetable import PeriodTable
+from .school_calendar import parse_weeks, in_week
+
+
+class CourseSlot(NamedTuple):
+    weekday: int
+    time: str
+    name: str
+    teacher: str
+    location: str
+    weeks: str
+
+
+class OccupancyIndex:
+    def __init__(self):
+        """初始化占用索引，同一班级课程表只索引一次"""
+        self.groups: Dict[str, List[CourseSlot]] = {}  # 分组 -> 课程
+        self.members: Dict[str, Set[str]] = {}  # 分组 -> 用户
+        self.users: Dict[str, str] = {}  # 用户 -> 分组
+        self.by_location: Dict[str, Set[str]] = {}  # 地点 -> 分组
+        self.by_teacher: Dict[str, Set[str]] = {}
+        self.by_name: Dict[str, Set[str]] = {}
+        self.exceptions: Dict[str, Dict[str, Dict[str, Dict]]] = {}  # 日期 -> 用户 -> 课程标识 -> 临时变动
+        self._weeks: Dict[str, int] = {}  # 周次文本 -> 位掩码
+        self.loaded = False  # 首次查询时才建立
+
+    @staticmethod
+    def _slot(course: Dict) -> Optional[CourseSlot]:
+        day = course.get("day")
+        if day not in WEEKDAYS:
+            return None
+        return CourseSlot(
+            WEEKDAYS.index(day),
+            str(course.get("time", "")).strip(),
+            str(course.get("name", "")).strip(),
+            str(course.get("teacher", "")).strip(),
+            str(course.get("location", "")).strip(),
+            str(course.get("weeks", "")).strip()
+        )
+
+    def load(self, schedules: Dict[str, Dict]):
+        """重建全部索引"""
+        self.groups.clear()
+        self.members.clear()
+        self.users.clear()
+        self.by_location.clear()
+        self.by_teacher.clear()
+        self.by_name.clear()
+        self.exceptions.clear()
+        for user_id, data in schedules.items():
+            self.set_user(user_id, data)
+        self.loaded = True
+
+    def set_user(self, user_id: str, data: Dict):
+        """更新一个用户的课程"""
+        self.remove_user(user_id)
+        key = group_key(user_id, data)
+        members = self.members.get(key)
+        if members is None:
+            members = self.members[key] = set()
+            slots = self.groups[key] = [slot for slot in map(self._slot, data.get("courses", [])) if slot]
+            for slot in slots:
+                for index, value in ((self.by_location, slot.location), (self.by_teacher, slot.teacher),
+                                     (self.by_name, slot.name)):
+                    if value:
+                        index.setdefault(value, set()).add(key)
+        members.add(user_id)
+        self.users[user_id] = key
+        for date, changes in data.get("exceptions", {}).items():
+            self.exceptions.setdefault(date, {})[user_id] = changes
+
+    def remove_user(self, user_id: str):
+        """移除一个用户"""
+        for date in [date for date, users in self.exceptions.items() if user_id in users]:
+            del self.exceptions[date][user_id]
+            if not self.exceptions[date]:
+                del self.exceptions[date]
+        key = self.users.pop(user_id, None)
+        if key is None:
+            return
+        members = self.members[key]
+        members.discard(user_id)
+        if members:
+            return
+        del self.members[key]
+        for slot in self.groups.pop(key):
+            for index, value in ((self.by_location, slot.location), (self.by_teacher, slot.teacher),
+                                 (self.by_name, slot.name)):
+                groups = index.get(value)
+                if groups is not None:
+                    groups.discard(key)
+                    if not groups:
+                        del index[value]
+
+    def _weeks_mask(self, text: str) -> int:
+        mask = self._weeks.get(text)
+        if mask is None:
+            mask = self._weeks[text] = parse_weeks(text)
+        return mask
+
+    def _matches(self, slot: CourseSlot, field: str, value: str, periods: PeriodTable,
+                 weekday: Optional[int], week: Optional[int], minute: Optional[int]) -> bool:
+        if getattr(slot, field) != value:
+            return False
+        if weekday is not None and slot.weekday != weekday:
+            return False
+        if not in_week(self._weeks_mask(slot.weeks), week):
+            return False
+        if minute is not None:
+            span = periods.minutes(slot.time)
+            if span is None or not span[0] <= minute < span[1]:
+                return False
+        return True
+
+    def query(self, field: str, value: str, periods: PeriodTable,
+              weekday: Optional[int] = None, week: Optional[int] = None,
+              minute: Optional[int] = None, date: Optional[str] = None) -> List[Tuple[CourseSlot, int]]:
+        """
+        查询某个地点（location）、教师（teacher）或课程名（name）的课程，可按星期、教学周和时刻（一天内的分钟）过滤，
+        给出日期（YYYY-MM-DD）时应用当天的停课和调教室；相同的课程合并，返回(课程, 上课人数)，结果按星期和上课时间排序
+        """
+        value = value.strip()
+        index = {"location": self.by_location, "teacher": self.by_teacher, "name": self.by_name}[field]
+        matched: Dict[CourseSlot, int] = {}
+        for key in index.get(value, ()):
+            for slot in self.groups[key]:
+                if self._matches(slot, field, value, periods, weekday, week, minute):
+                    matched[slot] = matched.get(slot, 0) + len(self.members[key])
+        # 当天有临时变动的用户从原来的课程中减去，调教室后按新地点重新计入
+        for user_id, changes in self.exceptions.get(date, {}).items() if date else ():
+            for slot in self.groups[self.users[user_id]]:
+                change = changes.get(course_signature({"day": WEEKDAYS[slot.weekday], "time": slot.time,
+                                                       "name": slot.name}))
+                if not change:
+                    continue
+                if self._matches(slot, field, value, periods, weekday, week, minute):
+                    matched[slot] -= 1
+                    if not matched[slot]:
+                        del matched[slot]
+                if change.get("cancel"):
+                    continue
+                moved = slot._replace(**{k: str(v).strip() for k, v in change.items() if k in CourseSlot._fields
+                                         and k not in ("weekday", "weeks")})
+                if self._matches(moved, field, value, periods, weekday, week, minute):
+                    matched[moved] = matched.get(moved, 0) + 1
+        results = list(matched.items())
+        results.sort(key=lambda item: (item[0].weekday, (periods.minutes(item[0].time) or (1440,))[0], item[0].name))
+        return results
+
+    def stats(self) -> Dict[str, int]:
+        """分组、地点和教师数量"""
+        return {"groups": len(self.groups), "locations": len(self.by_location), "teachers": len(self.by_teacher)}
@@ -12,31 +12,35 @@ from PIL import Image
 import pytesseract
 from datetime import datetime
 import locale
+from .timetable import PeriodTable
 
-def parse_word(file_path: str) -> List[Dict[str, Any]]:
+def parse_word(file_path: str, periods: Optional[PeriodTable] = None) -> List[Dict[str, Any]]:
     """解析Word格式的课程表"""
-    parser = ScheduleParser()
+    parser = ScheduleParser(periods)
     return parser.parse_word(file_path)
 
-def parse_xlsx(file_path: str) -> List[Dict[str, Any]]:
+def parse_xlsx(file_path: str, periods: Optional[PeriodTable] = None) -> List[Dict[str, Any]]:
     """解析Excel格式的课程表"""
-    parser = ScheduleParser()
+    parser = ScheduleParser(periods)
     return parser.parse_xlsx(file_path)
 
-def parse_image(file_path: str) -> List[Dict[str, Any]]:
+def parse_image(file_path: str, periods: Optional[PeriodTable] = None) -> List[Dict[str, Any]]:
     """解析图片格式的课程表"""
-    parser = ScheduleParser()
+    parser = ScheduleParser(periods)
     return parser.parse_image(file_path)
 
-def parse_text_schedule(text: str) -> List[Dict[str, Any]]:
+def parse_text_schedule(text: str, periods: Optional[PeriodTable] = None) -> List[Dict[str, Any]]:
     """解析文本格式的课程表"""
-    parser = ScheduleParser()
+    parser = ScheduleParser(periods)
     return parser.parse_text_schedule(text)
 
 class ScheduleParser:
-    def __init__(self):
+    def __init__(self, periods: Optional[PeriodTable] = None):
         # 设置中文环境
-        locale.setlocale(locale.LC_ALL, 'zh_CN.UTF-8')
+        try:
+            locale.setlocale(locale.LC_ALL, 'zh_CN.UTF-8')
+        except locale.Error:
+            pass
         
         # 星期映射
         self.week_map = {
@@ -49,14 +53,8 @@ class ScheduleParser:
             'Sunday': '星期日'
         }
         
-        # 时间映射
-        self.time_map = {
-            '第1-2节': '08:00-09:40',
-            '第3-4节': '10:00-11:40',
-            '第5-6节': '14:00-15:40',
-            '第7-8节': '16:00-17:40',
-            '第9-10节': '19:00-20:40'
-        }
+        # 作息时间表，节次转换为具体时间
+        self.periods = periods or PeriodTable()
 
     def parse_word(self, file_path: str) -> List[Dict[str, Any]]:
         """解析Word格式的课程表"""
@@ -224,9 +222,4 @@ class ScheduleParser:
     def _standardize_time(self, time: str) -> str:
         """标准化时间格式"""
         # 如果是节次格式，转换为具体时间
-        if '第' in time and '节' in time:
-            for key, value in self.time_map.items():
-                if key in time:
-                    return value
-        
-        return time 
\ No newline at end of file
+        return self.periods.standardize(time)
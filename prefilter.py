@@ -0,0 +1,65 @@
+"""
+课程表预筛模块
+根据星期、节次、教师、周次等特征和消息长度、行数打分，只有像课程表的消息才交给AI解析
+"""
+import re
+from typing import Dict, Tuple
+
+WEEKDAY_PATTERN = re.compile(r"(?:星期|周)[一二三四五六日天]")
+PERIOD_PATTERN = re.compile(r"第\s*\d+\s*(?:[-~～至]\s*\d+\s*)?节")
+TEACHER_PATTERN = re.compile(r"教师|老师|任课")
+WEEKS_PATTERN = re.compile(r"\d+\s*[-~～至]\s*\d+\s*周|周次")
+CLOCK_PATTERN = re.compile(r"\d{1,2}[:：]\d{2}")
+COURSE_PATTERN = re.compile(r"课程|上课|地点|教室")
+
+
+class ScheduleClassifier:
+    def __init__(self, enable: bool = True, min_length: int = 40, min_lines: int = 3, threshold: int = 4):
+        """
+        初始化预筛器
+
+        Args:
+            enable: 是否启用，关闭时所有消息都放行
+            min_length: 最短字数
+            min_lines: 最少行数
+            threshold: 放行所需的最低分
+        """
+        self.enable = enable
+        self.min_length = min_length
+        self.min_lines = min_lines
+        self.threshold = threshold
+        self.passed = 0
+        self.rejected = 0
+
+    def score(self, text: str) -> int:
+        """计算消息像课程表的程度"""
+        score = min(len(set(WEEKDAY_PATTERN.findall(text))), 3)
+        score += min(len(PERIOD_PATTERN.findall(text)), 2)
+        if TEACHER_PATTERN.search(text):
+            score += 1
+        if WEEKS_PATTERN.search(text):
+            score += 1
+        if CLOCK_PATTERN.search(text):
+            score += 1
+        if COURSE_PATTERN.search(text):
+            score += 1
+        return score
+
+    def classify(self, text: str) -> Tuple[bool, int]:
+        """判断消息是否可能是课程表，返回是否放行和得分"""
+        if not self.enable:
+            self.passed += 1
+            return True, 0
+        if len(text) < self.min_length or text.count("\n") + 1 < self.min_lines:
+            self.rejected += 1
+            return False, 0
+        score = self.score(text)
+        if score >= self.threshold:
+            self.passed += 1
+            return True, score
+        self.rejected += 1
+        return False, score
+
+    def stats(self) -> Dict[str, int]:
+        """获取放行和拦截次数"""
+        return {"passed": self.passed, "rejected": self.rejected}
@@ -0,0 +1,139 @@
+"""
+性能分析模块
+在指定时间窗口内开启cProfile、线程栈采样和tracemalloc，结束后把耗时最多的函数和内存分配位置写入报告
+"""
+import os
+import io
+import re
+import sys
+import time
+import pstats
+import asyncio
+import cProfile
+import threading
+import tracemalloc
+from collections import Counter
+from datetime import datetime
+from typing import Optional
+
+PLUGIN_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+class StackSampler:
+    """后台线程定时采样所有线程的调用栈，覆盖在线程池中执行的图库操作"""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples = 0
+        self.leaf = Counter()  # 栈顶函数
+        self.inclusive = Counter()  # 出现在栈中的函数
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="kcb-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                self.samples += 1
+                self.leaf[self._key(frame)] += 1
+                seen = set()
+                while frame is not None:
+                    key = self._key(frame)
+                    if key not in seen:
+                        seen.add(key)
+                        self.inclusive[key] += 1
+                    frame = frame.f_back
+
+    @staticmethod
+    def _key(frame) -> str:
+        code = frame.f_code
+        return f"{code.co_filename}:{code.co_firstlineno}({code.co_name})"
+
+
+class Profiler:
+    def __init__(self, report_dir: str):
+        """
+        初始化性能分析器
+
+        Args:
+            report_dir: 报告保存目录
+        """
+        self.report_dir = report_dir
+        self.running = False
+        os.makedirs(report_dir, exist_ok=True)
+
+    async def run(self, duration: int, top: int = 30) -> str:
+        """在事件循环线程中开启分析，持续duration秒，返回报告路径"""
+        if self.running:
+            raise RuntimeError("性能分析正在进行中")
+        self.running = True
+        started_tracing = not tracemalloc.is_tracing()
+        profile = cProfile.Profile()
+        sampler = StackSampler()
+        try:
+            if started_tracing:
+                tracemalloc.start(10)
+            before = tracemalloc.take_snapshot()
+            sampler.start()
+            start = time.perf_counter()
+            profile.enable()
+            try:
+                await asyncio.sleep(duration)
+            finally:
+                profile.disable()
+                sampler.stop()
+            elapsed = time.perf_counter() - start
+            after = tracemalloc.take_snapshot()
+            return await asyncio.to_thread(self._write_report, profile, sampler, before, after, elapsed, top)
+        finally:
+            if started_tracing:
+                tracemalloc.stop()
+            self.running = False
+
+    def _write_report(self, profile: cProfile.Profile, sampler: StackSampler,
+                      before: tracemalloc.Snapshot, after: tracemalloc.Snapshot,
+                      elapsed: float, top: int) -> str:
+        """生成报告文件"""
+        out = io.StringIO()
+        out.write(f"性能分析报告 {datetime.now().isoformat(timespec='seconds')}\n")
+        out.write(f"分析时长：{elapsed:.1f}秒\n\n")
+
+        out.write(f"==== 插件内累计耗时最多的函数（事件循环线程，前{top}） ====\n")
+        stats = pstats.Stats(profile, stream=out)
+        stats.sort_stats("cumulative").print_stats(re.escape(PLUGIN_DIR), top)
+
+        out.write(f"\n==== 自身耗时最多的函数（事件循环线程，前{top}） ====\n")
+        stats.sort_stats("tottime").print_stats(top)
+
+        out.write(f"\n==== 栈采样（所有线程，共{sampler.samples}个样本） ====\n")
+        out.write("-- 插件内函数（包含子调用） --\n")
+        plugin_funcs = [(k, n) for k, n in sampler.inclusive.most_common() if k.startswith(PLUGIN_DIR)]
+        for key, n in plugin_funcs[:top]:
+            out.write(f"{n:>8} {n / max(sampler.samples, 1):6.1%}  {key}\n")
+        out.write("-- 栈顶函数 --\n")
+        for key, n in sampler.leaf.most_common(top):
+            out.write(f"{n:>8} {n / max(sampler.samples, 1):6.1%}  {key}\n")
+
+        out.write(f"\n==== 新增内存分配最多的位置（前{top}） ====\n")
+        for stat in after.compare_to(before, "lineno")[:top]:
+            out.write(f"{stat}\n")
+
+        out.write(f"\n==== 当前内存占用最多的位置（前{top}） ====\n")
+        for stat in after.statistics("lineno")[:top]:
+            out.write(f"{stat}\n")
+
+        path = os.path.join(self.report_dir, f"profile_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt")
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(out.getvalue())
+        return path
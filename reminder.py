@@ -2,249 +2,348 @@
 课程提醒模块
 负责定时检查和发送课程提醒
 """
-import os
 import json
-import asyncio
-import logging
+import hashlib
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable, Awaitable, Any
-import locale
+from typing import Dict, List, Optional, Set, Tuple
+from .sender import PRIORITY_REMINDER, PRIORITY_DIGEST
+from .timetable import PeriodTable
+from .school_calendar import SchoolCalendar, parse_weeks, in_week
 
-class CourseReminder:
-    def __init__(self, data_dir: str, reminder_time: int = 10):
+# 星期名称，下标与datetime.weekday()一致
+WEEKDAYS = ['星期一', '星期二', '星期三', '星期四', '星期五', '星期六', '星期日']
+
+# 课程提醒模板
+REMINDER_TEMPLATE = """同学你好，待会有课哦
+上课时间（节次和时间）：
+课程名称
+教师：老师姓名
+上课地点：教室/场地"""
+
+def course_signature(course: Dict) -> str:
+    """课程标识，用于按日期的停课、调教室记录"""
+    return f"{course.get('day', '')}|{course.get('time', '')}|{course.get('name', '')}"
+
+
+def apply_exception(course: Dict, change: Optional[Dict]) -> Optional[Dict]:
+    """应用某一天的临时变动，停课时返回None"""
+    if not change:
+        return course
+    if change.get("cancel"):
+        return None
+    return {**course, **change}
+
+
+def render_reminder(course: Dict, periods: PeriodTable) -> str:
+    """生成课前提醒消息"""
+    message = REMINDER_TEMPLATE.replace("上课时间（节次和时间）：", f"上课时间：{periods.format(course['time'])}")
+    message = message.replace("课程名称", course['name'])
+    message = message.replace("老师姓名", course['teacher'])
+    message = message.replace("教室/场地", course['location'])
+    return message
+
+
+def render_digest(day: str, courses: List[Dict], periods: PeriodTable) -> str:
+    """生成每日课程汇总消息"""
+    message = f"📚 明日（{day}）课程安排：\n\n"
+    for course in courses:
+        message += f"时间：{periods.format(course['time'])}\n"
+        message += f"课程：{course['name']}\n"
+        message += f"教师：{course['teacher']}\n"
+        message += f"地点：{course['location']}\n"
+        message += f"周次：{course['weeks']}\n\n"
+    message += "是否开启明日课程提醒？回复\"是\"开启提醒。"
+    return message
+
+
+def class_start(occurrence: str) -> Optional[datetime]:
+    """课前提醒对应的上课时间，每日汇总返回None"""
+    if not occurrence.startswith("r"):
+        return None
+    try:
+        return datetime.strptime(occurrence[1:13], "%Y%m%d%H%M")
+    except ValueError:
+        return None
+
+
+def group_key(user_id: str, data: Dict) -> str:
+    """用户所属的提醒分组：没有个人改动时按班级课程表分组，否则单独一组"""
+    class_id = data.get("class_id")
+    if class_id and not data.get("overrides"):
+        return class_id
+    return f"user:{user_id}"
+
+
+class ReminderScheduler:
+    def __init__(self, config: Dict):
         """
-        初始化课程提醒器
-        
+        初始化提醒调度器
+        按课程开始时间建立索引，同一班级课程表只计算一次，再按提前量分发给班级成员
+
         Args:
-            data_dir: 数据目录路径
-            reminder_time: 提前提醒时间（分钟）
+            config: 插件配置，使用time_slots、reminder_time、enable_auto_reminder、
+                enable_daily_reminder和daily_reminder_time
         """
-        self.data_dir = data_dir
-        self.reminder_time = reminder_time
-        self.logger = logging.getLogger("CourseReminder")
-        self.reminder_tasks: Dict[str, asyncio.Task] = {}
-        self.callback: Optional[Callable[[str, List[Dict]], Awaitable[None]]] = None
-        
-        # 设置中文环境
-        locale.setlocale(locale.LC_ALL, 'zh_CN.UTF-8')
-        
-        # 创建数据目录
-        os.makedirs(data_dir, exist_ok=True)
-        
-        # 星期映射
-        self.week_map = {
-            'Monday': '星期一',
-            'Tuesday': '星期二',
-            'Wednesday': '星期三',
-            'Thursday': '星期四',
-            'Friday': '星期五',
-            'Saturday': '星期六',
-            'Sunday': '星期日'
+        self.periods = PeriodTable(config.get("time_slots"))
+        self.reminder_time = config.get("reminder_time", 30)
+        self.enable_auto = config.get("enable_auto_reminder", True)
+        self.enable_daily = config.get("enable_daily_reminder", True)
+        self.daily_time = config.get("daily_reminder_time", "23:00")
+
+        self.groups: Dict[str, Dict] = {}  # 分组 -> {courses, reminders: 提前量 -> 用户集合, daily: 用户集合}
+        self.starts: Dict[int, Dict[str, List[int]]] = {}  # 一周内的上课分钟 -> 分组 -> 课程下标
+        self.digests: List[Set[str]] = [set() for _ in WEEKDAYS]  # 星期 -> 当天有课的分组
+        self.calendar = SchoolCalendar()
+        self._weeks: Dict[str, int] = {}  # 周次文本 -> 位掩码
+        self.offsets: Dict[int, int] = {}  # 提前量 -> 使用人数
+        self.users: Dict[str, Tuple[str, Optional[int], bool]] = {}  # 用户 -> (分组, 提前量, 每日汇总)
+        self.exceptions: Dict[str, Dict[str, Dict[str, Dict]]] = {}  # 日期 -> 用户 -> 课程标识 -> 临时变动
+
+    def load(self, schedules: Dict[str, Dict]):
+        """重建全部索引"""
+        self.groups.clear()
+        self.starts.clear()
+        self.offsets.clear()
+        self.users.clear()
+        self.exceptions.clear()
+        for day_groups in self.digests:
+            day_groups.clear()
+        for user_id, data in schedules.items():
+            self.set_user(user_id, data)
+
+    def set_user(self, user_id: str, data: Dict):
+        """更新一个用户的课程表和设置"""
+        self.remove_user(user_id)
+        key = group_key(user_id, data)
+        group = self.groups.get(key)
+        if group is None:
+            group = self._add_group(key, data.get("courses", []))
+
+        settings = data.get("settings", {})
+        offset = None
+        if settings.get("enable_reminder", True):
+            offset = settings.get("reminder_time", self.reminder_time)
+            group["reminders"].setdefault(offset, set()).add(user_id)
+            self.offsets[offset] = self.offsets.get(offset, 0) + 1
+        daily = settings.get("enable_daily_reminder", True)
+        if daily:
+            group["daily"].add(user_id)
+        self.users[user_id] = (key, offset, daily)
+        for date, changes in data.get("exceptions", {}).items():
+            self.exceptions.setdefault(date, {})[user_id] = changes
+
+    def remove_user(self, user_id: str):
+        """移除一个用户"""
+        entry = self.users.pop(user_id, None)
+        if entry is None:
+            return
+        key, offset, daily = entry
+        for date in [date for date, users in self.exceptions.items() if user_id in users]:
+            del self.exceptions[date][user_id]
+            if not self.exceptions[date]:
+                del self.exceptions[date]
+        group = self.groups[key]
+        if offset is not None:
+            members = group["reminders"][offset]
+            members.discard(user_id)
+            if not members:
+                del group["reminders"][offset]
+            self.offsets[offset] -= 1
+            if not self.offsets[offset]:
+                del self.offsets[offset]
+        if daily:
+            group["daily"].discard(user_id)
+        if not group["reminders"] and not group["daily"]:
+            self._remove_group(key)
+
+    def _add_group(self, key: str, courses: List[Dict]) -> Dict:
+        group = self.groups[key] = {
+            "courses": courses,
+            "weeks": [self._weeks_mask(course.get("weeks", "")) for course in courses],
+            "reminders": {},
+            "daily": set(),
+            "starts": []
         }
+        self._index_starts(key)
+        days = {course.get("day") for course in courses}
+        for day, day_groups in zip(WEEKDAYS, self.digests):
+            if day in days:
+                day_groups.add(key)
+        return group
 
-    def set_callback(self, callback: Callable[[str, List[Dict]], Awaitable[None]]):
-        """设置提醒回调函数"""
-        self.callback = callback
-
-    async def start_reminder(self, user_id: str, schedule: List[Dict]):
-        """启动提醒任务"""
-        if user_id in self.reminder_tasks:
-            self.reminder_tasks[user_id].cancel()
-        
-        self.reminder_tasks[user_id] = asyncio.create_task(
-            self._reminder_loop(user_id, schedule)
-        )
-
-    async def stop_reminder(self, user_id: str):
-        """停止提醒任务"""
-        if user_id in self.reminder_tasks:
-            self.reminder_tasks[user_id].cancel()
-            del self.reminder_tasks[user_id]
-
-    async def _reminder_loop(self, user_id: str, schedule: List[Dict]):
-        """提醒循环"""
-        while True:
-            try:
-                # 获取当前时间
-                now = datetime.now()
-                
-                # 获取今日课程
-                today_schedule = self._get_today_courses(schedule)
-                
-                # 检查是否需要提醒
-                for course in today_schedule:
-                    course_time = self._parse_course_time(course['time'])
-                    if course_time:
-                        reminder_time = course_time - timedelta(minutes=self.reminder_time)
-                        if now >= reminder_time and now < course_time:
-                            # 发送提醒
-                            if self.callback:
-                                await self.callback(user_id, [course])
-                
-                # 等待一分钟
-                await asyncio.sleep(60)
-            except asyncio.CancelledError:
-                break
-            except Exception as e:
-                self.logger.error(f"提醒循环出错: {str(e)}")
-                await asyncio.sleep(60)
-
-    def _get_today_courses(self, schedule: List[Dict]) -> List[Dict]:
-        """获取今日课程"""
-        # 获取当前星期
-        today = datetime.now().strftime('%A')
-        current_day = self.week_map.get(today, '未知')
-        
-        # 获取当前周次
-        current_week = self._get_current_week()
-        
-        # 筛选今日课程
-        today_schedule = [
-            course for course in schedule
-            if course['day'] == current_day
-            and current_week >= course['start_week']
-            and current_week <= course['end_week']
-        ]
-        
-        # 按节次排序
-        today_schedule.sort(key=lambda x: x['period'])
-        
-        return today_schedule
-
-    def _parse_course_time(self, time_str: str) -> Optional[datetime]:
-        """解析课程时间"""
-        try:
-            # 解析时间字符串（格式：HH:MM-HH:MM）
-            start_time = time_str.split('-')[0]
-            hour, minute = map(int, start_time.split(':'))
-            
-            # 获取当前日期
-            now = datetime.now()
-            
-            # 创建课程时间
-            course_time = now.replace(hour=hour, minute=minute, second=0, microsecond=0)
-            
-            return course_time
-        except Exception as e:
-            self.logger.error(f"解析课程时间失败: {str(e)}")
-            return None
+    def _weeks_mask(self, text: str) -> int:
+        mask = self._weeks.get(text)
+        if mask is None:
+            mask = self._weeks[text] = parse_weeks(text)
+        return mask
 
-    def _get_current_week(self) -> int:
-        """获取当前周次"""
-        # 假设第一周从9月1日开始
-        start_date = datetime(2024, 9, 1)
-        current_date = datetime.now()
-        
-        # 计算周差
-        week_diff = (current_date - start_date).days // 7
-        return week_diff + 1 
-
-    def get_today_weekday(self) -> str:
-        """获取今天的星期"""
-        return self.week_map.get(datetime.now().strftime('%A'), '未知')
-
-    def get_class_time_from_str(self, time_str: str) -> Optional[tuple]:
-        """从时间字符串解析上课时间"""
-        try:
-            # 解析时间字符串（格式：HH:MM-HH:MM）
-            start_time = time_str.split('-')[0]
-            hour, minute = map(int, start_time.split(':'))
-            return (hour, minute)
-        except:
-            return None
+    def set_calendar(self, calendar: SchoolCalendar):
+        """更换校历"""
+        self.calendar = calendar
+
+    def _remove_group(self, key: str):
+        self._unindex_starts(key)
+        del self.groups[key]
+        for day_groups in self.digests:
+            day_groups.discard(key)
 
-    def load_schedule(self, user_id: str) -> List[Dict[str, Any]]:
-        """加载用户的课程表"""
-        try:
-            file_path = os.path.join(self.data_dir, f"{user_id}.json")
-            if not os.path.exists(file_path):
-                return []
-            
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-                return data.get('courses', [])
-        except Exception as e:
-            print(f"加载课程表失败: {str(e)}")
-            return []
-
-    def get_today_courses(self, user_id: str) -> List[Dict[str, Any]]:
-        """获取用户今天的课程"""
-        today = self.get_today_weekday()
-        courses = self.load_schedule(user_id)
-        
-        # 筛选今天的课程
-        today_courses = [
-            course for course in courses
-            if course['day'] == today
-        ]
-        
-        # 按时间排序
-        today_courses.sort(key=lambda x: self.get_class_time_from_str(x['time']))
-        
-        return today_courses
-
-    def get_upcoming_courses(self, user_id: str) -> List[Dict[str, Any]]:
-        """获取即将开始的课程"""
-        now = datetime.now()
-        today_courses = self.get_today_courses(user_id)
-        upcoming_courses = []
-        
-        for course in today_courses:
-            class_time = self.get_class_time_from_str(course['time'])
-            if not class_time:
+    def _index_starts(self, key: str):
+        """按上课时间索引分组内的课程"""
+        group = self.groups[key]
+        for index, course in enumerate(group["courses"]):
+            minute = self._start_minute(course)
+            if minute is None:
                 continue
-            
-            # 计算课程开始时间
-            class_dt = now.replace(
-                hour=class_time[0],
-                minute=class_time[1],
-                second=0,
-                microsecond=0
-            )
-            
-            # 计算时间差（分钟）
-            time_diff = (class_dt - now).total_seconds() / 60
-            
-            # 如果课程即将开始（在提醒时间范围内）
-            if 0 < time_diff <= self.reminder_time:
-                upcoming_courses.append(course)
-        
-        return upcoming_courses
-
-    async def check_and_remind(self, callback) -> None:
-        """检查并发送提醒"""
-        try:
-            # 遍历所有用户
-            for file_name in os.listdir(self.data_dir):
-                if not file_name.endswith('.json'):
-                    continue
-                
-                user_id = file_name[:-5]  # 移除.json后缀
-                
-                # 获取即将开始的课程
-                upcoming_courses = self.get_upcoming_courses(user_id)
-                
-                # 发送提醒
-                for course in upcoming_courses:
-                    reminder_msg = (
-                        f"上课提醒：\n"
-                        f"课程：{course['course_name']}\n"
-                        f"时间：{course['time']}\n"
-                        f"地点：{course['classroom']}\n"
-                        f"教师：{course['teacher']}"
-                    )
-                    await callback(user_id, reminder_msg)
-        except Exception as e:
-            print(f"检查课程提醒失败: {str(e)}")
-
-    async def start_reminder_loop(self, callback, interval: int = 60) -> None:
+            self.starts.setdefault(minute, {}).setdefault(key, []).append(index)
+            group["starts"].append(minute)
+
+    def _unindex_starts(self, key: str):
+        group = self.groups[key]
+        for minute in group["starts"]:
+            slot = self.starts.get(minute)
+            if slot is not None:
+                slot.pop(key, None)
+                if not slot:
+                    del self.starts[minute]
+        group["starts"] = []
+
+    def _start_minute(self, course: Dict) -> Optional[int]:
+        """计算上课时间在一周内的分钟"""
+        if course.get("day") not in WEEKDAYS:
+            return None
+        start = self.periods.start_minute(course.get("time", ""))
+        if start is None:
+            return None
+        return WEEKDAYS.index(course["day"]) * 1440 + start
+
+    def set_time_slots(self, time_slots: Dict[str, str]) -> int:
+        """作息时间变化后只重建涉及变动节次的分组，返回重建的分组数"""
+        periods = PeriodTable(time_slots)
+        changed = self.periods.changed_periods(periods)
+        old_periods, self.periods = self.periods, periods
+        if not changed:
+            return 0
+        rebuilt = 0
+        for key, group in self.groups.items():
+            # 新旧作息表中任一节次有变化的分组都需要重建
+            if any(old_periods.period_of(c.get("time", "")) in changed or periods.period_of(c.get("time", "")) in changed
+                   for c in group["courses"]):
+                self._unindex_starts(key)
+                self._index_starts(key)
+                rebuilt += 1
+        return rebuilt
+
+    def due(self, now: datetime) -> List[Tuple[str, str, int, str]]:
         """
-        启动提醒循环
-        
-        Args:
-            callback: 提醒回调函数，接收用户ID和提醒消息
-            interval: 检查间隔（秒）
+        返回当前分钟需要发送的消息（用户ID，内容，优先级，发送记录标识），每条消息只生成一次再分发给组内成员
+        发送记录标识区分哪一天的汇总、哪一次上课的提醒，用于避免重复发送
         """
-        while True:
-            await self.check_and_remind(callback)
-            await asyncio.sleep(interval) 
\ No newline at end of file
+        messages = []
+        if self.enable_daily and now.strftime("%H:%M") == self.daily_time:
+            # 按校历取明天实际上哪天的课，放假则不发送
+            tomorrow_date = (now + timedelta(days=1)).date()
+            info = self.calendar.lookup(tomorrow_date)
+            tomorrow = WEEKDAYS[info.weekday]
+            exceptions = self.exceptions.get(tomorrow_date.isoformat(), {})
+            occurrence = f"d{tomorrow_date:%Y%m%d}"
+            for key in self.digests[info.weekday] if not info.no_class else ():
+                group = self.groups[key]
+                if not group["daily"]:
+                    continue
+                courses = [c for c, mask in zip(group["courses"], group["weeks"])
+                           if c.get("day") == tomorrow and in_week(mask, info.week)]
+                if not courses:
+                    continue
+                message = render_digest(tomorrow, courses, self.periods)
+                for user_id in group["daily"]:
+                    if user_id in exceptions:
+                        # 有停课或调教室的用户单独生成
+                        changes = exceptions[user_id]
+                        changed = [apply_exception(c, changes.get(course_signature(c))) for c in courses]
+                        changed = [c for c in changed if c is not None]
+                        if changed:
+                            messages.append((user_id, render_digest(tomorrow, changed, self.periods),
+                                             PRIORITY_DIGEST, occurrence))
+                    else:
+                        messages.append((user_id, message, PRIORITY_DIGEST, occurrence))
+
+        if self.enable_auto:
+            for offset in self.offsets:
+                # 提前量跨过零点时，上课时间落在第二天；调休日按校历中的星期查找
+                class_time = now + timedelta(minutes=offset)
+                info = self.calendar.lookup(class_time.date())
+                if info.no_class:
+                    continue
+                slot = self.starts.get(info.weekday * 1440 + class_time.hour * 60 + class_time.minute)
+                if not slot:
+                    continue
+                exceptions = self.exceptions.get(class_time.date().isoformat(), {})
+                for key, indexes in slot.items():
+                    group = self.groups[key]
+                    members = group["reminders"].get(offset)
+                    if not members:
+                        continue
+                    for index in indexes:
+                        if not in_week(group["weeks"][index], info.week):
+                            continue
+                        course = group["courses"][index]
+                        message = render_reminder(course, self.periods)
+                        occurrence = f"r{class_time:%Y%m%d%H%M}|{course.get('name', '')}"
+                        if not exceptions:
+                            messages.extend((user_id, message, PRIORITY_REMINDER, occurrence) for user_id in members)
+                            continue
+                        signature = course_signature(course)
+                        for user_id in members:
+                            change = exceptions.get(user_id, {}).get(signature)
+                            if change is None:
+                                messages.append((user_id, message, PRIORITY_REMINDER, occurrence))
+                                continue
+                            changed = apply_exception(course, change)
+                            if changed is not None:
+                                messages.append((user_id, render_reminder(changed, self.periods),
+                                                 PRIORITY_REMINDER, occurrence))
+        return messages
+
+    def config_hash(self) -> str:
+        """影响索引和消息内容的配置的哈希，与快照中的不同时需要重建"""
+        data = json.dumps({
+            "time_slots": self.periods.source,
+            "reminder_time": self.reminder_time,
+            "enable_auto": self.enable_auto,
+            "enable_daily": self.enable_daily,
+            "daily_time": self.daily_time
+        }, ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()
+
+    def export_state(self) -> Dict:
+        """导出全部索引，用于保存快照"""
+        return {
+            "groups": self.groups,
+            "starts": self.starts,
+            "digests": self.digests,
+            "offsets": self.offsets,
+            "users": self.users,
+            "exceptions": self.exceptions,
+            "weeks": self._weeks
+        }
+
+    def import_state(self, state: Dict, schedules: Dict[str, Dict]):
+        """从快照恢复索引，分组的课程列表重新指向课程表中的共享列表"""
+        self.groups = state["groups"]
+        self.starts = state["starts"]
+        self.digests = state["digests"]
+        self.offsets = state["offsets"]
+        self.users = state["users"]
+        self.exceptions = state["exceptions"]
+        self._weeks = state["weeks"]
+        linked = set()
+        for user_id, (key, _, _) in self.users.items():
+            data = schedules.get(user_id)
+            if key in linked or data is None or group_key(user_id, data) != key:
+                continue
+            self.groups[key]["courses"] = data.get("courses", [])
+            linked.add(key)
+
+    def stats(self) -> Dict[str, int]:
+        """用户数和分组数"""
+        return {"users": len(self.users), "groups": len(self.groups)}
@@ -0,0 +1,230 @@
+"""
+课程表图片模块
+把一周课程画成按星期和节次排列的表格图片，按课程表内容哈希缓存，同班同学共用同一张图
+"""
+import os
+import json
+import hashlib
+import logging
+import threading
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+from PIL import Image, ImageDraw, ImageFont
+from .reminder import WEEKDAYS
+from .timetable import PeriodTable
+
+RENDER_VERSION = 1
+
+# 常见的中文字体位置，未配置字体时依次尝试
+FONT_CANDIDATES = [
+    "/usr/share/fonts/opentype/noto/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/google-noto-cjk/NotoSansCJK-Regular.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-microhei.ttc",
+    "/usr/share/fonts/wenquanyi/wqy-microhei/wqy-microhei.ttc",
+    "/usr/share/fonts/truetype/wqy/wqy-zenhei.ttc",
+    "/System/Library/Fonts/PingFang.ttc",
+    "C:/Windows/Fonts/msyh.ttc",
+    "C:/Windows/Fonts/simhei.ttf",
+]
+
+HEADER_BG = (64, 110, 170)
+HEADER_FG = (255, 255, 255)
+GRID = (210, 214, 220)
+CELL_BG = [(232, 243, 255), (255, 243, 224), (232, 248, 236), (250, 234, 240), (240, 236, 252), (255, 250, 220)]
+TEXT = (40, 40, 40)
+MUTED = (110, 110, 110)
+
+
+def find_font(font_path: str = "") -> Optional[str]:
+    """返回可用的字体文件，找不到时返回None"""
+    for path in ([font_path] if font_path else []) + FONT_CANDIDATES:
+        if path and os.path.exists(path):
+            return path
+    return None
+
+
+class TimetableRenderer:
+    def __init__(self, cache_dir: str, font_path: str = "", max_files: int = 2000):
+        """
+        初始化课程表图片渲染
+
+        Args:
+            cache_dir: 图片缓存目录
+            font_path: 中文字体文件，为空时自动查找系统字体
+            max_files: 最多缓存的图片数，超出时删除最久未使用的
+        """
+        self.cache_dir = cache_dir
+        self.font_path = find_font(font_path)
+        self.max_files = max_files
+        self.logger = logging.getLogger("TimetableRenderer")
+        self._fonts: Dict[int, ImageFont.FreeTypeFont] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        # 内容哈希 -> 文件路径，按最近使用排序
+        self.entries: "OrderedDict[str, str]" = OrderedDict()
+        files = [name for name in os.listdir(cache_dir) if name.endswith(".png")]
+        files.sort(key=lambda name: os.path.getmtime(os.path.join(cache_dir, name)))
+        for name in files:
+            self.entries[name[:-4]] = os.path.join(cache_dir, name)
+        if self.font_path is None:
+            self.logger.warning("未找到中文字体，课程表图片不可用，请在配置中指定字体文件")
+
+    @property
+    def available(self) -> bool:
+        """是否可以渲染"""
+        return self.font_path is not None
+
+    @staticmethod
+    def cache_key(courses: List[Dict], periods: PeriodTable) -> str:
+        """课程表和作息时间的内容哈希，内容相同的课程表共用同一张图"""
+        data = json.dumps([RENDER_VERSION, periods.source, courses], ensure_ascii=False, sort_keys=True)
+        return hashlib.sha1(data.encode("utf-8")).hexdigest()[:20]
+
+    def cached(self, key: str) -> Optional[str]:
+        """已缓存的图片路径"""
+        with self._lock:
+            path = self.entries.get(key)
+            if path is None:
+                return None
+            if not os.path.exists(path):
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return path
+
+    def render(self, key: str, courses: List[Dict], periods: PeriodTable, title: str = "") -> str:
+        """生成课程表图片并缓存，返回文件路径；较慢，应在线程中调用"""
+        path = self.cached(key)
+        if path is not None:
+            return path
+        image = self._draw(courses, periods, title)
+        path = os.path.join(self.cache_dir, f"{key}.png")
+        tmp_path = path + ".tmp"
+        image.save(tmp_path, format="PNG", optimize=True)
+        os.replace(tmp_path, path)
+        with self._lock:
+            self.entries[key] = path
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_files:
+                _, old_path = self.entries.popitem(last=False)
+                try:
+                    os.remove(old_path)
+                except OSError:
+                    pass
+        return path
+
+    def _font(self, size: int) -> ImageFont.FreeTypeFont:
+        font = self._fonts.get(size)
+        if font is None:
+            font = self._fonts[size] = ImageFont.truetype(self.font_path, size)
+        return font
+
+    @staticmethod
+    def _wrap(draw: ImageDraw.ImageDraw, text: str, font, width: int) -> List[str]:
+        """按像素宽度折行"""
+        lines = []
+        line = ""
+        for char in text:
+            if draw.textlength(line + char, font=font) > width and line:
+                lines.append(line)
+                line = char
+            else:
+                line += char
+        if line:
+            lines.append(line)
+        return lines
+
+    def _rows(self, courses: List[Dict], periods: PeriodTable) -> List[Tuple[str, str]]:
+        """表格的行：作息表中的节次，加上无法识别时间的课程所在的行"""
+        rows = sorted(periods.periods.items(), key=lambda item: item[1])
+        result = [(f"第{key}节", periods.texts[key]) for key, _ in rows]
+        extra = sorted({c.get("time", "") for c in courses if periods.period_of(c.get("time", "")) is None})
+        result.extend((text, "") for text in extra)
+        return result
+
+    def _draw(self, courses: List[Dict], periods: PeriodTable, title: str) -> Image.Image:
+        """画出一周的课程表格"""
+        title_font = self._font(30)
+        head_font = self._font(22)
+        name_font = self._font(20)
+        small_font = self._font(16)
+
+        # 周末没有课时只画周一到周五
+        days = list(WEEKDAYS[:5])
+        for day in WEEKDAYS[5:]:
+            if any(c.get("day") == day for c in courses):
+                days.append(day)
+        rows = self._rows(courses, periods)
+        row_keys = {label: i for i, (label, _) in enumerate(rows)}
+
+        cells: Dict[Tuple[int, int], List[Dict]] = {}
+        for course in courses:
+            if course.get("day") not in days:
+                continue
+            key = periods.period_of(course.get("time", ""))
+            label = f"第{key}节" if key is not None else course.get("time", "")
+            if label in row_keys:
+                cells.setdefault((row_keys[label], days.index(course["day"])), []).append(course)
+
+        label_width, cell_width, title_height, head_height = 130, 200, 60, 44
+        probe = ImageDraw.Draw(Image.new("RGB", (1, 1)))
+
+        # 先排版每个格子的文字，确定每行高度
+        layouts: Dict[Tuple[int, int], List[Tuple[str, ImageFont.FreeTypeFont, Tuple[int, int, int]]]] = {}
+        row_heights = [70] * len(rows)
+        for (row, col), items in cells.items():
+            lines = []
+            for course in items:
+                if lines:
+                    lines.append(("", small_font, MUTED))
+                for text in self._wrap(probe, course.get("name", ""), name_font, cell_width - 16):
+                    lines.append((text, name_font, TEXT))
+                details = [course.get("location", ""), course.get("teacher", ""), course.get("weeks", "")]
+                for text in details:
+                    if text:
+                        for part in self._wrap(probe, str(text), small_font, cell_width - 16):
+                            lines.append((part, small_font, MUTED))
+            layouts[(row, col)] = lines
+            height = sum((26 if font is name_font else 21) for _, font, _ in lines) + 16
+            row_heights[row] = max(row_heights[row], height)
+
+        width = label_width + cell_width * len(days)
+        height = title_height + head_height + sum(row_heights)
+        image = Image.new("RGB", (width, height), (255, 255, 255))
+        draw = ImageDraw.Draw(image)
+
+        draw.text((16, 14), title or "课程表", font=title_font, fill=TEXT)
+        top = title_height
+        draw.rectangle([0, top, width, top + head_height], fill=HEADER_BG)
+        for col, day in enumerate(days):
+            x = label_width + col * cell_width
+            draw.text((x + cell_width / 2, top + head_height / 2), day, font=head_font, fill=HEADER_FG, anchor="mm")
+
+        y = top + head_height
+        for row, (label, clock) in enumerate(rows):
+            row_height = row_heights[row]
+            draw.text((label_width / 2, y + row_height / 2 - (10 if clock else 0)), label,
+                      font=head_font, fill=TEXT, anchor="mm")
+            if clock:
+                draw.text((label_width / 2, y + row_height / 2 + 16), clock, font=small_font, fill=MUTED, anchor="mm")
+            for col in range(len(days)):
+                x = label_width + col * cell_width
+                lines = layouts.get((row, col))
+                if lines:
+                    color = CELL_BG[(row + col) % len(CELL_BG)]
+                    draw.rounded_rectangle([x + 4, y + 4, x + cell_width - 4, y + row_height - 4], radius=8, fill=color)
+                    text_y = y + 10
+                    for text, font, fill in lines:
+                        draw.text((x + 10, text_y), text, font=font, fill=fill)
+                        text_y += 26 if font is name_font else 21
+            draw.line([0, y + row_height, width, y + row_height], fill=GRID)
+            y += row_height
+        for col in range(len(days) + 1):
+            x = label_width + col * cell_width
+            draw.line([x, top + head_height, x, height], fill=GRID)
+        return image
+
+    def stats(self) -> Dict[str, int]:
+        """缓存图片数量"""
+        return {"files": len(self.entries)}
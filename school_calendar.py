@@ -0,0 +1,181 @@
+"""
+校历模块
+从本地JSON或ICS文件导入节假日和调休，预先编译成日期到实际星期、教学周和是否停课的查找表
+"""
+import os
+import re
+import json
+import logging
+from datetime import date, datetime, timedelta
+from typing import Dict, List, NamedTuple, Optional, Tuple
+
+WEEKDAY_CHARS = "一二三四五六日"
+WEEKDAY_PATTERN = re.compile(r"(?:星期|周)([一二三四五六日天])")
+WEEKS_RANGE_PATTERN = re.compile(r"(\d+)\s*(?:[-~～至]\s*(\d+))?")
+
+
+class DayInfo(NamedTuple):
+    weekday: int  # 按哪一天的课表上课，0为星期一
+    week: Optional[int]  # 教学周，未设置开学日期时为None
+    no_class: bool  # 放假不上课
+    name: str  # 节假日或调休名称
+
+
+def parse_weeks(text: str) -> int:
+    """
+    把周次文本转换为位掩码，第n周对应第n位，无法识别时返回0表示每周都上
+
+    支持"1-16周"、"1-8,10-16周"、"3周"、"1-16周(单)"、"双周"等写法
+    """
+    if not text:
+        return 0
+    odd = "单" in text
+    even = "双" in text
+    mask = 0
+    for start, end in WEEKS_RANGE_PATTERN.findall(text):
+        start = int(start)
+        end = int(end) if end else start
+        for week in range(start, min(end, 60) + 1):
+            if (odd and week % 2 == 0) or (even and week % 2 == 1):
+                continue
+            mask |= 1 << week
+    if not mask and (odd or even):
+        # 只写了单双周，按前60周展开
+        for week in range(1, 61):
+            if (week % 2 == 1) == odd:
+                mask |= 1 << week
+    return mask
+
+
+def in_week(mask: int, week: Optional[int]) -> bool:
+    """课程在该教学周是否上课，周次未知或未设置开学日期时视为上课"""
+    return not mask or week is None or (week > 0 and bool(mask >> week & 1))
+
+
+def _parse_date(value: str) -> date:
+    value = value.strip()
+    if re.fullmatch(r"\d{8}", value):
+        return datetime.strptime(value, "%Y%m%d").date()
+    return date.fromisoformat(value[:10])
+
+
+def _weekday_of(text: str) -> Optional[int]:
+    match = WEEKDAY_PATTERN.search(text or "")
+    if not match:
+        return None
+    return WEEKDAY_CHARS.index(match.group(1).replace("天", "日"))
+
+
+class SchoolCalendar:
+    def __init__(self, semester_start: Optional[date] = None, weeks: int = 20,
+                 holidays: Optional[List[Tuple[date, date, str]]] = None,
+                 makeup_days: Optional[List[Tuple[date, int, str]]] = None):
+        """
+        初始化校历
+
+        Args:
+            semester_start: 开学日期（第1周的任意一天），为空时不计算教学周
+            weeks: 学期周数，决定预编译的日期范围
+            holidays: 放假区间列表（开始日期，结束日期，名称），包含两端
+            makeup_days: 调休上课列表（日期，按星期几上课，名称）
+        """
+        self.semester_start = semester_start
+        self.weeks = weeks
+        self.holidays = holidays or []
+        self.makeup_days = makeup_days or []
+        self.days: Dict[date, DayInfo] = {}
+        self._compile()
+
+    def _compile(self):
+        """预编译日期表，覆盖学期范围以及所有节假日、调休日期"""
+        first = None
+        dates = []
+        if self.semester_start:
+            first = self.semester_start - timedelta(days=self.semester_start.weekday())
+            dates = [first + timedelta(days=i) for i in range(self.weeks * 7)]
+        self._first = first
+
+        special: Dict[date, DayInfo] = {}
+        for start, end, name in self.holidays:
+            day = start
+            while day <= end:
+                special[day] = DayInfo(day.weekday(), self._week(first, day), True, name)
+                day += timedelta(days=1)
+        for day, weekday, name in self.makeup_days:
+            special[day] = DayInfo(weekday, self._week(first, day), False, name)
+
+        self.days = {day: DayInfo(day.weekday(), self._week(first, day), False, "") for day in dates}
+        self.days.update(special)
+
+    @staticmethod
+    def _week(first: Optional[date], day: date) -> Optional[int]:
+        if first is None:
+            return None
+        return (day - first).days // 7 + 1
+
+    def lookup(self, day: date) -> DayInfo:
+        """查询某天的实际星期、教学周和是否停课"""
+        info = self.days.get(day)
+        if info is None:
+            # 不在预编译范围内按自然日处理
+            info = DayInfo(day.weekday(), self._week(self._first, day), False, "")
+        return info
+
+    @classmethod
+    def load(cls, path: str, semester_start: str = "", weeks: int = 20) -> "SchoolCalendar":
+        """从JSON或ICS文件加载校历，文件不存在时只使用开学日期"""
+        logger = logging.getLogger("SchoolCalendar")
+        start = _parse_date(semester_start) if semester_start else None
+        holidays: List[Tuple[date, date, str]] = []
+        makeup_days: List[Tuple[date, int, str]] = []
+        if path and os.path.exists(path):
+            if path.lower().endswith(".ics"):
+                holidays, makeup_days = cls._read_ics(path)
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    data = json.load(f)
+                if not start and data.get("semester_start"):
+                    start = _parse_date(data["semester_start"])
+                weeks = data.get("weeks", weeks)
+                for item in data.get("holidays", []):
+                    begin = _parse_date(item.get("start") or item["date"])
+                    end = _parse_date(item.get("end") or item.get("start") or item["date"])
+                    holidays.append((begin, end, item.get("name", "放假")))
+                for item in data.get("makeup_days", []):
+                    day = _parse_date(item["date"])
+                    weekday = _weekday_of(item.get("weekday", ""))
+                    makeup_days.append((day, day.weekday() if weekday is None else weekday, item.get("name", "调休")))
+            logger.info(f"已加载校历：{len(holidays)}个假期，{len(makeup_days)}个调休日")
+        return cls(start, weeks, holidays, makeup_days)
+
+    @staticmethod
+    def _read_ics(path: str) -> Tuple[List[Tuple[date, date, str]], List[Tuple[date, int, str]]]:
+        """
+        读取ICS日历中的全天事件
+        标题含"班"或"补课"的视为调休上课，标题中的"周一"等指定按哪天上课；其余视为放假
+        """
+        holidays = []
+        makeup_days = []
+        with open(path, "r", encoding="utf-8") as f:
+            # 展开折行
+            content = re.sub(r"\r?\n[ \t]", "", f.read())
+        for block in re.findall(r"BEGIN:VEVENT(.*?)END:VEVENT", content, re.S):
+            fields = {}
+            for line in block.strip().splitlines():
+                key, _, value = line.partition(":")
+                fields[key.split(";")[0].upper()] = value.strip()
+            if "DTSTART" not in fields:
+                continue
+            start = _parse_date(fields["DTSTART"][:8])
+            # 全天事件的DTEND不包含在内
+            end = _parse_date(fields["DTEND"][:8]) - timedelta(days=1) if "DTEND" in fields else start
+            summary = fields.get("SUMMARY", "")
+            if "班" in summary or "补课" in summary:
+                weekday = _weekday_of(summary)
+                day = start
+                while day <= max(start, end):
+                    makeup_days.append((day, day.weekday() if weekday is None else weekday, summary))
+                    day += timedelta(days=1)
+            else:
+                holidays.append((start, max(start, end), summary or "放假"))
+        return holidays, makeup_days
@@ -0,0 +1,378 @@
+"""
+消息发送模块
+提醒和每日课程汇总先进入优先队列，按平台和接收者限速发送，同一接收者的多条待发消息按优先级合并为一条，
+已过期（已经上课）的提醒不再发送；不同接收者的消息并发发送，同一接收者一次只发一条；
+群聊中同一次课的提醒可先汇总，合并为一条@相关成员的消息，这类消息单独发送
+"""
+import time
+import heapq
+import asyncio
+import logging
+from dataclasses import dataclass, field
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from .metrics import metrics
+
+# 优先级，数值越小越先发送
+PRIORITY_REMINDER = 0
+PRIORITY_DIGEST = 1
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """
+        令牌桶
+
+        Args:
+            rate: 每秒补充的令牌数
+            burst: 桶容量
+        """
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float) -> float:
+        """距离有可用令牌还需等待的秒数"""
+        self._refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def take(self, now: float):
+        """取走一个令牌"""
+        self._refill(now)
+        self.tokens -= 1
+
+
+@dataclass
+class OutboundMessage:
+    target: str
+    text: str
+    priority: int
+    keys: Tuple[str, ...] = ()  # 发送记录标识，为空时不去重
+    mentions: Tuple[str, ...] = ()  # 需要@的成员
+    expires_at: float = 0.0  # 过期时间（time.monotonic），0表示不过期
+    enqueued_at: float = field(default_factory=time.monotonic)
+
+
+class OutboundQueue:
+    def __init__(self, send: Callable[..., Awaitable[Any]],
+                 platform_rate: float = 20.0, platform_burst: float = 20.0,
+                 target_rate: float = 1.0, target_burst: float = 3.0,
+                 max_merge: int = 5, max_pending: int = 200000, max_retries: int = 3,
+                 max_inflight: int = 64, separator: str = "\n\n", on_sent: Optional[Callable[[List[str]], Any]] = None):
+        """
+        初始化发送队列
+
+        Args:
+            send: 实际发送函数，接收目标和文本（有需要@的成员时再加上成员列表），返回False或抛出异常表示失败
+            platform_rate: 每个平台每秒最多发送的消息数
+            platform_burst: 每个平台允许的突发消息数
+            target_rate: 每个接收者每秒最多发送的消息数
+            target_burst: 每个接收者允许的突发消息数
+            max_merge: 同一接收者最多合并的消息数
+            max_pending: 待发消息上限，超出时丢弃新消息；按十万用户的上课高峰估算
+            max_retries: 发送失败的最大重试次数
+            max_inflight: 同时进行的发送数，每个接收者同一时间最多一条，总速率仍由平台限速控制
+            separator: 合并消息时的分隔符
+            on_sent: 发送成功后的回调，接收这批消息的发送记录标识
+        """
+        self.send = send
+        self.platform_rate = platform_rate
+        self.platform_burst = platform_burst
+        self.target_rate = target_rate
+        self.target_burst = target_burst
+        self.max_merge = max_merge
+        self.max_pending = max_pending
+        self.max_retries = max_retries
+        self.max_inflight = max_inflight
+        self.separator = separator
+        self.on_sent = on_sent
+        self.logger = logging.getLogger("OutboundQueue")
+
+        self.pending: Dict[str, List[Tuple[int, int, OutboundMessage]]] = {}  # 目标 -> (优先级, 序号, 消息)的堆
+        self.pending_count = 0
+        self._ready: List[Tuple[int, int, str]] = []  # (优先级, 序号, 目标)
+        self._delayed: List[Tuple[float, int, int, str]] = []  # (可发送时间, 优先级, 序号, 目标)
+        self._scheduled: Dict[str, Tuple[int, int]] = {}  # 目标 -> 队列中有效条目的(优先级, 序号)
+        self._platform_buckets: Dict[str, TokenBucket] = {}
+        self._target_buckets: Dict[str, TokenBucket] = {}
+        self._retries: Dict[str, int] = {}
+        self._keys: Set[str] = set()  # 待发消息的发送记录标识
+        self._seq = 0
+        self._wakeup = asyncio.Event()
+        self._task = None
+        self._slots = asyncio.Semaphore(max_inflight)
+        self._inflight: Dict[str, asyncio.Task] = {}  # 目标 -> 正在进行的发送
+
+    def start(self):
+        """启动发送任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self, drain_timeout: float = 5.0):
+        """停止发送任务，尽量发完剩余消息"""
+        if self._task is None:
+            return
+        deadline = time.monotonic() + drain_timeout
+        while self.pending_count and time.monotonic() < deadline:
+            await asyncio.sleep(0.1)
+        self._task.cancel()
+        tasks = [self._task, *self._inflight.values()]
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        self._task = None
+
+    def enqueue(self, target: str, text: str, priority: int = PRIORITY_REMINDER,
+                keys: Tuple[str, ...] = (), mentions: Tuple[str, ...] = (), expires_at: float = 0.0) -> bool:
+        """放入发送队列，队列已满或相同标识的消息已在队列中时返回False；到expires_at还没发出的消息丢弃"""
+        if any(key in self._keys for key in keys):
+            return False
+        if expires_at and expires_at <= time.monotonic():
+            metrics.inc("outbound_expired_total")
+            return False
+        if self.pending_count >= self.max_pending:
+            metrics.inc("outbound_dropped_total")
+            return False
+        self._keys.update(keys)
+        self._seq += 1
+        heapq.heappush(self.pending.setdefault(target, []),
+                       (priority, self._seq, OutboundMessage(target, text, priority, tuple(keys), tuple(mentions),
+                                                             expires_at)))
+        self.pending_count += 1
+        metrics.set("outbound_pending", self.pending_count)
+        self._schedule(target, priority)
+        return True
+
+    def is_pending(self, key: str) -> bool:
+        """相同标识的消息是否还在队列中"""
+        return key in self._keys
+
+    def stats(self) -> Dict[str, int]:
+        """获取队列状态"""
+        return {"pending": self.pending_count, "targets": len(self.pending)}
+
+    def _schedule(self, target: str, priority: int, ready_at: float = 0.0):
+        """把目标放入待发队列，已在队列中且优先级不更高时不重复放入"""
+        current = self._scheduled.get(target)
+        if current is not None and current[0] <= priority and not ready_at:
+            return
+        self._seq += 1
+        self._scheduled[target] = (priority, self._seq)
+        if ready_at:
+            heapq.heappush(self._delayed, (ready_at, priority, self._seq, target))
+        else:
+            heapq.heappush(self._ready, (priority, self._seq, target))
+        self._wakeup.set()
+
+    @staticmethod
+    def _platform(target: str) -> str:
+        """从会话标识（平台:消息类型:会话ID）中取出平台名"""
+        return target.split(":", 1)[0] if ":" in target else "default"
+
+    def _bucket(self, buckets: Dict[str, TokenBucket], key: str, rate: float, burst: float) -> TokenBucket:
+        bucket = buckets.get(key)
+        if bucket is None:
+            bucket = buckets[key] = TokenBucket(rate, burst)
+        return bucket
+
+    def _promote_delayed(self, now: float):
+        """把已到时间的延迟目标移回待发队列"""
+        while self._delayed and self._delayed[0][0] <= now:
+            _, priority, seq, target = heapq.heappop(self._delayed)
+            heapq.heappush(self._ready, (priority, seq, target))
+
+    async def _run(self):
+        while True:
+            now = time.monotonic()
+            self._promote_delayed(now)
+            if not self._ready:
+                self._wakeup.clear()
+                timeout = self._delayed[0][0] - now if self._delayed else None
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+
+            priority, seq, target = heapq.heappop(self._ready)
+            if self._scheduled.get(target) != (priority, seq) or not self.pending.get(target):
+                # 已被更高优先级的条目取代或已发送
+                continue
+            if target in self._inflight:
+                # 同一接收者一次只发一条，保证顺序；发送结束后会重新排队
+                del self._scheduled[target]
+                continue
+
+            # 接收者限速：推迟该接收者，不阻塞其他接收者
+            target_bucket = self._bucket(self._target_buckets, target, self.target_rate, self.target_burst)
+            wait = target_bucket.wait_time(now)
+            if wait > 0:
+                del self._scheduled[target]
+                self._schedule(target, priority, now + wait)
+                continue
+
+            # 平台限速：同平台的接收者都会在令牌补充后再发送，其他平台不受影响
+            platform_bucket = self._bucket(self._platform_buckets, self._platform(target),
+                                           self.platform_rate, self.platform_burst)
+            wait = platform_bucket.wait_time(now)
+            if wait > 0:
+                heapq.heappush(self._delayed, (now + wait, priority, seq, target))
+                continue
+
+            if self._slots.locked():
+                # 同时进行的发送数已满，等有空位后重新检查限速
+                heapq.heappush(self._ready, (priority, seq, target))
+                async with self._slots:
+                    pass
+                continue
+            await self._slots.acquire()
+            del self._scheduled[target]
+            target_bucket.take(now)
+            platform_bucket.take(now)
+            self._inflight[target] = asyncio.create_task(self._dispatch(target))
+
+    async def _dispatch(self, target: str):
+        try:
+            await self._send_batch(target)
+        finally:
+            del self._inflight[target]
+            self._slots.release()
+
+    async def _send_batch(self, target: str):
+        """按优先级合并同一接收者的待发消息并发送，@成员的消息单独发送，不与其他消息合并"""
+        queue = self.pending[target]
+        now = time.monotonic()
+        entries = []
+        while queue and len(entries) < self.max_merge:
+            message = queue[0][2]
+            if message.expires_at and message.expires_at <= now:
+                # 已经上课的提醒不再发送
+                heapq.heappop(queue)
+                self.pending_count -= 1
+                self._keys.difference_update(message.keys)
+                metrics.inc("outbound_expired_total")
+                continue
+            if entries and (message.mentions or entries[0][2].mentions):
+                break
+            entries.append(heapq.heappop(queue))
+        if not entries:
+            if not queue:
+                del self.pending[target]
+            metrics.set("outbound_pending", self.pending_count)
+            return
+        batch = [entry[2] for entry in entries]
+        text = self.separator.join(m.text for m in batch)
+        mentions = tuple(dict.fromkeys(user_id for m in batch for user_id in m.mentions))
+
+        start = time.monotonic()
+        try:
+            if mentions:
+                ok = await self.send(target, text, mentions) is not False
+            else:
+                ok = await self.send(target, text) is not False
+        except Exception as e:
+            self.logger.error(f"发送消息失败: {str(e)}")
+            ok = False
+        metrics.observe("outbound_send_seconds", time.monotonic() - start)
+
+        if ok:
+            self._retries.pop(target, None)
+            self.pending_count -= len(batch)
+            keys = [key for m in batch for key in m.keys]
+            self._keys.difference_update(keys)
+            if keys and self.on_sent:
+                try:
+                    self.on_sent(keys)
+                except Exception as e:
+                    self.logger.error(f"记录已发送消息失败: {str(e)}")
+            metrics.inc("outbound_sent_total")
+            if len(batch) > 1:
+                metrics.inc("outbound_merged_total", len(batch) - 1)
+            for message in batch:
+                metrics.observe("outbound_queue_latency_seconds", time.monotonic() - message.enqueued_at)
+        else:
+            retries = self._retries.get(target, 0) + 1
+            if retries > self.max_retries:
+                self._retries.pop(target, None)
+                self.pending_count -= len(batch)
+                self._keys.difference_update(key for m in batch for key in m.keys)
+                metrics.inc("outbound_dropped_total", len(batch))
+            else:
+                # 放回队列，按指数退避重试
+                self._retries[target] = retries
+                metrics.inc("outbound_retries_total")
+                for entry in entries:
+                    heapq.heappush(queue, entry)
+                self._schedule(target, queue[0][0], time.monotonic() + 2 ** retries)
+
+        if queue:
+            if target not in self._scheduled:
+                self._schedule(target, queue[0][0])
+        elif target in self.pending:
+            del self.pending[target]
+        metrics.set("outbound_pending", self.pending_count)
+
+
+class MentionBatcher:
+    def __init__(self, queue: OutboundQueue, window: float = 2.0, max_mentions: int = 30):
+        """
+        群提醒汇总：同一群、同一次课、内容相同的提醒在短时间内合并为一条@相关成员的消息
+
+        Args:
+            queue: 发送队列
+            window: 汇总等待时间（秒）
+            max_mentions: 一条消息最多@的成员数，超出时拆成多条
+        """
+        self.queue = queue
+        self.window = window
+        self.max_mentions = max_mentions
+        # (群会话, 上课标识, 内容) -> (优先级, 过期时间, 成员 -> 发送记录标识)
+        self.buckets: Dict[Tuple[str, str, str], Tuple[int, float, Dict[str, str]]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    def add(self, origin: str, user_id: str, text: str, priority: int, occurrence: str, key: str,
+            expires_at: float = 0.0) -> bool:
+        """加入汇总，相同标识已在等待或发送中时返回False"""
+        if self.queue.is_pending(key):
+            return False
+        _, _, members = self.buckets.setdefault((origin, occurrence, text), (priority, expires_at, {}))
+        if user_id in members:
+            return False
+        members[user_id] = key
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_later())
+        return True
+
+    async def _flush_later(self):
+        try:
+            await asyncio.sleep(self.window)
+        finally:
+            self._task = None
+        self.flush()
+
+    def flush(self) -> int:
+        """把汇总好的提醒放入发送队列，返回消息数"""
+        buckets, self.buckets = self.buckets, {}
+        count = 0
+        for (origin, _, text), (priority, expires_at, members) in buckets.items():
+            user_ids = list(members)
+            for i in range(0, len(user_ids), self.max_mentions):
+                chunk = user_ids[i:i + self.max_mentions]
+                if self.queue.enqueue(origin, text, priority, tuple(members[u] for u in chunk), tuple(chunk),
+                                      expires_at):
+                    count += 1
+                    metrics.inc("outbound_mention_merged_total", len(chunk) - 1)
+        return count
+
+    async def stop(self):
+        """发出还在等待汇总的提醒"""
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self.flush()
@@ -0,0 +1,261 @@
+"""
+提醒分片模块
+按一致性哈希把提醒分组（班级课程表）分配到多个工作进程，同班用户落在同一进程，
+每个进程只保存自己分片的课程表和调度器，到点的提醒交回主进程统一发送。分片归属用文件锁协调，同一分片同时只有一个进程在处理
+"""
+import os
+import time
+import queue
+import asyncio
+import bisect
+import hashlib
+import logging
+import multiprocessing
+from datetime import datetime
+from typing import Dict, List, Optional, Tuple
+
+try:
+    import fcntl
+except ImportError:  # 非Linux平台不支持分片模式
+    fcntl = None
+
+from .reminder import ReminderScheduler, group_key
+
+
+class HashRing:
+    def __init__(self, nodes: List[int], replicas: int = 64):
+        """
+        一致性哈希环
+
+        Args:
+            nodes: 节点列表
+            replicas: 每个节点的虚拟节点数
+        """
+        self.ring: List[Tuple[int, int]] = sorted(
+            (self._hash(f"{node}#{i}"), node) for node in nodes for i in range(replicas)
+        )
+        self._keys = [h for h, _ in self.ring]
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("utf-8")).digest()[:8], "big")
+
+    def get(self, key: str) -> int:
+        """获取键所属的节点"""
+        index = bisect.bisect(self._keys, self._hash(key)) % len(self.ring)
+        return self.ring[index][1]
+
+
+def _acquire_lock(lock_path: str, parent_pid: int):
+    """阻塞直到拿到分片锁，上一个持有者退出后由系统自动释放"""
+    f = open(lock_path, "a+")
+    while True:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            break
+        except OSError:
+            if os.getppid() != parent_pid:
+                f.close()
+                return None
+            time.sleep(0.5)
+    f.seek(0)
+    f.truncate()
+    f.write(str(os.getpid()))
+    f.flush()
+    return f
+
+
+def shard_main(shard_id: int, lock_path: str, config: Dict, inbox, outbox, parent_pid: int):
+    """工作进程入口"""
+    logger = logging.getLogger(f"ReminderShard{shard_id}")
+    lock = _acquire_lock(lock_path, parent_pid)
+    if lock is None:
+        return
+    scheduler = ReminderScheduler(config)
+    outbox.put(("ready", shard_id, os.getpid()))
+    try:
+        while True:
+            try:
+                command = inbox.get(timeout=5)
+            except queue.Empty:
+                # 主进程已退出
+                if os.getppid() != parent_pid:
+                    break
+                continue
+            kind = command[0]
+            try:
+                if kind == "tick":
+                    _, tick_id, now = command
+                    outbox.put(("due", shard_id, tick_id, scheduler.due(now)))
+                elif kind == "set":
+                    scheduler.set_user(command[1], command[2])
+                elif kind == "remove":
+                    scheduler.remove_user(command[1])
+                elif kind == "load":
+                    scheduler.load(command[1])
+                elif kind == "time_slots":
+                    scheduler.set_time_slots(command[1])
+                elif kind == "calendar":
+                    scheduler.set_calendar(command[1])
+                elif kind == "stop":
+                    break
+            except Exception as e:
+                logger.error(f"分片{shard_id}处理{kind}失败: {e}")
+                if kind == "tick":
+                    outbox.put(("due", shard_id, command[1], []))
+    finally:
+        lock.close()
+
+
+class ShardPool:
+    def __init__(self, config: Dict, lock_dir: str, workers: int = 4, tick_timeout: float = 30.0):
+        """
+        初始化分片进程池
+
+        Args:
+            config: 调度器配置，需可序列化
+            lock_dir: 分片锁文件目录
+            workers: 工作进程数
+            tick_timeout: 等待各分片返回到点提醒的最长时间（秒）
+        """
+        if fcntl is None:
+            raise RuntimeError("分片模式需要在Linux上运行")
+        self.config = config
+        self.lock_dir = lock_dir
+        self.workers = workers
+        self.tick_timeout = tick_timeout
+        self.ring = HashRing(list(range(workers)))
+        self.logger = logging.getLogger("ShardPool")
+        os.makedirs(lock_dir, exist_ok=True)
+
+        self._ctx = multiprocessing.get_context("spawn")
+        self.outbox = self._ctx.Queue()
+        self.inboxes: List = [None] * workers
+        self.processes: List[Optional[multiprocessing.Process]] = [None] * workers
+        self.schedules: Dict[str, Dict] = {}
+        self.owners: Dict[str, int] = {}  # 用户 -> 分片
+        self.calendar = None
+        self._tick_id = 0
+
+    def shard_of(self, user_id: str, data: Dict) -> int:
+        """获取用户所属的分片"""
+        return self.ring.get(group_key(user_id, data))
+
+    def start(self):
+        """启动所有工作进程"""
+        for shard_id in range(self.workers):
+            self._spawn(shard_id)
+
+    def _spawn(self, shard_id: int):
+        inbox = self._ctx.Queue()
+        process = self._ctx.Process(
+            target=shard_main,
+            args=(shard_id, os.path.join(self.lock_dir, f"shard-{shard_id}.lock"),
+                  self.config, inbox, self.outbox, os.getpid()),
+            name=f"kcb-shard-{shard_id}",
+            daemon=True
+        )
+        process.start()
+        self.inboxes[shard_id] = inbox
+        self.processes[shard_id] = process
+        inbox.put(("load", self._subset(shard_id)))
+        if self.calendar is not None:
+            inbox.put(("calendar", self.calendar))
+
+    def _subset(self, shard_id: int) -> Dict[str, Dict]:
+        return {uid: data for uid, data in self.schedules.items() if self.owners.get(uid) == shard_id}
+
+    def load(self, schedules: Dict[str, Dict]):
+        """把全部课程表按分片下发"""
+        self.schedules = schedules
+        subsets: List[Dict[str, Dict]] = [{} for _ in range(self.workers)]
+        self.owners = {}
+        for user_id, data in schedules.items():
+            shard_id = self.owners[user_id] = self.shard_of(user_id, data)
+            subsets[shard_id][user_id] = data
+        for shard_id, inbox in enumerate(self.inboxes):
+            if inbox is not None:
+                inbox.put(("load", subsets[shard_id]))
+
+    def set_user(self, user_id: str, data: Dict):
+        """下发一个用户的课程表，所属分片变化时先从原分片移除"""
+        shard_id = self.shard_of(user_id, data)
+        previous = self.owners.get(user_id)
+        if previous is not None and previous != shard_id:
+            self.remove_user(user_id)
+        self.owners[user_id] = shard_id
+        inbox = self.inboxes[shard_id]
+        if inbox is not None:
+            inbox.put(("set", user_id, data))
+
+    def remove_user(self, user_id: str):
+        """从分片中移除用户"""
+        shard_id = self.owners.pop(user_id, None)
+        if shard_id is None:
+            return
+        inbox = self.inboxes[shard_id]
+        if inbox is not None:
+            inbox.put(("remove", user_id))
+
+    def set_time_slots(self, time_slots: Dict[str, str]):
+        """通知所有分片更新作息时间"""
+        self.config = {**self.config, "time_slots": dict(time_slots)}
+        for inbox in self.inboxes:
+            if inbox is not None:
+                inbox.put(("time_slots", dict(time_slots)))
+
+    def set_calendar(self, calendar):
+        """通知所有分片更换校历"""
+        self.calendar = calendar
+        for inbox in self.inboxes:
+            if inbox is not None:
+                inbox.put(("calendar", calendar))
+
+    def _check_workers(self):
+        """重启已退出的工作进程，新进程拿到分片锁后重新加载该分片"""
+        for shard_id, process in enumerate(self.processes):
+            if process is not None and not process.is_alive():
+                self.logger.warning(f"分片{shard_id}进程已退出（{process.exitcode}），正在重启")
+                self._spawn(shard_id)
+
+    async def due(self, now: datetime) -> List[Tuple[str, str, int, str]]:
+        """通知所有分片检查当前分钟，汇总到点的提醒"""
+        self._check_workers()
+        self._tick_id += 1
+        tick_id = self._tick_id
+        for inbox in self.inboxes:
+            inbox.put(("tick", tick_id, now))
+        return await asyncio.to_thread(self._collect, tick_id)
+
+    def _collect(self, tick_id: int) -> List[Tuple[str, str, int, str]]:
+        messages = []
+        waiting = set(range(self.workers))
+        deadline = time.monotonic() + self.tick_timeout
+        while waiting:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                self.logger.error(f"分片{sorted(waiting)}未在{self.tick_timeout}秒内返回")
+                break
+            try:
+                reply = self.outbox.get(timeout=remaining)
+            except queue.Empty:
+                continue
+            if reply[0] == "due" and reply[2] == tick_id:
+                waiting.discard(reply[1])
+                messages.extend(reply[3])
+            elif reply[0] == "ready":
+                self.logger.info(f"分片{reply[1]}由进程{reply[2]}接管")
+        return messages
+
+    async def stop(self, timeout: float = 5.0):
+        """停止所有工作进程"""
+        for inbox in self.inboxes:
+            if inbox is not None:
+                inbox.put(("stop",))
+        for process in self.processes:
+            if process is not None:
+                await asyncio.to_thread(process.join, timeout)
+                if process.is_alive():
+                    process.terminate()
+        self.processes = [None] * self.workers
+        self.inboxes = [None] * self.workers
@@ -0,0 +1,54 @@
+"""
+提醒调度快照
+把调度器的索引连同配置哈希和课程表版本保存到磁盘，重启时版本一致则直接读回，不再逐个用户重建
+"""
+import os
+import pickle
+import logging
+from typing import Dict, Optional, Tuple
+
+SNAPSHOT_VERSION = 1
+
+
+class SchedulerSnapshot:
+    def __init__(self, path: str):
+        """
+        初始化调度快照
+
+        Args:
+            path: 快照文件路径
+        """
+        self.path = path
+        self.logger = logging.getLogger("SchedulerSnapshot")
+
+    @staticmethod
+    def encode(meta: Dict, state: Dict) -> bytes:
+        """序列化快照，需在修改调度器的线程中调用"""
+        return pickle.dumps({"version": SNAPSHOT_VERSION, "meta": meta, "state": state},
+                            protocol=pickle.HIGHEST_PROTOCOL)
+
+    def write(self, data: bytes):
+        """写入快照文件，先写临时文件再替换"""
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
+
+    def load(self) -> Optional[Tuple[Dict, Dict]]:
+        """读取快照，返回(版本信息, 调度器状态)，文件不存在或格式不符时返回None"""
+        if not os.path.exists(self.path):
+            return None
+        try:
+            with open(self.path, "rb") as f:
+                data = pickle.load(f)
+        except Exception as e:
+            self.logger.warning(f"读取调度快照失败: {e}")
+            return None
+        if not isinstance(data, dict) or data.get("version") != SNAPSHOT_VERSION:
+            return None
+        return data["meta"], data["state"]
+
+    def remove(self):
+        """删除快照"""
+        if os.path.exists(self.path):
+            os.remove(self.path)
@@ -0,0 +1,40 @@
+"""
+图片存储测试
+引用计数只在flush时写回，未写回时按图库清单恢复
+"""
+import os
+import sys
+import json
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from blobstore import BlobStore  # noqa: E402
+
+
+def saved_refs(store):
+    if not os.path.exists(store.refs_file):
+        return {}
+    with open(store.refs_file, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+
+def test_writes_are_batched_until_flush(tmp_path):
+    store = BlobStore(str(tmp_path))
+    digests = [store.put_bytes(bytes([i]) * 100)[0] for i in range(50)]
+    store.release_many(digests[:10])
+    assert saved_refs(store) == {}
+    store.flush()
+    refs = saved_refs(store)
+    assert len(refs) == 40 and all(ref["count"] == 1 for ref in refs.values())
+
+
+def test_reconcile_recovers_unsaved_blobs(tmp_path):
+    store = BlobStore(str(tmp_path))
+    saved, _ = store.put_bytes(b"a" * 100)
+    store.flush()
+    unsaved, _ = store.put_bytes(b"b" * 200, ".jpg")
+    # 未写回就退出，重新打开时按清单核对
+    reopened = BlobStore(str(tmp_path))
+    reopened.reconcile({saved: 1, unsaved: 2})
+    assert reopened.refs[unsaved] == {"count": 2, "size": 200, "ext": ".jpg"}
+    assert reopened.path(unsaved) == store.path(unsaved)
+    assert reopened.physical_bytes() == 300
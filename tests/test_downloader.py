@@ -0,0 +1,158 @@
+"""
+下载器测试
+用aiohttp.web在本地起一个HTTP服务代替真实图床
+"""
+import os
+import sys
+import asyncio
+
+import pytest
+from aiohttp import web
+from aiohttp.test_utils import TestServer
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from downloader import Downloader, DownloadError  # noqa: E402
+
+PNG = b"\x89PNG\r\n\x1a\n" + b"\x00" * 2048
+
+
+def run(handlers, test, **kwargs):
+    """启动本地服务，用新建的下载器执行test(downloader, url)"""
+    async def main(tmp_dir):
+        app = web.Application()
+        for path, handler in handlers.items():
+            app.router.add_get(path, handler)
+        server = TestServer(app)
+        await server.start_server()
+        downloader = Downloader(tmp_dir, **kwargs)
+        try:
+            return await test(downloader, lambda path: str(server.make_url(path)))
+        finally:
+            await downloader.close()
+            await server.close()
+    return main
+
+
+def leftovers(tmp_dir):
+    return [name for name in os.listdir(tmp_dir) if name.endswith(".part")]
+
+
+async def image(request):
+    return web.Response(body=PNG, content_type="image/png")
+
+
+async def streamed(request):
+    """不带Content-Length，分块发送"""
+    resp = web.StreamResponse(headers={"Content-Type": "image/png"})
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+    for _ in range(16):
+        await resp.write(b"\x00" * 1024)
+    await resp.write_eof()
+    return resp
+
+
+async def stalled(request):
+    """先发一部分数据，然后卡住"""
+    resp = web.StreamResponse(headers={"Content-Type": "image/png"})
+    resp.enable_chunked_encoding()
+    await resp.prepare(request)
+    await resp.write(b"\x00" * 1024)
+    await asyncio.sleep(5)
+    return resp
+
+
+def test_fetch_streams_to_temp_file(tmp_path):
+    async def test(downloader, url):
+        path = await downloader.fetch(url("/image"))
+        with open(path, "rb") as f:
+            assert f.read() == PNG
+        assert os.path.dirname(path) == str(tmp_path)
+    asyncio.run(run({"/image": image}, test)(str(tmp_path)))
+
+
+def test_size_cap_from_content_length(tmp_path):
+    async def test(downloader, url):
+        with pytest.raises(DownloadError, match="过大"):
+            await downloader.fetch(url("/image"))
+    asyncio.run(run({"/image": image}, test, max_bytes=1024)(str(tmp_path)))
+    assert leftovers(tmp_path) == []
+
+
+def test_size_cap_while_streaming(tmp_path):
+    async def test(downloader, url):
+        with pytest.raises(DownloadError, match="过大"):
+            await downloader.fetch(url("/streamed"))
+    asyncio.run(run({"/streamed": streamed}, test, max_bytes=4096, chunk_size=1024)(str(tmp_path)))
+    assert leftovers(tmp_path) == []
+
+
+def test_content_type_rejected(tmp_path):
+    async def html(request):
+        return web.Response(text="<html></html>", content_type="text/html")
+
+    async def test(downloader, url):
+        with pytest.raises(DownloadError, match="类型"):
+            await downloader.fetch(url("/page"))
+    asyncio.run(run({"/page": html}, test)(str(tmp_path)))
+    assert leftovers(tmp_path) == []
+
+
+def test_bad_status(tmp_path):
+    async def missing(request):
+        raise web.HTTPNotFound()
+
+    async def test(downloader, url):
+        with pytest.raises(DownloadError, match="404"):
+            await downloader.fetch(url("/missing"))
+    asyncio.run(run({"/missing": missing}, test)(str(tmp_path)))
+
+
+def test_timeout_removes_partial_file(tmp_path):
+    async def test(downloader, url):
+        with pytest.raises(asyncio.TimeoutError):
+            await downloader.fetch(url("/stalled"))
+    asyncio.run(run({"/stalled": stalled}, test, timeout=0.5)(str(tmp_path)))
+    assert leftovers(tmp_path) == []
+
+
+def test_concurrency_cap(tmp_path):
+    state = {"active": 0, "peak": 0}
+
+    async def slow(request):
+        state["active"] += 1
+        state["peak"] = max(state["peak"], state["active"])
+        try:
+            await asyncio.sleep(0.1)
+            return web.Response(body=PNG, content_type="image/png")
+        finally:
+            state["active"] -= 1
+
+    async def test(downloader, url):
+        paths = await asyncio.gather(*(downloader.fetch(url("/slow")) for _ in range(8)))
+        assert len(set(paths)) == 8
+    asyncio.run(run({"/slow": slow}, test, max_concurrency=2)(str(tmp_path)))
+    assert state["peak"] == 2
+
+
+def test_non_http_rejected(tmp_path):
+    async def test(downloader, url):
+        with pytest.raises(DownloadError):
+            await downloader.fetch("file:///etc/passwd")
+    asyncio.run(run({}, test)(str(tmp_path)))
+
+
+def test_copy_local(tmp_path):
+    source = tmp_path / "source.png"
+    source.write_bytes(PNG)
+    tmp_dir = tmp_path / "tmp"
+    downloader = Downloader(str(tmp_dir), max_bytes=len(PNG))
+    path = downloader.copy_local(str(source))
+    assert open(path, "rb").read() == PNG
+    assert source.exists()
+    os.remove(path)
+
+    downloader.max_bytes = 100
+    with pytest.raises(DownloadError, match="过大"):
+        downloader.copy_local(str(source))
+    assert leftovers(tmp_dir) == []
@@ -0,0 +1,64 @@
+"""
+占用索引测试
+按日期查询时应用当天的停课和调教室
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import stubs  # noqa: E402
+
+stubs.install()
+from teheikcb.occupancy import OccupancyIndex  # noqa: E402
+from teheikcb.reminder import course_signature  # noqa: E402
+from teheikcb.timetable import PeriodTable  # noqa: E402
+
+MONDAY = "2025-03-03"
+COURSE = {"day": "星期一", "time": "第1-2节", "name": "高等数学", "teacher": "张老师",
+          "location": "A101", "weeks": "1-16周"}
+
+
+def make_index(changes=None):
+    """两个同班用户，第一个用户周一有临时变动"""
+    schedules = {}
+    for user_id in ("1", "2"):
+        schedules[user_id] = {"class_id": "c1", "courses": [dict(COURSE)], "overrides": []}
+    if changes:
+        schedules["1"]["exceptions"] = {MONDAY: {course_signature(COURSE): changes}}
+    index = OccupancyIndex()
+    index.load(schedules)
+    return index
+
+
+def query(index, location, date=MONDAY):
+    return [(slot.location, count) for slot, count in index.query("location", location, PeriodTable(), 0, 1, None, date)]
+
+
+def test_cancelled_class_frees_room():
+    index = make_index({"cancel": True})
+    assert query(index, "A101") == [("A101", 1)]
+    # 按星期查询不受某天的停课影响
+    assert query(index, "A101", None) == [("A101", 2)]
+
+
+def test_cancelled_for_everyone_is_not_listed():
+    index = make_index()
+    index.set_user("1", {"class_id": "c1", "courses": [dict(COURSE)], "overrides": [],
+                         "exceptions": {MONDAY: {course_signature(COURSE): {"cancel": True}}}})
+    index.set_user("2", {"class_id": "c1", "courses": [dict(COURSE)], "overrides": [],
+                         "exceptions": {MONDAY: {course_signature(COURSE): {"cancel": True}}}})
+    assert query(index, "A101") == []
+
+
+def test_room_change_moves_user():
+    index = make_index({"location": "B202"})
+    assert query(index, "A101") == [("A101", 1)]
+    assert query(index, "B202") == [("B202", 1)]
+    assert query(index, "B202", "2025-03-10") == []
+
+
+def test_removed_user_drops_exceptions():
+    index = make_index({"location": "B202"})
+    index.remove_user("1")
+    assert query(index, "B202") == []
+    assert query(index, "A101") == [("A101", 1)]
@@ -0,0 +1,93 @@
+"""
+提醒检查测试
+补查漏掉的分钟时，提醒的有效期按当前时间计算，已经上课的提醒不再放入发送队列
+"""
+import os
+import sys
+import time
+import asyncio
+from datetime import datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.join(ROOT, "benchmarks"))
+import stubs  # noqa: E402
+from run_benchmarks import default_config  # noqa: E402
+
+MONDAY = datetime(2025, 3, 3)
+
+
+def make_plugin():
+    main = stubs.install()
+    clock_module = sys.modules[f"{stubs.PLUGIN_PACKAGE}.clock"]
+    config = default_config()
+    config["snapshot_config"]["enable"] = False
+    config["calendar_config"]["semester_start"] = MONDAY.date().isoformat()
+    clock = clock_module.VirtualClock(MONDAY)
+
+    async def create():
+        existing = asyncio.all_tasks()
+        plugin = main.CourseReminderPlugin(stubs.Context(), config, clock=clock)
+        for task in asyncio.all_tasks() - existing:
+            task.cancel()
+        await asyncio.sleep(0)
+        return plugin
+    return create, clock
+
+
+def add_user(plugin):
+    plugin._restore_schedules({"100000": {
+        "courses": [{"day": "星期一", "time": "第1-2节", "name": "高等数学", "teacher": "张老师",
+                     "location": "A101", "weeks": "1-16周"}],
+        "settings": {"enable_reminder": True, "reminder_time": 10, "enable_daily_reminder": False},
+        "basic_info": {}
+    }})
+    plugin.scheduler.load(plugin.schedules)
+
+
+def reminder_minute(plugin):
+    """周一第一条课前提醒的检查时间和上课时间"""
+    from teheikcb.reminder import class_start
+    minute = MONDAY
+    while minute < MONDAY + timedelta(days=1):
+        for _, _, _, occurrence in plugin.scheduler.due(minute):
+            start = class_start(occurrence)
+            if start:
+                return minute, start
+        minute += timedelta(minutes=1)
+    raise AssertionError("没有找到课前提醒")
+
+
+def replay(now_offset: timedelta):
+    """上次检查在提醒前，当前时间为上课时间加now_offset，返回补查后队列中的消息"""
+    async def main():
+        create, clock = make_plugin()
+        plugin = await create()
+        try:
+            add_user(plugin)
+            fire, start = reminder_minute(plugin)
+            clock.current = start + now_offset
+            plugin.ledger.last_tick = fire - timedelta(minutes=1)
+            minute = clock.current.replace(second=0, microsecond=0)
+            missed = plugin._missed_minutes(minute)
+            assert fire in missed
+            for tick in missed:
+                await plugin.reminder_tick(tick)
+            return [entry[2] for queue in plugin.sender.pending.values() for entry in queue]
+        finally:
+            await plugin.sender.stop(drain_timeout=0)
+            await plugin.terminate()
+    return asyncio.run(main())
+
+
+def test_replayed_reminder_after_class_start_is_dropped(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    assert replay(timedelta(seconds=30)) == []
+
+
+def test_replayed_reminder_expires_at_class_start(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    before = time.monotonic()
+    messages = replay(timedelta(seconds=-20))
+    assert len(messages) == 1
+    # 有效期只剩到上课的20秒，而不是从提醒时间算起的10分钟
+    assert before < messages[0].expires_at <= time.monotonic() + 20
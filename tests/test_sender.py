@@ -0,0 +1,92 @@
+"""
+发送队列测试
+不同接收者并发发送，同一接收者按顺序一次只发一条
+"""
+import os
+import sys
+import time
+import asyncio
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "benchmarks"))
+import stubs  # noqa: E402
+
+stubs.install()
+from teheikcb.sender import OutboundQueue, PRIORITY_DIGEST, PRIORITY_REMINDER  # noqa: E402
+
+
+class SlowSend:
+    """每次发送耗时latency秒，记录发送顺序和同一接收者的并发数"""
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.sent = []
+        self.active = {}
+        self.overlapped = False
+        self.peak = 0
+
+    async def __call__(self, target, text, mentions=()):
+        self.active[target] = self.active.get(target, 0) + 1
+        self.overlapped |= self.active[target] > 1
+        self.peak = max(self.peak, sum(self.active.values()))
+        await asyncio.sleep(self.latency)
+        self.active[target] -= 1
+        self.sent.append((target, text))
+        return True
+
+
+async def drain(queue, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while queue.pending_count and time.monotonic() < deadline:
+        await asyncio.sleep(0.01)
+    await queue.stop(drain_timeout=0)
+
+
+def test_targets_are_sent_concurrently():
+    async def main():
+        send = SlowSend(0.2)
+        queue = OutboundQueue(send, platform_rate=1000, platform_burst=1000, max_inflight=50)
+        queue.start()
+        for i in range(50):
+            queue.enqueue(f"stub:FriendMessage:{i}", "提醒")
+        start = time.monotonic()
+        await drain(queue)
+        return send, time.monotonic() - start
+    send, elapsed = asyncio.run(main())
+    assert len(send.sent) == 50
+    # 逐条发送需要10秒
+    assert elapsed < 2
+    assert send.peak > 1
+
+
+def test_inflight_is_bounded():
+    async def main():
+        send = SlowSend(0.05)
+        queue = OutboundQueue(send, platform_rate=1000, platform_burst=1000, max_inflight=4)
+        queue.start()
+        for i in range(20):
+            queue.enqueue(f"stub:FriendMessage:{i}", "提醒")
+        await drain(queue)
+        return send
+    send = asyncio.run(main())
+    assert len(send.sent) == 20
+    assert send.peak <= 4
+
+
+def test_one_send_per_target_in_order():
+    async def main():
+        send = SlowSend(0.05)
+        queue = OutboundQueue(send, platform_rate=1000, platform_burst=1000,
+                              target_rate=1000, target_burst=1000, max_merge=1)
+        queue.start()
+        target = "stub:FriendMessage:1"
+        queue.enqueue(target, "汇总", PRIORITY_DIGEST)
+        queue.enqueue(target, "提醒1", PRIORITY_REMINDER)
+        queue.enqueue(target, "提醒2", PRIORITY_REMINDER)
+        await asyncio.sleep(0.01)
+        # 发送中新到的提醒排在汇总前面
+        queue.enqueue(target, "提醒3", PRIORITY_REMINDER)
+        await drain(queue)
+        return send
+    send = asyncio.run(main())
+    assert [text for _, text in send.sent] == ["提醒1", "提醒2", "提醒3", "汇总"]
+    assert not send.overlapped
@@ -0,0 +1,168 @@
+"""
+图片衍生缓存模块
+按源图哈希和尺寸缓存发送用的缩放图，首次查看时生成，超出磁盘预算时按LRU淘汰；
+存储中的图片直接使用存储的内容哈希，其他文件才读取文件计算哈希
+"""
+import os
+import io
+import json
+import time
+import shutil
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from PIL import Image
+
+
+def file_digest(path: str) -> str:
+    """计算文件的sha256，与图片存储的哈希一致"""
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class DerivativeCache:
+    def __init__(self, cache_dir: str, max_bytes: int = 256 * 1024 * 1024):
+        """
+        初始化衍生图缓存
+
+        Args:
+            cache_dir: 缓存目录
+            max_bytes: 磁盘预算（字节），超出后淘汰最久未使用的缓存
+        """
+        self.cache_dir = cache_dir
+        self.max_bytes = max_bytes
+        self.index_file = os.path.join(cache_dir, "index.json")
+        # key -> {"source": 源图哈希, "file": 缓存文件名（None表示直接发送原图）, "bytes": 大小, "atime": 最近使用}
+        self.entries: "OrderedDict[str, Dict]" = OrderedDict()
+        self.total_bytes = 0
+        # 不在图片存储中的源图：路径 -> (mtime_ns, size, digest)，避免每次查看都重新计算哈希
+        self._digests: Dict[str, Tuple[int, int, str]] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+        self._load_index()
+
+    def _load_index(self):
+        """加载缓存索引"""
+        if not os.path.exists(self.index_file):
+            return
+        try:
+            with open(self.index_file, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except Exception:
+            entries = {}
+        for key, entry in sorted(entries.items(), key=lambda kv: kv[1].get("atime", 0)):
+            if entry.get("file") and not os.path.exists(os.path.join(self.cache_dir, entry["file"])):
+                continue
+            self.entries[key] = entry
+            self.total_bytes += entry.get("bytes", 0)
+
+    def _save_index(self):
+        """保存缓存索引（命中时只更新内存中的顺序，生成和淘汰时才落盘）"""
+        tmp_file = self.index_file + ".tmp"
+        with open(tmp_file, "w", encoding="utf-8") as f:
+            json.dump(self.entries, f)
+        os.replace(tmp_file, self.index_file)
+
+    def digest(self, source_path: str) -> str:
+        """获取源图哈希"""
+        st = os.stat(source_path)
+        cached = self._digests.get(source_path)
+        if cached and cached[0] == st.st_mtime_ns and cached[1] == st.st_size:
+            return cached[2]
+        digest = file_digest(source_path)
+        self._digests[source_path] = (st.st_mtime_ns, st.st_size, digest)
+        return digest
+
+    def get(self, source_path: str, size: int, digest: Optional[str] = None) -> str:
+        """获取适合发送的图片路径，缓存未命中时生成；digest为已知的源图哈希，为空时读取文件计算"""
+        digest = digest or self.digest(source_path)
+        key = f"{digest}_{size}"
+        with self._lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+                entry["atime"] = time.time()
+                if entry["file"] is None:
+                    return source_path
+                return os.path.join(self.cache_dir, entry["file"])
+
+        data, ext = self._render(source_path, size)
+        with self._lock:
+            if data is None or len(data) >= os.path.getsize(source_path):
+                # 缩放后没有变小，直接发送原图
+                entry = {"source": digest, "file": None, "bytes": 0, "atime": time.time()}
+            else:
+                filename = f"{key}.{ext}"
+                with open(os.path.join(self.cache_dir, filename), "wb") as f:
+                    f.write(data)
+                entry = {"source": digest, "file": filename, "bytes": len(data), "atime": time.time()}
+            self.entries[key] = entry
+            self.total_bytes += entry["bytes"]
+            self._evict()
+            self._save_index()
+            if key not in self.entries or entry["file"] is None:
+                return source_path
+            return os.path.join(self.cache_dir, entry["file"])
+
+    def invalidate(self, source_path: str, digest: Optional[str] = None):
+        """图片删除前调用，清除该图的所有衍生图"""
+        if digest is None:
+            try:
+                digest = self.digest(source_path)
+            except OSError:
+                return
+        self._digests.pop(source_path, None)
+        with self._lock:
+            keys = [k for k, e in self.entries.items() if e["source"] == digest]
+            for key in keys:
+                self._remove(key)
+            if keys:
+                self._save_index()
+
+    def clear(self):
+        """清空缓存"""
+        with self._lock:
+            self.entries.clear()
+            self.total_bytes = 0
+            self._digests.clear()
+            shutil.rmtree(self.cache_dir, ignore_errors=True)
+            os.makedirs(self.cache_dir, exist_ok=True)
+
+    def _remove(self, key: str):
+        entry = self.entries.pop(key)
+        self.total_bytes -= entry["bytes"]
+        if entry["file"]:
+            try:
+                os.remove(os.path.join(self.cache_dir, entry["file"]))
+            except FileNotFoundError:
+                pass
+
+    def _evict(self):
+        """超出预算时淘汰最久未使用的缓存"""
+        while self.total_bytes > self.max_bytes and self.entries:
+            self._remove(next(iter(self.entries)))
+
+    def _render(self, source_path: str, size: int) -> Tuple[Optional[bytes], str]:
+        """生成缩放图，无透明通道的图片转为JPEG"""
+        try:
+            img = Image.open(source_path)
+            img.load()
+        except Exception:
+            return None, ""
+        if getattr(img, "is_animated", False):
+            # 动图不做处理
+            return None, ""
+        if max(img.size) > size:
+            ratio = size / max(img.size)
+            new_size = tuple(max(1, int(dim * ratio)) for dim in img.size)
+            img = img.resize(new_size, Image.Resampling.LANCZOS)
+        output = io.BytesIO()
+        if img.mode in ("RGBA", "LA", "P"):
+            img.save(output, format="PNG", optimize=True)
+            return output.getvalue(), "png"
+        img.convert("RGB").save(output, format="JPEG", quality=85, optimize=True)
+        return output.getvalue(), "jpg"
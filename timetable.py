@@ -0,0 +1,107 @@
+"""
+作息时间表模块
+把time_slots配置编译成节次到上课、下课分钟的查找表，供解析、显示和提醒调度共用
+"""
+import re
+from typing import Dict, Optional, Set, Tuple
+
+# 与配置默认值一致
+DEFAULT_TIME_SLOTS = {
+    "1-2": "08:00-09:40",
+    "3-4": "10:00-11:40",
+    "5-6": "14:00-15:40",
+    "7-8": "16:00-17:40",
+    "9-10": "19:00-20:40"
+}
+
+PERIOD_PATTERN = re.compile(r"第\s*(\d+)\s*(?:[-~～至]\s*(\d+)\s*)?节")
+CLOCK_RANGE_PATTERN = re.compile(r"^\s*(\d{1,2})[:：](\d{2})\s*[-~～至]\s*(\d{1,2})[:：](\d{2})\s*$")
+
+
+def _minutes_to_clock(minutes: int) -> str:
+    return f"{minutes // 60:02d}:{minutes % 60:02d}"
+
+
+class PeriodTable:
+    def __init__(self, time_slots: Optional[Dict[str, str]] = None):
+        """
+        编译作息时间表
+
+        Args:
+            time_slots: 节次 -> "HH:MM-HH:MM"，如{"1-2": "08:00-09:40"}，为空时使用默认作息
+        """
+        self.source: Dict[str, str] = dict(time_slots if time_slots is not None else DEFAULT_TIME_SLOTS)
+        self.periods: Dict[str, Tuple[int, int]] = {}  # 节次 -> (上课分钟, 下课分钟)
+        for period, value in self.source.items():
+            key = self._period_key(str(period))
+            match = CLOCK_RANGE_PATTERN.match(str(value))
+            if key is None or not match:
+                continue
+            h1, m1, h2, m2 = map(int, match.groups())
+            self.periods[key] = (h1 * 60 + m1, h2 * 60 + m2)
+        self.texts = {key: f"{_minutes_to_clock(start)}-{_minutes_to_clock(end)}"
+                      for key, (start, end) in self.periods.items()}
+        self._lookup: Dict[str, Optional[str]] = {}  # 课程时间文本 -> 节次
+
+    @staticmethod
+    def _period_key(text: str) -> Optional[str]:
+        """把"1-2"、"1~2"、"3"等写法统一为节次键"""
+        match = re.match(r"^\s*(\d+)\s*(?:[-~～至]\s*(\d+))?\s*$", text)
+        if not match:
+            return None
+        return f"{int(match.group(1))}-{int(match.group(2))}" if match.group(2) else str(int(match.group(1)))
+
+    def period_of(self, time_str: str) -> Optional[str]:
+        """从"第1-2节"这类文本中取出节次键，结果会缓存"""
+        if time_str in self._lookup:
+            return self._lookup[time_str]
+        key = None
+        match = PERIOD_PATTERN.search(time_str or "")
+        if match:
+            start, end = match.groups()
+            key = f"{int(start)}-{int(end)}" if end else str(int(start))
+            if key not in self.periods:
+                key = None
+        self._lookup[time_str] = key
+        return key
+
+    def minutes(self, time_str: str) -> Optional[Tuple[int, int]]:
+        """课程时间对应的上课、下课分钟，也接受"08:00-09:40"形式"""
+        key = self.period_of(time_str)
+        if key is not None:
+            return self.periods[key]
+        match = CLOCK_RANGE_PATTERN.match(time_str or "")
+        if match:
+            h1, m1, h2, m2 = map(int, match.groups())
+            return h1 * 60 + m1, h2 * 60 + m2
+        return None
+
+    def start_minute(self, time_str: str) -> Optional[int]:
+        """课程的上课分钟"""
+        span = self.minutes(time_str)
+        return span[0] if span else None
+
+    def clock_range(self, time_str: str) -> Optional[Tuple[str, str]]:
+        """课程的上课、下课时间（HH:MM）"""
+        key = self.period_of(time_str)
+        if key is None:
+            return None
+        start, end = self.periods[key]
+        return _minutes_to_clock(start), _minutes_to_clock(end)
+
+    def format(self, time_str: str) -> str:
+        """节次后附上具体时间，如"第1-2节（08:00-09:40）" """
+        key = self.period_of(time_str)
+        if key is None:
+            return time_str
+        return f"{time_str}（{self.texts[key]}）"
+
+    def standardize(self, time_str: str) -> str:
+        """把节次转换为具体时间，无法识别时原样返回"""
+        key = self.period_of(time_str)
+        return self.texts[key] if key is not None else time_str
+
+    def changed_periods(self, other: "PeriodTable") -> Set[str]:
+        """与另一张作息表相比时间不同的节次"""
+        return {key for key in set(self.periods) | set(other.periods)
+                if self.periods.get(key) != other.periods.get(key)}